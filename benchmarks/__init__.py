@@ -0,0 +1,8 @@
+import os
+import sys
+
+# lambda_function.py lives at the top of the repository and is not part of
+# the installed package, so make the checkout importable for every benchmark.
+_project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_dir not in sys.path:
+    sys.path.insert(0, _project_dir)
@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from hourly_price_prediction.data.results_cache import ResultsCache
+from hourly_price_prediction.models.performance_analyzer import \
+    PerformanceAnalyzer
+from hourly_price_prediction.models.run_ranking import (load_run_histories,
+                                                        rank_runs)
+from hourly_price_prediction.monitoring.drift import ResidualDriftMonitor
+from hourly_price_prediction.monitoring.risk_metrics import (
+    StreamingRiskMetrics, risk_metrics, risk_metrics_matrix)
+from hourly_price_prediction.visualization.results_loader import \
+    load_model_results
+
+from .fixtures import write_many_training_results, write_training_results
+
+
+class PerformanceAnalyzerBenchmarks:
+    params = [1000, 10000]
+    param_names = ["hours"]
+    timeout = 600
+
+    def setup(self, hours):
+        self.directory = tempfile.mkdtemp()
+        self.paths = write_training_results(self.directory, hours)
+        self.analyzer = PerformanceAnalyzer(*self.paths)
+
+    def teardown(self, hours):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_load(self, hours):
+        PerformanceAnalyzer(*self.paths)
+
+    def time_error_properties(self, hours):
+        for split in ["train", "val", "test"]:
+            getattr(self.analyzer, f"{split}_mean_absolute_error")
+            getattr(self.analyzer, f"{split}_mean_squared_error")
+            getattr(self.analyzer, f"{split}_root_mean_squared_error")
+            getattr(self.analyzer, f"{split}_r2")
+
+    def time_trading_properties(self, hours):
+        self.analyzer.total_buys
+        self.analyzer.total_sells
+        self.analyzer.total_do_nothing
+        self.analyzer.asset_max
+        self.analyzer.asset_min
+
+    def time_annualized_std(self, hours):
+        self.analyzer.annualized_std()
+
+
+class RiskMetrics:
+    params = [1000, 10000]
+    param_names = ["hours"]
+    timeout = 600
+
+    def setup(self, hours):
+        self.directory = tempfile.mkdtemp()
+        self.analyzer = PerformanceAnalyzer(*write_training_results(self.directory, hours))
+        self.records = self.analyzer.trading_history.to_dict("records")
+        self.streaming = StreamingRiskMetrics()
+        self.streaming.update_many(self.records[:-1])
+
+    def teardown(self, hours):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_batch(self, hours):
+        risk_metrics(self.analyzer.trading_history)
+
+    def time_update_one_record(self, hours):
+        state = dict(self.streaming.state)
+        self.streaming.update(self.records[-1])
+        self.streaming.state = state
+
+    def track_batch_mismatches(self, hours):
+        # Metrics where the streaming values differ from the batch ones;
+        # anything but 0 is a bug.
+        streaming = StreamingRiskMetrics().update_many(self.records)
+        batch = risk_metrics(self.analyzer.trading_history)
+        return sum(streaming[name] != batch[name] for name in batch)
+
+
+class ResidualDrift:
+    params = [1000, 10000]
+    param_names = ["hours"]
+    timeout = 600
+
+    def setup(self, hours):
+        closes = 2000 + np.cumsum(np.random.default_rng(43).normal(0, 10, hours))
+        self.records = [
+            {"timestamp": 3600 * hour, "close": close, "model_prediction": close + 1.0}
+            for hour, close in enumerate(closes)
+        ]
+        self.monitor = ResidualDriftMonitor()
+        self.monitor.set_model("model", {"mae": 8.0, "rmse": 10.0})
+        for record in self.records[:-1]:
+            self.monitor.update(record)
+
+    def time_update_one_record(self, hours):
+        state = dict(self.monitor.state, residuals=list(self.monitor.state["residuals"]))
+        self.monitor.update(self.records[-1])
+        self.monitor.drift_reasons()
+        self.monitor.state = state
+
+    def time_replay_history(self, hours):
+        monitor = ResidualDriftMonitor()
+        monitor.set_model("model", {"mae": 8.0, "rmse": 10.0})
+        for record in self.records:
+            monitor.update(record)
+
+
+class RankRuns:
+    params = [100, 500]
+    param_names = ["runs"]
+    timeout = 600
+
+    def setup(self, runs):
+        self.directory = tempfile.mkdtemp()
+        run_directories = write_many_training_results(self.directory, runs)
+        self.total_assets, self.trades = load_run_histories(run_directories)
+
+    def teardown(self, runs):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_rank_runs(self, runs):
+        rank_runs(self.directory)
+
+    def time_risk_metrics_matrix(self, runs):
+        risk_metrics_matrix(self.total_assets, self.trades)
+
+
+class ResultsCacheStartup:
+    """
+    What a dashboard worker does at startup: parse every run's CSV files
+    itself, or map the tables a loader process already wrote.
+    """
+
+    params = [100, 500]
+    param_names = ["runs"]
+    timeout = 600
+
+    def setup(self, runs):
+        self.directory = tempfile.mkdtemp()
+        self.results_directory = os.path.join(self.directory, "model_results")
+        self.run_directories = write_many_training_results(self.results_directory, runs)
+        self.cache_directory = os.path.join(self.directory, "results_cache")
+        load_model_results(ResultsCache(self.cache_directory), self.results_directory)
+
+    def teardown(self, runs):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_read_csv_files(self, runs):
+        for run_directory in self.run_directories:
+            pd.read_csv(os.path.join(run_directory, "model_metrics.csv"))
+            pd.read_csv(os.path.join(run_directory, "trading_history.csv"))
+        rank_runs(self.results_directory)
+
+    def time_map_cached_tables(self, runs):
+        results_cache = ResultsCache(self.cache_directory)
+        for name in ["runs", "model_metrics", "trading_history", "run_ranking"]:
+            results_cache.read_table(name)
+
+    def time_load_model_results(self, runs):
+        load_model_results(ResultsCache(self.cache_directory), self.results_directory)
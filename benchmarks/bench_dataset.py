@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+from hourly_price_prediction.data.make_dataset import (
+    process_raw_data, process_raw_data_chunked)
+
+from .fixtures import SIZES, make_candles, write_raw_csv
+
+
+class ProcessRawData:
+    params = SIZES
+    param_names = ["hours"]
+
+    def setup(self, hours):
+        self.directory = tempfile.mkdtemp()
+        self.raw_data_filepath = write_raw_csv(
+            make_candles(hours), os.path.join(self.directory, "raw_data.csv")
+        )
+        self.processed_data_filepath = os.path.join(
+            self.directory, "processed_data.csv"
+        )
+
+    def teardown(self, hours):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_process_raw_data(self, hours):
+        process_raw_data(self.raw_data_filepath, self.processed_data_filepath)
+
+    def peakmem_process_raw_data(self, hours):
+        process_raw_data(self.raw_data_filepath, self.processed_data_filepath)
+
+    def time_process_raw_data_chunked(self, hours):
+        process_raw_data_chunked(
+            self.raw_data_filepath, self.processed_data_filepath, chunksize=10000
+        )
+
+    def peakmem_process_raw_data_chunked(self, hours):
+        process_raw_data_chunked(
+            self.raw_data_filepath, self.processed_data_filepath, chunksize=10000
+        )
@@ -0,0 +1,41 @@
+from hourly_price_prediction.features.indicators import FeatureSet
+
+from .fixtures import SIZES, make_candles
+
+FEATURE_SPECS = [
+    {"kind": "ema", "span": 12},
+    {"kind": "ema", "span": 26},
+    {"kind": "rsi", "period": 14},
+    {"kind": "volatility", "window": 24},
+    {"kind": "return", "lag": 1},
+    {"kind": "return", "lag": 24},
+]
+
+
+class FeatureSetBatch:
+    params = SIZES
+    param_names = ["hours"]
+
+    def setup(self, hours):
+        self.candles = make_candles(hours)
+        self.feature_set = FeatureSet.from_specs(FEATURE_SPECS)
+
+    def time_batch(self, hours):
+        self.feature_set.batch(self.candles)
+
+    def track_incremental_mismatches(self, hours):
+        # Number of values where the trader's incremental features differ
+        # from the training ones; anything but 0 is a bug.
+        return sum(self.feature_set.check_consistency(self.candles).values())
+
+
+class FeatureSetUpdate:
+    def setup(self):
+        self.feature_set = FeatureSet.from_specs(FEATURE_SPECS)
+        self.candles = make_candles(500).to_dict("records")
+        self.state = self.feature_set.initial_state()
+        for candle in self.candles[:-1]:
+            self.feature_set.update(self.state, candle)
+
+    def time_update_one_candle(self):
+        self.feature_set.update(self.state, self.candles[-1])
@@ -0,0 +1,22 @@
+from sklearn.linear_model import LinearRegression
+
+from hourly_price_prediction.models.utils import strategy_simulation
+
+from .fixtures import SIZES, make_processed_dataset
+
+
+class StrategySimulation:
+    params = SIZES
+    param_names = ["hours"]
+    timeout = 600
+
+    def setup(self, hours):
+        dataset = make_processed_dataset(hours)
+        self.features = dataset.drop("nextclose", axis=1)
+        self.model = LinearRegression().fit(self.features, dataset["nextclose"])
+
+    def time_strategy_simulation(self, hours):
+        strategy_simulation(self.model, self.features, {"mae": 1.0})
+
+    def peakmem_strategy_simulation(self, hours):
+        strategy_simulation(self.model, self.features, {"mae": 1.0})
@@ -0,0 +1,55 @@
+import contextlib
+import importlib
+import io
+import shutil
+import sys
+import tempfile
+
+from hourly_price_prediction.models.asset_trader import AssetTrader
+from hourly_price_prediction.simulation.exchange import SimulatedExchange
+
+from .fixtures import PROJECT_DIR, make_candles, write_model_artifacts
+
+
+class AssetTraderPredict:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        model_artifact, _ = write_model_artifacts(self.directory)
+        exchange = SimulatedExchange(make_candles(48))
+        self.asset_trader = AssetTrader(
+            asset="ETH-USD",
+            api_secret="",
+            api_key="",
+            passphrase="",
+            pickle_file=model_artifact,
+            public_client=exchange,
+            private_client=exchange,
+        )
+
+    def teardown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_predict_single_row(self):
+        self.asset_trader.predict(2000.0, 2010.0, 1990.0, 2005.0, 1500.0)
+
+
+class LambdaHandlerImport:
+    timeout = 120
+
+    def timeraw_cold_import(self):
+        return f"""
+        import contextlib
+        import io
+        import sys
+        sys.path.insert(0, {PROJECT_DIR!r})
+        with contextlib.redirect_stdout(io.StringIO()):
+            import lambda_function
+        """
+
+    def setup(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            import lambda_function  # noqa: F401
+
+    def time_warm_import(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            importlib.reload(sys.modules["lambda_function"])
@@ -0,0 +1,192 @@
+from hourly_price_prediction.models.utils import (build_model,
+                                                   get_model_class,
+                                                   score_metrics,
+                                                   strategy_simulation,
+                                                   train_test_val_split,
+                                                   training_pipeline)
+
+from .fixtures import SIZES, make_processed_dataset
+
+MODEL_CLASSES = [
+    "linearregressor",
+    "ridge",
+    "elasticnet",
+    "bayesianridge",
+    "huberregressor",
+    "decisiontreeregressor",
+    "kneighborsregressor",
+    "gradientboostingregressor",
+    "randomforestregressor",
+    "mlpregressor",
+]
+
+
+class TrainTestValSplit:
+    params = SIZES
+    param_names = ["hours"]
+
+    def setup(self, hours):
+        self.dataset = make_processed_dataset(hours)
+
+    def time_train_test_val_split(self, hours):
+        train_test_val_split(
+            self.dataset,
+            test_period_in_days=14 if hours > 24 * 14 else 1,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+        )
+
+    def peakmem_train_test_val_split(self, hours):
+        train_test_val_split(
+            self.dataset,
+            test_period_in_days=14 if hours > 24 * 14 else 1,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+        )
+
+
+class TrainingPipeline:
+    params = (MODEL_CLASSES, [2000, 20000])
+    param_names = ["model_class", "hours"]
+    timeout = 600
+    number = 1
+    repeat = 3
+
+    def setup(self, model_class, hours):
+        self.model_object = get_model_class(model_class)
+        self.splits = train_test_val_split(
+            make_processed_dataset(hours),
+            test_period_in_days=14,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+        )
+
+    def time_training_pipeline(self, model_class, hours):
+        training_pipeline(self.model_object(), *self.splits)
+
+
+class MultiHorizonTraining:
+    # linearregressor fits all steps at once, bayesianridge is wrapped in
+    # one estimator per step.
+    params = (["linearregressor", "bayesianridge"], [1, 6, 24])
+    param_names = ["model_class", "horizon"]
+    timeout = 600
+
+    def setup(self, model_class, horizon):
+        self.splits = train_test_val_split(
+            make_processed_dataset(20000, horizon=horizon),
+            test_period_in_days=14,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+            horizon=horizon,
+        )
+        self.model = build_model(model_class, {}, horizon)
+        training_pipeline(self.model, *self.splits)
+
+    def time_training_pipeline(self, model_class, horizon):
+        training_pipeline(build_model(model_class, {}, horizon), *self.splits)
+
+    def time_strategy_simulation(self, model_class, horizon):
+        strategy_simulation(self.model, self.splits[4], {"mae": 1.0})
+
+
+class StackedEnsemblePredict:
+    timeout = 600
+
+    def setup(self):
+        from hourly_price_prediction.models.ensemble import StackedEnsemble
+
+        features, targets = train_test_val_split(
+            make_processed_dataset(5000),
+            test_period_in_days=14,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+        )[:2]
+        self.model = StackedEnsemble(refit=False).fit(features, targets)
+        self.rows = features.values[:336]
+
+    def time_predict(self):
+        self.model.predict(self.rows)
+
+    def time_member_predictions(self):
+        self.model.member_predictions(self.rows)
+
+    def time_member_predict_calls(self):
+        for estimator in self.model.estimators_:
+            estimator.predict(self.rows)
+
+
+class CompiledTreePredict:
+    # Single row predictions, as the trader makes them every hour.
+    params = (
+        ["decisiontreeregressor", "randomforestregressor", "gradientboostingregressor"],
+        [1, 3],
+    )
+    param_names = ["model_class", "horizon"]
+    timeout = 600
+
+    def setup(self, model_class, horizon):
+        from hourly_price_prediction.models.tree_compiler import compile_model
+
+        splits = train_test_val_split(
+            make_processed_dataset(5000, horizon=horizon),
+            test_period_in_days=14,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+            horizon=horizon,
+        )
+        self.model = build_model(model_class, {}, horizon).fit(splits[0], splits[1])
+        self.compiled = compile_model(self.model)
+        self.features = splits[4].values
+        self.row = self.features[0].tolist()
+
+    def time_sklearn_single_row(self, model_class, horizon):
+        self.model.predict([self.row])
+
+    def time_compiled_single_row(self, model_class, horizon):
+        self.compiled.predict_one(self.row)
+
+    def track_mismatches(self, model_class, horizon):
+        # Predictions where the compiled model differs from sklearn's;
+        # anything but 0 is a bug.
+        from hourly_price_prediction.models.tree_compiler import count_mismatches
+
+        return count_mismatches(self.model, self.compiled, self.features)
+
+
+class MonteCarloSimulation:
+    params = [1000, 10000]
+    param_names = ["n_paths"]
+    timeout = 600
+
+    def setup(self, n_paths):
+        splits = train_test_val_split(
+            make_processed_dataset(20000),
+            test_period_in_days=14,
+            validation_percentage=0.2,
+            target_variable="nextclose",
+        )
+        self.model = build_model("linearregressor").fit(splits[0], splits[1])
+        self.test_features = splits[4]
+
+    def time_monte_carlo_simulation(self, n_paths):
+        from hourly_price_prediction.models.monte_carlo import monte_carlo_simulation
+
+        monte_carlo_simulation(self.model, self.test_features, n_paths=n_paths, max_workers=1)
+
+    def time_single_path_strategy_simulation(self, n_paths):
+        # The historical path alone, as `strategy_simulation` runs it.
+        strategy_simulation(self.model, self.test_features, {"mae": 1.0})
+
+
+class ScoreMetrics:
+    params = SIZES
+    param_names = ["hours"]
+
+    def setup(self, hours):
+        dataset = make_processed_dataset(hours)
+        self.actual_values = dataset["nextclose"].values
+        self.model_predictions = dataset["currentclose"].values
+
+    def time_score_metrics(self, hours):
+        score_metrics(self.actual_values, self.model_predictions, "test")
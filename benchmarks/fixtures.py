@@ -0,0 +1,167 @@
+"""
+Synthetic candle data for the benchmark suite, generated as a geometric
+random walk so that every size is reproducible without network access.
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+START_EPOCH = 1609459200
+SIZES = [1000, 10000, 100000]
+
+
+def make_candles(number_of_hours: int, seed: int = 43) -> pd.DataFrame:
+    """Hourly candles in the column layout of `load_candles`."""
+
+    rng = np.random.default_rng(seed)
+    close = 2000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, number_of_hours)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0.0, 0.004, number_of_hours))
+    return pd.DataFrame(
+        {
+            "time": START_EPOCH + 3600 * np.arange(number_of_hours),
+            "low": np.minimum(open_, close) * (1.0 - spread),
+            "high": np.maximum(open_, close) * (1.0 + spread),
+            "open": open_,
+            "close": close,
+            "volume": rng.uniform(100.0, 5000.0, number_of_hours),
+        }
+    )
+
+
+def make_processed_dataset(
+    number_of_hours: int, seed: int = 43, horizon: int = 1
+) -> pd.DataFrame:
+    """
+    The lower-cased `processed_data.csv` layout `train_model` works on,
+    with `horizon` target columns.
+    """
+
+    candles = make_candles(number_of_hours + horizon, seed)
+    dataset = pd.DataFrame(
+        {
+            "open": candles["open"].values,
+            "high": candles["high"].values,
+            "low": candles["low"].values,
+            "currentclose": candles["close"].values,
+            "volume_eth": candles["volume"].values,
+            "nextclose": candles["close"].shift(-1).values,
+        }
+    )
+    for step in range(2, horizon + 1):
+        dataset[f"nextclose_{step}"] = candles["close"].shift(-step).values
+    return dataset.dropna().reset_index(drop=True)
+
+
+def write_raw_csv(candles: pd.DataFrame, filepath: str) -> str:
+    """Writes candles the way cryptodatadownload publishes them."""
+
+    newest_first = candles.iloc[::-1]
+    raw_data = pd.DataFrame(
+        {
+            "unix": newest_first["time"].values,
+            "date": pd.to_datetime(newest_first["time"], unit="s").dt.strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            "symbol": "ETH/USD",
+            "open": newest_first["open"].values,
+            "high": newest_first["high"].values,
+            "low": newest_first["low"].values,
+            "close": newest_first["close"].values,
+            "Volume ETH": newest_first["volume"].values,
+            "Volume USD": (newest_first["volume"] * newest_first["close"]).values,
+        }
+    )
+    with open(filepath, "w") as csv_file:
+        csv_file.write("https://www.CryptoDataDownload.com\n")
+        raw_data.to_csv(csv_file, index=False)
+        csv_file.close()
+    return filepath
+
+
+def write_training_results(directory: str, number_of_hours: int) -> tuple:
+    """
+    Writes a `model_metrics.csv` and `trading_history.csv` pair like the
+    ones `train_model` saves, returning both paths.
+    """
+
+    from hourly_price_prediction.models.utils import strategy_simulation
+    from sklearn.linear_model import LinearRegression
+
+    dataset = make_processed_dataset(number_of_hours)
+    features = dataset.drop("nextclose", axis=1)
+    model = LinearRegression().fit(features, dataset["nextclose"])
+    trading_history, _ = strategy_simulation(model, features, {"mae": 1.0})
+
+    model_metrics = pd.DataFrame(
+        [
+            {"mode": mode, "mae": 1.0, "mse": 2.0, "rmse": 1.4, "r2": 0.9}
+            for mode in ["train", "val", "test"]
+        ]
+    )
+    path_to_model_metrics = os.path.join(directory, "model_metrics.csv")
+    path_to_trading_history = os.path.join(directory, "trading_history.csv")
+    model_metrics.to_csv(path_to_model_metrics, index=None)
+    trading_history.to_csv(path_to_trading_history, index=None)
+    return (path_to_model_metrics, path_to_trading_history)
+
+
+def write_many_training_results(
+    directory: str, number_of_runs: int, number_of_hours: int = 336
+) -> list:
+    """
+    Writes `number_of_runs` run directories in the `save_training_results`
+    layout, each with the trading history of a different random walk and
+    the same model metrics.
+    """
+
+    from hourly_price_prediction.models.utils import strategy_simulation
+    from sklearn.linear_model import LinearRegression
+
+    dataset = make_processed_dataset(number_of_hours)
+    features = dataset.drop("nextclose", axis=1)
+    model = LinearRegression().fit(features, dataset["nextclose"])
+    model_metrics = pd.DataFrame(
+        [
+            {"mode": mode, "mae": 1.0, "mse": 2.0, "rmse": 1.4, "r2": 0.9}
+            for mode in ["train", "val", "test"]
+        ]
+    )
+
+    run_directories = []
+    for run in range(number_of_runs):
+        run_dataset = make_processed_dataset(number_of_hours, seed=run)
+        trading_history, _ = strategy_simulation(
+            model, run_dataset.drop("nextclose", axis=1), {"mae": 1.0})
+        run_directory = os.path.join(directory, f"run-{run:05d}")
+        os.makedirs(run_directory)
+        trading_history.to_csv(os.path.join(run_directory, "trading_history.csv"), index=None)
+        model_metrics.to_csv(os.path.join(run_directory, "model_metrics.csv"), index=None)
+        run_directories.append(run_directory)
+    return run_directories
+
+
+def write_model_artifacts(directory: str, number_of_hours: int = 1000) -> tuple:
+    """Pickles a fitted LinearRegression and its validation metrics JSON."""
+
+    import json
+
+    from sklearn.linear_model import LinearRegression
+
+    dataset = make_processed_dataset(number_of_hours)
+    model = LinearRegression().fit(
+        dataset.drop("nextclose", axis=1).values, dataset["nextclose"].values
+    )
+    model_artifact = os.path.join(directory, "model.pickle")
+    with open(model_artifact, "wb") as pfile:
+        pickle.dump(model, pfile)
+        pfile.close()
+
+    validation_metrics = os.path.join(directory, "validation_metrics.json")
+    with open(validation_metrics, "w") as jfile:
+        jfile.write(json.dumps({"mode": "val", "mae": 15.0}))
+        jfile.close()
+    return (model_artifact, validation_metrics)
@@ -0,0 +1,65 @@
+import logging
+import os
+
+import hydra
+from make_dataset import process_raw_data_chunked
+from omegaconf import DictConfig
+
+from hourly_price_prediction.data.candles import (CandleResampler,
+                                                  load_candles,
+                                                  timeframe_seconds,
+                                                  write_cdd_csv)
+
+
+@hydra.main(config_path="../../configs/data", config_name="timeframes")
+def build_timeframes(cfg: DictConfig):
+    """
+    Derives coarser bars from a candle file and writes one raw and one
+    processed dataset per timeframe, in the same layout as the hourly
+    `make_dataset` output, so models can be trained at several horizons
+    from a single download.
+    """
+
+    assert os.path.isfile(cfg.candle_file), f"File does not exist: {cfg.candle_file}"
+    for directory in [cfg.raw_file_directory, cfg.processed_file_directory]:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    symbol_key = cfg.symbol.replace("/", "")
+    timeframes = list(cfg.timeframes)
+    resampler = CandleResampler.load(cfg.cache_directory, timeframes)
+    candles = load_candles(cfg.candle_file)
+    new_candles = resampler.update(symbol_key, candles)
+    resampler.save(cfg.cache_directory)
+    logging.info(f"{new_candles} new base candles for {cfg.symbol}")
+
+    base_granularity = int(candles["time"].diff().min())
+    for timeframe in timeframes:
+        bars = resampler.get(symbol_key, timeframe)
+        candles_per_bar = timeframe_seconds(timeframe) // base_granularity
+        if bars["bars"].iloc[-1] < candles_per_bar:
+            # the last bar is still forming
+            bars = bars.iloc[:-1]
+
+        raw_data_filepath = os.path.join(
+            cfg.raw_file_directory, f"{symbol_key}_{timeframe}.csv")
+        processed_data_filepath = os.path.join(
+            cfg.processed_file_directory, f"{symbol_key}_{timeframe}.csv")
+        write_cdd_csv(bars, raw_data_filepath, symbol=cfg.symbol)
+        summary = process_raw_data_chunked(
+            raw_data_filepath,
+            processed_data_filepath,
+            chunksize=cfg.chunksize,
+            horizon=cfg.horizon,
+        )
+        logging.info(
+            f"{timeframe}: {summary['rows']} rows"
+            f" ({summary['first_timestamp']} - {summary['last_timestamp']})"
+            f" -> {processed_data_filepath}"
+        )
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    build_timeframes()
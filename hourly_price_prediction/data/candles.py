@@ -0,0 +1,265 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+CANDLE_COLUMNS = ["time", "low", "high", "open", "close", "volume"]
+
+
+def load_candles(candle_file: str) -> pd.DataFrame:
+    """
+    Reads a candle file into a DataFrame with the columns of a Coinbase
+    candle (time, low, high, open, close, volume), sorted by time.
+
+    Both the raw cryptodatadownload CSV (a banner line followed by
+    `unix,date,symbol,open,high,low,close,Volume <ASSET>,...`) and plain
+    CSVs with `time`/`timestamp`/`unix` plus OHLCV columns are accepted.
+
+    :param candle_file: (str) Path to the CSV file.
+    :returns: (pd.DataFrame) Candles in ascending time order.
+    """
+
+    with open(candle_file, "r") as cfile:
+        first_line = cfile.readline().lower()
+        cfile.close()
+    skiprows = 0 if "open" in first_line else 1
+
+    raw_candles = pd.read_csv(candle_file, skiprows=skiprows)
+    raw_candles.columns = [str(column).lower() for column in raw_candles.columns]
+
+    time_column = None
+    for column in ["time", "timestamp", "unix"]:
+        if column in raw_candles.columns:
+            time_column = column
+            break
+    assert time_column is not None, (
+        f"No time column found in candle file: {candle_file}"
+        f" (columns {list(raw_candles.columns)})"
+    )
+
+    volume_column = "volume"
+    if volume_column not in raw_candles.columns:
+        volume_columns = [
+            column
+            for column in raw_candles.columns
+            if column.startswith("volume") and "usd" not in column
+        ]
+        assert volume_columns, f"No volume column found in: {candle_file}"
+        volume_column = volume_columns[0]
+
+    times = raw_candles[time_column]
+    if not np.issubdtype(times.dtype, np.number):
+        times = pd.to_datetime(times, utc=True).astype("int64") // 10 ** 9
+    times = times.astype("int64")
+    if times.max() > 10 ** 11:
+        # cryptodatadownload switched to millisecond unix timestamps
+        times = times // 1000
+
+    candles = pd.DataFrame(
+        {
+            "time": times.values,
+            "low": raw_candles["low"].astype(float).values,
+            "high": raw_candles["high"].astype(float).values,
+            "open": raw_candles["open"].astype(float).values,
+            "close": raw_candles["close"].astype(float).values,
+            "volume": raw_candles[volume_column].astype(float).values,
+        }
+    )
+    candles = candles.drop_duplicates("time").sort_values("time")
+    return candles.reset_index(drop=True)
+
+
+def write_cdd_csv(candles: pd.DataFrame, filepath: str, symbol: str = "ETH/USD") -> str:
+    """
+    Writes candles the way cryptodatadownload publishes them (banner line,
+    newest first, `Volume <base>` then `Volume <quote>`), so they can go
+    through the same processing as a downloaded raw file.
+    """
+
+    base_currency, quote_currency = symbol.split("/")
+    newest_first = candles.iloc[::-1]
+    raw_data = pd.DataFrame(
+        {
+            "unix": newest_first["time"].values,
+            "date": pd.to_datetime(newest_first["time"], unit="s").dt.strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            "symbol": symbol,
+            "open": newest_first["open"].values,
+            "high": newest_first["high"].values,
+            "low": newest_first["low"].values,
+            "close": newest_first["close"].values,
+            f"Volume {base_currency}": newest_first["volume"].values,
+            f"Volume {quote_currency}": (newest_first["volume"] * newest_first["close"]).values,
+        }
+    )
+    with open(filepath, "w") as csv_file:
+        csv_file.write("https://www.CryptoDataDownload.com\n")
+        raw_data.to_csv(csv_file, index=False)
+        csv_file.close()
+    return filepath
+
+
+TIMEFRAMES = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "4h": 14400,
+    "6h": 21600,
+    "1d": 86400,
+}
+
+
+def timeframe_seconds(timeframe) -> int:
+    """Accepts `TIMEFRAMES` names (`5m`, `4h`, `1d`, ...) or seconds."""
+
+    if isinstance(timeframe, str) and timeframe in TIMEFRAMES:
+        return TIMEFRAMES[timeframe]
+    return int(timeframe)
+
+
+def resample_candles(candles: pd.DataFrame, granularity: int) -> pd.DataFrame:
+    """
+    Aggregates candles into bars of `granularity` seconds aligned to the
+    unix epoch (so daily bars start at 00:00 UTC, like Coinbase's). Each
+    bar opens at the open of its first candle, closes at the close of its
+    last, and takes the max high, min low and summed volume, computed with
+    one `reduceat` per column over the bar boundaries.
+
+    :param candles: (pd.DataFrame) Candles as returned by `load_candles`,
+        in ascending time order.
+    :param granularity: (int) Seconds per output bar, a multiple of the
+        input spacing.
+    :returns: (pd.DataFrame) `CANDLE_COLUMNS` plus `bars`, the number of
+        input candles in each output bar (less than the full count for a
+        bar that is still forming or has gaps).
+    """
+
+    granularity = timeframe_seconds(granularity)
+    times = candles["time"].values.astype("int64")
+    if len(times) == 0:
+        return pd.DataFrame(columns=CANDLE_COLUMNS + ["bars"])
+
+    bucket_times = times - times % granularity
+    starts = np.flatnonzero(np.r_[True, bucket_times[1:] != bucket_times[:-1]])
+    ends = np.r_[starts[1:], len(times)]
+
+    return pd.DataFrame(
+        {
+            "time": bucket_times[starts],
+            "low": np.minimum.reduceat(candles["low"].values, starts),
+            "high": np.maximum.reduceat(candles["high"].values, starts),
+            "open": candles["open"].values[starts],
+            "close": candles["close"].values[ends - 1],
+            "volume": np.add.reduceat(candles["volume"].values, starts),
+            "bars": ends - starts,
+        }
+    )
+
+
+class CandleResampler(object):
+    """
+    Keeps resampled bars for several timeframes per symbol and updates them
+    incrementally as new base candles arrive.
+
+    Only the last bar of each timeframe can still change, so an update
+    re-aggregates the base candles from the start of that bar onwards and
+    appends the result, rather than resampling the whole history. Base
+    candles older than the earliest still-open bar are discarded, keeping
+    memory proportional to the longest timeframe, not to the history.
+
+    Usage:
+        resampler = CandleResampler(["5m", "1h", "1d"])
+        resampler.update("ETH-USD", minute_candles)
+        hourly = resampler.get("ETH-USD", "1h")
+    """
+
+    def __init__(self, timeframes: list = ("5m", "15m", "1h", "4h", "1d")):
+        """
+        :param timeframes: (list) `TIMEFRAMES` names or seconds.
+        """
+        self.timeframes = list(timeframes)
+        self._base = {}
+        self._bars = {}
+
+    def get(self, symbol: str, timeframe) -> pd.DataFrame:
+        """:returns: (pd.DataFrame) The bars of `symbol` at `timeframe`."""
+        return self._bars[(symbol, timeframe)]
+
+    def symbols(self) -> list:
+        return list(self._base)
+
+    def update(self, symbol: str, candles: pd.DataFrame) -> int:
+        """
+        Adds base candles for `symbol`. Candles at or before the newest
+        one already seen are ignored, so overlapping fetches are fine.
+
+        :returns: (int) Number of new base candles.
+        """
+
+        base = self._base.get(symbol)
+        if base is not None and len(base):
+            candles = candles[candles["time"] > base["time"].iloc[-1]]
+        if len(candles) == 0:
+            return 0
+        candles = candles[CANDLE_COLUMNS].sort_values("time")
+        base = candles if base is None else pd.concat([base, candles])
+
+        base_granularity = None
+        if len(base) > 1:
+            base_granularity = int(np.min(np.diff(base["time"].values)))
+        open_bars = []
+        for timeframe in self.timeframes:
+            granularity = timeframe_seconds(timeframe)
+            assert base_granularity is None or granularity % base_granularity == 0, (
+                f"Timeframe {timeframe} is not a multiple of the base spacing"
+                f" ({base_granularity}s)"
+            )
+            bars = self._bars.get((symbol, timeframe))
+            if bars is None:
+                bars = resample_candles(base, granularity)
+            else:
+                open_bar = bars["time"].iloc[-1]
+                refreshed = resample_candles(base[base["time"] >= open_bar], granularity)
+                bars = pd.concat([bars.iloc[:-1], refreshed], ignore_index=True)
+            self._bars[(symbol, timeframe)] = bars
+
+            open_bars.append(bars["time"].iloc[-1])
+
+        self._base[symbol] = base[base["time"] >= min(open_bars)].reset_index(drop=True)
+        return len(candles)
+
+    def save(self, directory: str) -> None:
+        """Writes every cached series to `directory/<symbol>/<timeframe>.csv`."""
+
+        for symbol, base in self._base.items():
+            symbol_directory = os.path.join(directory, symbol)
+            if not os.path.isdir(symbol_directory):
+                os.makedirs(symbol_directory)
+            base.to_csv(os.path.join(symbol_directory, "base.csv"), index=None)
+            for timeframe in self.timeframes:
+                self._bars[(symbol, timeframe)].to_csv(
+                    os.path.join(symbol_directory, f"{timeframe}.csv"), index=None
+                )
+
+    @classmethod
+    def load(cls, directory: str, timeframes: list = ("5m", "15m", "1h", "4h", "1d")):
+        """
+        Restores a resampler written by `save`, so later updates continue
+        incrementally. Symbols without a file for every timeframe are skipped.
+        """
+
+        resampler = cls(timeframes)
+        if not os.path.isdir(directory):
+            return resampler
+        for symbol in sorted(os.listdir(directory)):
+            symbol_directory = os.path.join(directory, symbol)
+            files = [os.path.join(symbol_directory, f"{tf}.csv") for tf in resampler.timeframes]
+            base_file = os.path.join(symbol_directory, "base.csv")
+            if not all(os.path.isfile(f) for f in files + [base_file]):
+                continue
+            resampler._base[symbol] = pd.read_csv(base_file)
+            for timeframe, bars_file in zip(resampler.timeframes, files):
+                resampler._bars[(symbol, timeframe)] = pd.read_csv(bars_file)
+        return resampler
@@ -1,11 +1,17 @@
 import logging
 import os
+import time
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
 
 import hydra
+import numpy as np
 import pandas as pd
 import requests
 from omegaconf import DictConfig
 
+from hourly_price_prediction.monitoring.profiler import PipelineProfiler
+
 
 def download_csv_file(url_path_to_csv_file: str) -> bytes:
     """
@@ -24,10 +30,279 @@ def download_csv_file(url_path_to_csv_file: str) -> bytes:
     return csv_content
 
 
-def process_raw_data(raw_data_filepath: str, processed_data_filepath: str) -> None:
+def download_csv_to_file(
+    url_path_to_csv_file: str, filepath: str, chunk_size: int = 1024 ** 2
+) -> int:
+    """
+    Streams the CSV file at `url_path_to_csv_file` straight to `filepath`
+    in `chunk_size` byte pieces, so the response body is never held in
+    memory as a whole.
+
+    :returns: (int) Number of bytes written.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not url_path_to_csv_file.startswith("http"):
+        url_path_to_csv_file = f"http://{url_path_to_csv_file}"
+
+    number_of_bytes = 0
+    with requests.get(url_path_to_csv_file, verify=False, stream=True) as response:
+        response.raise_for_status()
+        with open(filepath, "wb") as csv_file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                csv_file.write(chunk)
+                number_of_bytes += len(chunk)
+            csv_file.close()
+    logger.info(f"Downloaded CSV data from: {url_path_to_csv_file}")
+
+    return number_of_bytes
+
+
+def raw_column_plan(raw_data_filepath: str) -> dict:
+    """
+    Reads the header of a CryptoDataDownload file and maps the columns to
+    keep onto their processed names. The files carry two volume columns,
+    `Volume <base>` then `Volume <quote>` (e.g. `Volume ETH`, `Volume USD`);
+    the base volume is kept as `Volume_<base>`.
+
+    :returns: (dict) Raw column name -> processed column name, in file order.
+    """
+
+    with open(raw_data_filepath, "r") as raw_file:
+        raw_file.readline()
+        header = raw_file.readline().strip().split(",")
+        raw_file.close()
+
+    volume_columns = [column for column in header if column.startswith("Volume ")]
+    assert volume_columns, f"No volume column in {raw_data_filepath}: {header}"
+    column_names = {
+        "date": "TimeStamp",
+        "open": "open",
+        "high": "high",
+        "low": "low",
+        "close": "CurrentClose",
+        volume_columns[0]: volume_columns[0].replace(" ", "_"),
+    }
+    return {column: column_names[column] for column in header if column in column_names}
+
+
+def target_columns(horizon: int = 1) -> list:
+    """
+    Names of the target columns for a forecast `horizon`: `NextClose`, then
+    `NextClose_2` ... `NextClose_<horizon>`.
+    """
+
+    assert int(horizon) >= 1, f"The horizon must be at least 1, got {horizon}"
+    return ["NextClose"] + [f"NextClose_{step}" for step in range(2, int(horizon) + 1)]
+
+
+def add_targets(
+    dataset: pd.DataFrame, horizon: int = 1, newest_first: bool = True
+) -> pd.DataFrame:
+    """
+    Adds the `target_columns(horizon)` to `dataset` in one vectorized pass:
+    target `h` of a row is the `CurrentClose` `h` hours later, read from a
+    single strided window view over the close column in chronological
+    order. The `horizon` most recent rows get NaN targets.
+
+    :param newest_first: (bool) The rows are in descending time order, as
+        in the CryptoDataDownload files, so the later closes are the rows
+        above.
+    """
+
+    horizon = int(horizon)
+    close = dataset["CurrentClose"].to_numpy(dtype=float)
+    if newest_first:
+        close = close[::-1]
+    targets = np.full((len(close), horizon), np.nan)
+    if len(close) > horizon:
+        windows = np.lib.stride_tricks.sliding_window_view(close, horizon + 1)
+        targets[:len(windows)] = windows[:, 1:]
+    if newest_first:
+        targets = targets[::-1]
+    for step, column in enumerate(target_columns(horizon)):
+        dataset[column] = targets[:, step]
+    return dataset
+
+
+def process_raw_data_chunked(
+    raw_data_filepath: str,
+    processed_data_filepath: str,
+    chunksize: int = 100000,
+    horizon: int = 1,
+    newest_first: bool = True,
+) -> dict:
+    """
+    Streaming version of `process_raw_data` that produces the same file
+    while holding at most `chunksize` rows in memory, whatever the size of
+    the input.
+
+    Columns are selected while parsing (the string `symbol` column is never
+    materialised) and prices are read as float64. The targets of a row are
+    the `CurrentClose` of the next `horizon` hours. In a newest first file
+    those are the rows above it, so the last `horizon` rows of every chunk
+    are carried into the next one to supply the targets of its first rows;
+    in an oldest first file they are held back until the next chunk
+    supplies their own targets.
+
+    :returns: (dict) `rows` written and the `first_timestamp` and
+        `last_timestamp` they cover.
+    """
+    logger = logging.getLogger(__name__)
+
+    column_names = raw_column_plan(raw_data_filepath)
+    reader = pd.read_csv(
+        raw_data_filepath,
+        skiprows=1,
+        usecols=list(column_names),
+        dtype={"open": "float64", "high": "float64", "low": "float64", "close": "float64"},
+        chunksize=chunksize,
+    )
+
+    number_of_rows = 0
+    first_timestamp, last_timestamp = None, None
+    boundary_rows = None
+    with open(processed_data_filepath, "w", newline="") as processed_file:
+        for chunk in reader:
+            chunk = chunk.rename(column_names, axis=1)
+            chunk["TimeStamp"] = pd.to_datetime(chunk["TimeStamp"])
+            if boundary_rows is not None:
+                chunk = pd.concat([boundary_rows, chunk])
+            number_of_carried_rows = 0 if boundary_rows is None else len(boundary_rows)
+            chunk = add_targets(chunk, horizon, newest_first=newest_first)
+
+            boundary_rows = chunk.iloc[-horizon:].drop(target_columns(horizon), axis=1)
+            if newest_first:
+                completed = chunk.iloc[number_of_carried_rows:].dropna(axis=0)
+            else:
+                completed = chunk.iloc[:-horizon].dropna(axis=0)
+            if len(completed):
+                completed.drop("TimeStamp", axis=1).to_csv(
+                    processed_file, index=None, header=number_of_rows == 0
+                )
+                number_of_rows += len(completed)
+                chunk_range = [completed["TimeStamp"].min(), completed["TimeStamp"].max()]
+                if first_timestamp is not None:
+                    chunk_range = [min(first_timestamp, chunk_range[0]),
+                                   max(last_timestamp, chunk_range[1])]
+                first_timestamp, last_timestamp = chunk_range
+        processed_file.close()
+
+    logger.info(f"Processed {number_of_rows} rows in chunks of {chunksize}")
+    return {
+        "rows": number_of_rows,
+        "first_timestamp": first_timestamp,
+        "last_timestamp": last_timestamp,
+    }
+
+
+def _process_symbol(
+    symbol: str,
+    raw_data_filepath: str,
+    processed_data_filepath: str,
+    chunksize: int,
+    horizon: int = 1,
+) -> dict:
+    """Runs in a worker process: processes one symbol's raw file."""
+
+    process_start = time.perf_counter()
+    summary = process_raw_data_chunked(
+        raw_data_filepath, processed_data_filepath, chunksize=chunksize, horizon=horizon
+    )
+    summary["process_seconds"] = time.perf_counter() - process_start
+    return summary
+
+
+def build_symbol_datasets(
+    symbols: list,
+    url_template: str,
+    raw_file_directory: str,
+    processed_file_directory: str,
+    chunksize: int = 100000,
+    max_download_workers: int = 8,
+    max_process_workers: int = None,
+    horizon: int = 1,
+) -> pd.DataFrame:
+    """
+    Builds one processed dataset per symbol. Downloads run concurrently on
+    a thread pool of `max_download_workers`; as soon as a symbol's file has
+    arrived it is processed in a worker process, overlapping with the
+    remaining downloads, so the whole universe takes roughly as long as
+    the slowest download plus one processing pass.
+
+    A failed symbol is logged and reported in the summary; it does not stop
+    the others.
+
+    :param symbols: (list) Names substituted for `{symbol}` in
+        `url_template`, e.g. `Bitfinex_ETHUSD`.
+    :returns: (pd.DataFrame) One summary row per symbol: files, bytes,
+        rows, time range, download/process seconds and error.
+    """
+    logger = logging.getLogger(__name__)
+
+    def download(symbol):
+        raw_data_filepath = os.path.join(raw_file_directory, f"{symbol}.csv")
+        download_start = time.perf_counter()
+        raw_bytes = download_csv_to_file(
+            url_template.format(symbol=symbol), raw_data_filepath
+        )
+        return raw_data_filepath, raw_bytes, time.perf_counter() - download_start
+
+    summaries = {symbol: {"symbol": symbol, "error": None} for symbol in symbols}
+    with ThreadPoolExecutor(max_workers=max_download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=max_process_workers) as process_pool:
+        downloads = {download_pool.submit(download, symbol): symbol for symbol in symbols}
+        processing = {}
+        for future in as_completed(downloads):
+            symbol = downloads[future]
+            try:
+                raw_data_filepath, raw_bytes, download_seconds = future.result()
+            except Exception as error:
+                logger.error(f"Download failed for {symbol}: {error}")
+                summaries[symbol]["error"] = f"download: {error}"
+                continue
+            processed_data_filepath = os.path.join(processed_file_directory, f"{symbol}.csv")
+            summaries[symbol].update({
+                "raw_file": raw_data_filepath,
+                "processed_file": processed_data_filepath,
+                "raw_bytes": raw_bytes,
+                "download_seconds": download_seconds,
+            })
+            processing[process_pool.submit(
+                _process_symbol,
+                symbol,
+                raw_data_filepath,
+                processed_data_filepath,
+                chunksize,
+                horizon,
+            )] = symbol
+
+        for future in as_completed(processing):
+            symbol = processing[future]
+            try:
+                summaries[symbol].update(future.result())
+            except Exception as error:
+                logger.error(f"Processing failed for {symbol}: {error}")
+                summaries[symbol]["error"] = f"process: {error}"
+            else:
+                logger.info(f"{symbol}: {summaries[symbol]['rows']} rows")
+
+    return pd.DataFrame([summaries[symbol] for symbol in symbols])
+
+
+def process_raw_data(
+    raw_data_filepath: str,
+    processed_data_filepath: str,
+    horizon: int = 1,
+    newest_first: bool = True,
+) -> None:
     """
     Runs data processing scripts to turn raw data from (../raw) into
     cleaned data ready to be analyzed (saved in ../processed).
+
+    :param horizon: (int) Number of future closes to add as targets, see
+        `target_columns`.
+    :param newest_first: (bool) The raw rows are in descending time order.
     """
     logger = logging.getLogger(__name__)
 
@@ -46,8 +321,7 @@ def process_raw_data(raw_data_filepath: str, processed_data_filepath: str) -> No
         axis=1,
     )
     raw_data["TimeStamp"] = pd.to_datetime(raw_data["TimeStamp"])
-    target = raw_data["CurrentClose"].shift(-1)
-    raw_data["NextClose"] = target
+    raw_data = add_targets(raw_data, horizon, newest_first=newest_first)
     raw_data.dropna(inplace=True, axis=0)
     raw_data.set_index("TimeStamp", inplace=True)
     raw_data.to_csv(processed_data_filepath, index=None)
@@ -56,9 +330,11 @@ def process_raw_data(raw_data_filepath: str, processed_data_filepath: str) -> No
 
 @hydra.main(config_path="../../configs/data", config_name="data")
 def main(cfg: DictConfig):
-
-    csv_data = download_csv_file(url_path_to_csv_file=cfg.web_url)
-    logging.info(f"csv_data type: {type(csv_data)}")
+    profiler = PipelineProfiler(
+        enabled=cfg.profile.enabled,
+        trace_memory=cfg.profile.trace_memory,
+        capture_cprofile=cfg.profile.cprofile,
+    )
 
     required_directories = [
         cfg.raw_file_directory,
@@ -68,21 +344,66 @@ def main(cfg: DictConfig):
         if not os.path.isdir(directory):
             os.makedirs(directory)
 
+    if cfg.symbols:
+        with profiler.stage("build_symbols"):
+            summary = build_symbol_datasets(
+                symbols=list(cfg.symbols),
+                url_template=cfg.symbol_url_template,
+                raw_file_directory=cfg.raw_file_directory,
+                processed_file_directory=cfg.processed_file_directory,
+                chunksize=cfg.chunksize or 100000,
+                max_download_workers=cfg.max_download_workers,
+                max_process_workers=cfg.max_process_workers,
+                horizon=cfg.horizon,
+            )
+        summary_file = os.path.join(cfg.processed_file_directory, "symbols_summary.csv")
+        summary.to_csv(summary_file, index=None)
+        logging.info(
+            f"Built {int(summary['error'].isna().sum())}/{len(summary)} symbols,"
+            f" summary: {summary_file}"
+        )
+        profiler.add_metadata(symbols=len(summary))
+        profile_file = profiler.save(cfg.processed_file_directory)
+        if profile_file is not None:
+            logging.info(f"Pipeline Profile saved: {profile_file}")
+        return
+
     raw_data_filepath = os.path.join(cfg.raw_file_directory, "raw_data.csv")
     processed_data_filepath = os.path.join(
         cfg.processed_file_directory, "processed_data.csv"
     )
-    with open(raw_data_filepath, "wb") as csv_file:
-        csv_file.write(csv_data)
-        csv_file.close()
+    with profiler.stage("download"):
+        download_csv_to_file(
+            url_path_to_csv_file=cfg.web_url, filepath=raw_data_filepath
+        )
 
-    process_raw_data(
-        raw_data_filepath=raw_data_filepath,
-        processed_data_filepath=processed_data_filepath,
-    )
+    with profiler.stage("process"):
+        if cfg.chunksize:
+            process_raw_data_chunked(
+                raw_data_filepath=raw_data_filepath,
+                processed_data_filepath=processed_data_filepath,
+                chunksize=cfg.chunksize,
+                horizon=cfg.horizon,
+            )
+        else:
+            process_raw_data(
+                raw_data_filepath=raw_data_filepath,
+                processed_data_filepath=processed_data_filepath,
+                horizon=cfg.horizon,
+            )
     logging.info(f"Raw Data File: {raw_data_filepath}")
     logging.info(f"Processed Data File: {processed_data_filepath}")
 
+    profiler.add_metadata(
+        web_url=cfg.web_url,
+        chunksize=cfg.chunksize,
+        raw_bytes=os.path.getsize(raw_data_filepath),
+        processed_bytes=os.path.getsize(processed_data_filepath),
+    )
+    profile_file = profiler.save(cfg.processed_file_directory)
+    if profile_file is not None:
+        logging.info(f"Pipeline Profile saved: {profile_file}")
+
 
 if __name__ == "__main__":
     log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# Table versions kept besides the current one, for readers still mapping
+# them.
+PREVIOUS_VERSIONS_KEPT = 2
+
+
+class CachedTable(object):
+    """
+    One version of a `ResultsCache` table: a read-only memory map per
+    column. Slicing a column reads only the pages it touches.
+    """
+
+    def __init__(self, version: str, columns: dict):
+        """
+        :param version: (str) Version directory the columns were mapped from.
+        :param columns: (dict) Column name to np.ndarray, in column order.
+        """
+        self.version = version
+        self.columns = columns
+
+    def __len__(self) -> int:
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    @property
+    def column_names(self) -> list:
+        return list(self.columns)
+
+    def to_frame(self, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """Copies rows `start:stop` into a DataFrame."""
+        return pd.DataFrame(
+            {name: values[start:stop] for name, values in self.columns.items()},
+            columns=self.column_names,
+        )
+
+
+class ResultsCache(object):
+    """
+    Columnar tables on local disk, filled by one loader process and read by
+    every dashboard worker through read-only memory maps.
+
+    A table is a directory holding one `.npy` file per column and
+    `columns.json` (the column order), written as a new version
+    `<name>/<version>/` and published by atomically replacing
+    `<name>/CURRENT`, so a reader sees the old version or the new one,
+    never a partial one. Opening a table maps its files without reading
+    them: the pages are loaded once into the OS page cache and shared by
+    every process, so memory does not grow with the number of workers.
+
+    Text columns are stored as fixed width unicode, missing values as "".
+    Small documents are kept as JSON files replaced the same way.
+    """
+
+    def __init__(self, cache_directory: str):
+        """
+        :param cache_directory: (str) Root directory of the cache.
+        """
+        self.cache_directory = cache_directory
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory, exist_ok=True)
+        self._tables = {}
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _replace(self, path: str, content: str) -> None:
+        """Writes `content` to `path` through a temporary file and a rename."""
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(file_descriptor, "w") as tfile:
+            tfile.write(content)
+            tfile.close()
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def _column_values(values: pd.Series) -> np.ndarray:
+        if values.dtype == object:
+            return values.fillna("").astype(str).to_numpy(dtype=str)
+        return values.to_numpy()
+
+    def version(self, name: str) -> str:
+        """Current version of table `name`, None when it was never written."""
+        try:
+            with open(os.path.join(self.cache_directory, name, "CURRENT")) as cfile:
+                version = cfile.read().strip()
+                cfile.close()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def write_table(self, name: str, table: pd.DataFrame) -> str:
+        """
+        Writes `table` as the new version of table `name`.
+
+        :returns: (str) The version written.
+        """
+
+        logger = logging.getLogger(__name__)
+        table_directory = os.path.join(self.cache_directory, name)
+        with self._locked():
+            os.makedirs(table_directory, exist_ok=True)
+            version = str(time.time_ns())
+            version_directory = os.path.join(table_directory, version)
+            os.makedirs(version_directory)
+            column_names = [str(column) for column in table.columns]
+            for index, column in enumerate(table.columns):
+                np.save(
+                    os.path.join(version_directory, f"{index}.npy"),
+                    self._column_values(table[column]),
+                    allow_pickle=False,
+                )
+            self._replace(
+                os.path.join(version_directory, "columns.json"), json.dumps(column_names))
+            self._replace(os.path.join(table_directory, "CURRENT"), version)
+
+            versions = sorted(
+                entry for entry in os.listdir(table_directory) if entry.isdigit())
+            for old_version in versions[:-(PREVIOUS_VERSIONS_KEPT + 1)]:
+                shutil.rmtree(os.path.join(table_directory, old_version), ignore_errors=True)
+        logger.info(f"Cached {len(table)} rows of {name}, version {version}")
+        return version
+
+    def read_table(self, name: str) -> CachedTable:
+        """
+        The current version of table `name`, mapped once per version and
+        process; None when it was never written.
+        """
+
+        version = self.version(name)
+        if version is None:
+            return None
+        cached = self._tables.get(name)
+        if cached is not None and cached.version == version:
+            return cached
+
+        version_directory = os.path.join(self.cache_directory, name, version)
+        with open(os.path.join(version_directory, "columns.json")) as jfile:
+            column_names = json.loads(jfile.read())
+            jfile.close()
+        table = CachedTable(version, {
+            column: np.load(
+                os.path.join(version_directory, f"{index}.npy"),
+                mmap_mode="r",
+                allow_pickle=False,
+            )
+            for index, column in enumerate(column_names)
+        })
+        self._tables[name] = table
+        return table
+
+    def write_json(self, name: str, document) -> None:
+        with self._locked():
+            self._replace(
+                os.path.join(self.cache_directory, f"{name}.json"), json.dumps(document))
+
+    def read_json(self, name: str, default=None):
+        try:
+            with open(os.path.join(self.cache_directory, f"{name}.json")) as jfile:
+                document = json.loads(jfile.read())
+                jfile.close()
+        except FileNotFoundError:
+            return default
+        return document
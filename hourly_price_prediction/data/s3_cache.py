@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+MEGABYTE = 1024 ** 2
+
+
+class S3Cache(object):
+    """
+    Size-bounded, read-through disk cache of S3 objects, shared safely by
+    every process pointed at the same `cache_directory`.
+
+    Each object is a single file, `objects/<sha256(bucket/key)>`, holding a
+    one line JSON header (bucket, key, ETag, size) followed by the body.
+    Files are written to a temporary name and renamed into place, so a
+    reader sees the old entry or the new one, never a partial one, without
+    taking a lock. Writers and eviction hold an exclusive `fcntl` lock on
+    `cache_directory/.lock`.
+
+    Access refreshes an entry's mtime; when the cache grows past
+    `max_bytes` the least recently used entries are evicted down to
+    `low_water * max_bytes`. The running total of entry bytes is kept in
+    `cache_directory/.size` and updated under the lock on every put and
+    invalidation, so only an eviction lists and sorts the entries.
+    """
+
+    low_water = 0.9
+
+    def __init__(self, cache_directory: str, max_bytes: int = 512 * MEGABYTE):
+        """
+        :param cache_directory: (str) Root directory of the cache.
+        :param max_bytes: (int) Size budget of the cached objects.
+        """
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self.objects_directory = os.path.join(cache_directory, "objects")
+        if not os.path.isdir(self.objects_directory):
+            os.makedirs(self.objects_directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, bucket: str, s3_key: str) -> str:
+        digest = hashlib.sha256(f"{bucket}/{s3_key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.objects_directory, digest)
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def get(self, bucket: str, s3_key: str) -> tuple:
+        """
+        :returns: tuple(etag, body) of the cached object, or (None, None).
+        """
+
+        entry_path = self._entry_path(bucket, s3_key)
+        try:
+            with open(entry_path, "rb") as entry_file:
+                header = json.loads(entry_file.readline())
+                body = entry_file.read()
+                entry_file.close()
+        except (OSError, ValueError):
+            return (None, None)
+        if header.get("key") != s3_key or len(body) != header.get("size"):
+            return (None, None)
+        return (header.get("etag"), body)
+
+    def touch(self, bucket: str, s3_key: str) -> None:
+        """Marks an entry as recently used."""
+        try:
+            os.utime(self._entry_path(bucket, s3_key))
+        except OSError:
+            pass
+
+    def put(self, bucket: str, s3_key: str, etag: str, body: bytes) -> None:
+        """Stores `body` for `s3_key` and evicts down to the size budget."""
+
+        if len(body) > self.max_bytes:
+            return
+        header = json.dumps(
+            {"bucket": bucket, "key": s3_key, "etag": etag, "size": len(body)}
+        ).encode("utf-8")
+
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            prefix=".entry-", dir=self.objects_directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                entry_file.write(header + b"\n")
+                entry_file.write(body)
+                entry_file.close()
+            entry_path = self._entry_path(bucket, s3_key)
+            with self._locked():
+                total_bytes = self._read_total() - self._entry_size(entry_path)
+                total_bytes += os.path.getsize(temporary_path)
+                os.replace(temporary_path, entry_path)
+                if total_bytes > self.max_bytes:
+                    total_bytes = self._evict()
+                self._write_total(total_bytes)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def invalidate(self, bucket: str, s3_key: str) -> None:
+        entry_path = self._entry_path(bucket, s3_key)
+        with self._locked():
+            total_bytes = self._read_total() - self._entry_size(entry_path)
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                return
+            self._write_total(total_bytes)
+
+    def size(self) -> int:
+        """Bytes currently used by cached entries."""
+        return sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def _entry_size(entry_path: str) -> int:
+        try:
+            return os.path.getsize(entry_path)
+        except FileNotFoundError:
+            return 0
+
+    def _read_total(self) -> int:
+        """Tracked bytes of the cached entries; rebuilt by a scan when missing."""
+        try:
+            with open(os.path.join(self.cache_directory, ".size")) as size_file:
+                total_bytes = int(size_file.read())
+                size_file.close()
+            return total_bytes
+        except (OSError, ValueError):
+            return self.size()
+
+    def _write_total(self, total_bytes: int) -> None:
+        with open(os.path.join(self.cache_directory, ".size"), "w") as size_file:
+            size_file.write(str(max(total_bytes, 0)))
+            size_file.close()
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.objects_directory):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> int:
+        """
+        Removes least recently used entries until within
+        `low_water * max_bytes`.
+
+        :returns: (int) Bytes of the entries left in the cache.
+        """
+
+        logger = logging.getLogger(__name__)
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total_bytes <= self.low_water * self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                total_bytes -= size
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted {entry_path} from the S3 cache")
+        return total_bytes
@@ -1,7 +1,42 @@
+import json
 import os
+import shutil
+import tempfile
+import threading
 import time
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+MEGABYTE = 1024 ** 2
+
+# Artifacts above the threshold are transferred as concurrent multipart
+# uploads/ranged downloads; everything the trader touches per tick is far
+# below it and goes through a single request.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * MEGABYTE,
+    multipart_chunksize=16 * MEGABYTE,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(region_name: str):
+    """
+    Returns the process wide S3 client for `region_name`, creating it on
+    first use. Clients are thread safe and keep their connection pool, so
+    reusing one saves the credential lookup and TLS handshake on every call
+    (and across warm Lambda invocations).
+    """
+
+    with _clients_lock:
+        if region_name not in _clients:
+            _clients[region_name] = boto3.client("s3", region_name=region_name)
+        return _clients[region_name]
 
 
 class S3Helper(object):
@@ -11,12 +46,21 @@ class S3Helper(object):
         region_name: str,
         datekey_partition: bool = True,
         hourkey_partition: bool = True,
+        cache=None,
     ):
-        self.s3_client = boto3.client("s3", region_name=region_name)
+        """
+        :param cache: (S3Cache) Optional local disk cache that reads go
+            through. Cached objects are revalidated against their ETag with
+            a conditional GET, unless the read is marked `immutable`, in
+            which case a cached copy is served without contacting S3.
+        """
+        self.s3_client = get_s3_client(region_name)
+        self.cache = cache
         self.bucket = bucket
         self.region_name = region_name
         self.datekey_partition = datekey_partition
         self.hourkey_partition = hourkey_partition
+        self.clock = time
 
     def generate_partition(self) -> str:
         """
@@ -26,24 +70,31 @@ class S3Helper(object):
 
         partition = ""
         if self.datekey_partition:
-            datekey = time.strftime("%Y-%m-%d")
+            datekey = self.clock.strftime("%Y-%m-%d")
             datekey_partition = f"datekey={datekey}"
             partition = os.path.join(partition, datekey_partition)
 
         if self.hourkey_partition:
-            hourkey = time.strftime("%H")
+            hourkey = self.clock.strftime("%H")
             hourkey_partition = f"hourkey={hourkey}"
             partition = os.path.join(partition, hourkey_partition)
 
         return partition
 
-    def download_from_s3(self, s3_key: str, local_filepath: str):
+    def download_from_s3(self, s3_key: str, local_filepath: str, immutable: bool = False):
         """
         Given an S3 Key, this function will download the file
         and store it at local_filepath.
 
         """
-        return self.s3_client.download_file(self.bucket, s3_key, local_filepath)
+        if self.cache is not None:
+            with open(local_filepath, "wb") as local_file:
+                local_file.write(self.get_object_bytes(s3_key, immutable=immutable))
+                local_file.close()
+            return None
+        return self.s3_client.download_file(
+            self.bucket, s3_key, local_filepath, Config=TRANSFER_CONFIG
+        )
 
     def upload_to_s3(self, s3_key: str, local_filepath: str):
         """
@@ -52,6 +103,223 @@ class S3Helper(object):
 
         """
 
+        if self.cache is not None:
+            self.cache.invalidate(self.bucket, s3_key)
         return self.s3_client.upload_file(
-            local_filepath, self.bucket, s3_key, 
+            local_filepath, self.bucket, s3_key, Config=TRANSFER_CONFIG
         )
+
+    def get_object_bytes(self, s3_key: str, immutable: bool = False) -> bytes:
+        """
+        Reads the object stored under `s3_key` into memory, through the
+        cache when there is one.
+
+        :param immutable: (bool) The object never changes once written
+            (model artifacts, trading history records), so a cached copy
+            can be used without revalidating it.
+        """
+        if self.cache is None:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=s3_key)
+            return response["Body"].read()
+
+        etag, cached_body = self.cache.get(self.bucket, s3_key)
+        if cached_body is not None and immutable:
+            self.cache.hits += 1
+            self.cache.touch(self.bucket, s3_key)
+            return cached_body
+
+        request = {"Bucket": self.bucket, "Key": s3_key}
+        if cached_body is not None:
+            request["IfNoneMatch"] = etag
+        try:
+            response = self.s3_client.get_object(**request)
+        except ClientError as error:
+            status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if cached_body is not None and status_code == 304:
+                self.cache.hits += 1
+                self.cache.touch(self.bucket, s3_key)
+                return cached_body
+            raise
+
+        body = response["Body"].read()
+        self.cache.misses += 1
+        self.cache.put(self.bucket, s3_key, response["ETag"], body)
+        return body
+
+    def put_object_bytes(self, s3_key: str, body: bytes, content_type: str = None):
+        """
+        Writes `body` to `s3_key` in a single request, without touching disk.
+
+        """
+        extra_args = {} if content_type is None else {"ContentType": content_type}
+        response = self.s3_client.put_object(
+            Bucket=self.bucket, Key=s3_key, Body=body, **extra_args
+        )
+        if self.cache is not None:
+            self.cache.put(self.bucket, s3_key, response["ETag"], body)
+        return response
+
+    def get_json(self, s3_key: str, immutable: bool = False):
+        """
+        Reads and parses the JSON object stored under `s3_key`.
+
+        """
+        return json.loads(self.get_object_bytes(s3_key, immutable=immutable))
+
+    def put_json(self, s3_key: str, document):
+        """
+        Serializes `document` and writes it to `s3_key`.
+
+        """
+        return self.put_object_bytes(
+            s3_key,
+            json.dumps(document, default=str).encode("utf-8"),
+            content_type="application/json",
+        )
+
+    def upload_fileobj(self, s3_key: str, fileobj):
+        """
+        Streams a binary file-like object to `s3_key`, as a concurrent
+        multipart upload when it is large.
+
+        """
+        if self.cache is not None:
+            self.cache.invalidate(self.bucket, s3_key)
+        return self.s3_client.upload_fileobj(
+            fileobj, self.bucket, s3_key, Config=TRANSFER_CONFIG
+        )
+
+    def download_fileobj(self, s3_key: str, fileobj, immutable: bool = False):
+        """
+        Streams the object stored under `s3_key` into a binary file-like
+        object, with concurrent ranged requests when it is large.
+
+        """
+        if self.cache is not None:
+            fileobj.write(self.get_object_bytes(s3_key, immutable=immutable))
+            return None
+        return self.s3_client.download_fileobj(
+            self.bucket, s3_key, fileobj, Config=TRANSFER_CONFIG
+        )
+
+    def list_keys(self, prefix: str = "", start_after: str = None) -> list:
+        """
+        Every key in the bucket starting with `prefix`, in lexicographic
+        order; only the keys after `start_after` when it is given.
+
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        pagination = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after is not None:
+            pagination["StartAfter"] = start_after
+        keys = []
+        for page in paginator.paginate(**pagination):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+
+class LocalS3Helper(S3Helper):
+    """
+    Drop-in replacement for `S3Helper` that keeps objects on the local
+    filesystem under `root_directory/<bucket>/<key>`, for running the
+    trader and the pipelines without AWS. Objects are already local, so
+    there is no cache tier and `immutable` is accepted and ignored.
+    """
+
+    def __init__(
+        self,
+        root_directory: str,
+        bucket: str = "local",
+        datekey_partition: bool = True,
+        hourkey_partition: bool = True,
+        clock=None,
+    ):
+        self.root_directory = root_directory
+        self.bucket = bucket
+        self.region_name = None
+        self.datekey_partition = datekey_partition
+        self.hourkey_partition = hourkey_partition
+        self.clock = time if clock is None else clock
+        self.cache = None
+
+    def _object_path(self, s3_key: str) -> str:
+        return os.path.join(self.root_directory, self.bucket, s3_key)
+
+    def _existing_object_path(self, s3_key: str) -> str:
+        object_path = self._object_path(s3_key)
+        if not os.path.isfile(object_path):
+            raise FileNotFoundError(f"No such key: {self.bucket}/{s3_key}")
+        return object_path
+
+    def _write_object(self, s3_key: str, write) -> None:
+        """
+        Calls `write(file)` on a temporary file next to the object and
+        renames it into place, so readers never see a partial object.
+        """
+
+        object_path = self._object_path(s3_key)
+        object_directory = os.path.dirname(object_path)
+        if not os.path.isdir(object_directory):
+            os.makedirs(object_directory, exist_ok=True)
+
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            prefix=".upload-", dir=object_directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as object_file:
+                write(object_file)
+                object_file.close()
+            os.replace(temporary_path, object_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def download_from_s3(self, s3_key: str, local_filepath: str, immutable: bool = False):
+        """
+        Copies the object stored under `s3_key` to local_filepath.
+
+        """
+        shutil.copyfile(self._existing_object_path(s3_key), local_filepath)
+
+    def upload_to_s3(self, s3_key: str, local_filepath: str):
+        """
+        Copies local_filepath into the store under `s3_key`.
+
+        """
+        def write(object_file):
+            with open(local_filepath, "rb") as local_file:
+                shutil.copyfileobj(local_file, object_file)
+                local_file.close()
+
+        self._write_object(s3_key, write)
+
+    def get_object_bytes(self, s3_key: str, immutable: bool = False) -> bytes:
+        with open(self._existing_object_path(s3_key), "rb") as object_file:
+            body = object_file.read()
+            object_file.close()
+        return body
+
+    def put_object_bytes(self, s3_key: str, body: bytes, content_type: str = None):
+        self._write_object(s3_key, lambda object_file: object_file.write(body))
+
+    def upload_fileobj(self, s3_key: str, fileobj):
+        self._write_object(
+            s3_key, lambda object_file: shutil.copyfileobj(fileobj, object_file))
+
+    def download_fileobj(self, s3_key: str, fileobj, immutable: bool = False):
+        with open(self._existing_object_path(s3_key), "rb") as object_file:
+            shutil.copyfileobj(object_file, fileobj)
+            object_file.close()
+
+    def list_keys(self, prefix: str = "", start_after: str = None) -> list:
+        bucket_directory = os.path.join(self.root_directory, self.bucket)
+        keys = []
+        for directory, _, filenames in os.walk(bucket_directory):
+            for filename in filenames:
+                if filename.startswith(".upload-"):
+                    continue
+                key = os.path.relpath(os.path.join(directory, filename), bucket_directory)
+                key = key.replace(os.sep, "/")
+                if key.startswith(prefix) and (start_after is None or key > start_after):
+                    keys.append(key)
+        return sorted(keys)
@@ -0,0 +1,72 @@
+import bisect
+
+import pandas as pd
+
+TRADING_HISTORY_PREFIX = "trading_history/"
+
+
+class TradingHistoryStore(object):
+    """
+    In-memory copy of the trader's records under `trading_history/`,
+    kept current by `refresh`.
+
+    The records are stored as `trading_history/datekey=.../hourkey=.../
+    <time>.json`, so their keys sort in time order: a refresh only lists
+    the keys after the last one seen (S3 `StartAfter`) and downloads the
+    new records. Records are kept in timestamp order and a record whose
+    timestamp is already stored is skipped, so `since` can hand each
+    reader exactly the records it has not seen yet.
+    """
+
+    def __init__(self, data_helper, prefix: str = TRADING_HISTORY_PREFIX):
+        """
+        :param data_helper: (S3Helper) Where the records are read from.
+        """
+        self.data_helper = data_helper
+        self.prefix = prefix
+        self.last_key = None
+        self.records = []
+        self.timestamps = []
+
+    @property
+    def watermark(self):
+        """Timestamp of the newest stored record, None when empty."""
+        return self.timestamps[-1] if self.timestamps else None
+
+    def refresh(self) -> int:
+        """
+        Fetches the records written since the last refresh.
+
+        :returns: (int) Number of records added.
+        """
+
+        keys = self.data_helper.list_keys(prefix=self.prefix, start_after=self.last_key)
+        if not keys:
+            return 0
+
+        added = 0
+        for key in keys:
+            record = self.data_helper.get_json(key, immutable=True)
+            timestamp = record["timestamp"]
+            position = bisect.bisect_left(self.timestamps, timestamp)
+            if position < len(self.timestamps) and self.timestamps[position] == timestamp:
+                continue
+            record["total_assets"] = (
+                record["close"] * record["asset_wallet"] + record["usd_wallet"])
+            self.timestamps.insert(position, timestamp)
+            self.records.insert(position, record)
+            added += 1
+        self.last_key = keys[-1]
+        return added
+
+    def since(self, timestamp=None) -> pd.DataFrame:
+        """The records newer than `timestamp` (all of them when None)."""
+
+        position = 0
+        if timestamp is not None:
+            position = bisect.bisect_right(self.timestamps, timestamp)
+        return pd.DataFrame(self.records[position:])
+
+    @property
+    def history(self) -> pd.DataFrame:
+        return self.since(None)
@@ -0,0 +1,542 @@
+import logging
+import math
+import os
+
+import numpy as np
+from botocore.exceptions import ClientError
+from scipy.signal import lfilter
+
+# Columns of the lower-cased `processed_data.csv` each candle field is read
+# from when a dataset is transformed. The volume is the base currency's,
+# `volume_<base>` (`volume_eth`, `volume_btc`, ...), see `dataset_columns`.
+DATASET_COLUMNS = {
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "close": "currentclose",
+}
+VOLUME_COLUMN_PREFIX = "volume_"
+
+
+def dataset_columns(column_names) -> dict:
+    """
+    `DATASET_COLUMNS` plus the volume column of a dataset with
+    `column_names`: the first `volume_<base>` one, none if it has none.
+    """
+
+    columns = dict(DATASET_COLUMNS)
+    for column in column_names:
+        if str(column).startswith(VOLUME_COLUMN_PREFIX):
+            columns["volume"] = column
+            break
+    return columns
+
+
+def _ema_filter(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponential moving average `y[t] = alpha * x[t] + (1 - alpha) * y[t-1]`
+    seeded with `y[0] = x[0]`, in a single compiled pass.
+
+    `lfilter` evaluates exactly the products and the sum the incremental
+    update does, in the same order, so both agree bit for bit.
+    """
+
+    smoothed = np.empty(len(values))
+    if len(values) == 0:
+        return smoothed
+    decay = 1.0 - alpha
+    smoothed[0] = values[0]
+    smoothed[1:] = lfilter([alpha], [1.0, -decay], values[1:], zi=[decay * values[0]])[0]
+    return smoothed
+
+
+class Indicator(object):
+    """
+    A feature with two implementations that produce identical values:
+
+        batch(candles)          vectorized, over a whole chronological
+                                series, for training
+        update(state, candle)   one bar at a time from a small state of
+                                plain floats and lists (JSON serializable),
+                                for the live trader
+
+    Values that are not yet defined (not enough bars seen) are NaN in the
+    batch form and None from `update`.
+    """
+
+    kind = None
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def spec(self) -> dict:
+        """Keyword arguments that rebuild the indicator with `from_spec`."""
+        raise NotImplementedError
+
+    @property
+    def history(self) -> int:
+        """
+        Bars after which the value no longer depends materially on where
+        the series started, i.e. how much history a fresh state needs.
+        """
+        raise NotImplementedError
+
+    def batch(self, candles) -> np.ndarray:
+        """
+        :param candles: (pd.DataFrame) Chronological candles with the
+            columns `open, high, low, close, volume`.
+        :returns: (np.ndarray) One value per candle.
+        """
+        raise NotImplementedError
+
+    def initial_state(self) -> dict:
+        raise NotImplementedError
+
+    def update(self, state: dict, candle: dict) -> float:
+        """
+        Advances `state` (in place) by the next candle.
+
+        :returns: (float) The indicator at that candle, or None.
+        """
+        raise NotImplementedError
+
+
+class EMA(Indicator):
+    """Exponential moving average of a candle field, `alpha = 2 / (span + 1)`."""
+
+    kind = "ema"
+
+    def __init__(self, span: int = 12, column: str = "close"):
+        self.span = int(span)
+        self.column = column
+        self.alpha = 2.0 / (self.span + 1)
+
+    @property
+    def name(self) -> str:
+        if self.column == "close":
+            return f"ema_{self.span}"
+        return f"ema_{self.column}_{self.span}"
+
+    @property
+    def spec(self) -> dict:
+        return {"kind": self.kind, "span": self.span, "column": self.column}
+
+    @property
+    def history(self) -> int:
+        return 4 * self.span
+
+    def batch(self, candles) -> np.ndarray:
+        return _ema_filter(np.asarray(candles[self.column], dtype=float), self.alpha)
+
+    def initial_state(self) -> dict:
+        return {"ema": None}
+
+    def update(self, state: dict, candle: dict) -> float:
+        value = float(candle[self.column])
+        if state["ema"] is None:
+            state["ema"] = value
+        else:
+            state["ema"] = self.alpha * value + (1.0 - self.alpha) * state["ema"]
+        return state["ema"]
+
+
+class RSI(Indicator):
+    """
+    Relative strength index of the close, `100 * gain / (gain + loss)`
+    with Wilder smoothing (`alpha = 1 / period`) of the gains and losses,
+    seeded on the first close-to-close change. 50 when the price has not
+    moved at all.
+    """
+
+    kind = "rsi"
+
+    def __init__(self, period: int = 14):
+        self.period = int(period)
+        self.alpha = 1.0 / self.period
+
+    @property
+    def name(self) -> str:
+        return f"rsi_{self.period}"
+
+    @property
+    def spec(self) -> dict:
+        return {"kind": self.kind, "period": self.period}
+
+    @property
+    def history(self) -> int:
+        return 8 * self.period + 1
+
+    @staticmethod
+    def _rsi(average_gain, average_loss):
+        total = average_gain + average_loss
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, 100.0 * average_gain / total, 50.0)
+
+    def batch(self, candles) -> np.ndarray:
+        close = np.asarray(candles["close"], dtype=float)
+        values = np.full(len(close), np.nan)
+        if len(close) < 2:
+            return values
+        change = close[1:] - close[:-1]
+        average_gain = _ema_filter(np.maximum(change, 0.0), self.alpha)
+        average_loss = _ema_filter(np.maximum(-change, 0.0), self.alpha)
+        values[1:] = self._rsi(average_gain, average_loss)
+        return values
+
+    def initial_state(self) -> dict:
+        return {"close": None, "gain": None, "loss": None}
+
+    def update(self, state: dict, candle: dict) -> float:
+        close = float(candle["close"])
+        previous_close, state["close"] = state["close"], close
+        if previous_close is None:
+            return None
+
+        change = close - previous_close
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if state["gain"] is None:
+            state["gain"], state["loss"] = gain, loss
+        else:
+            decay = 1.0 - self.alpha
+            state["gain"] = self.alpha * gain + decay * state["gain"]
+            state["loss"] = self.alpha * loss + decay * state["loss"]
+        return float(self._rsi(state["gain"], state["loss"]))
+
+
+class RollingVolatility(Indicator):
+    """
+    Sample standard deviation of the last `window` close-to-close returns.
+
+    Both forms keep a running sum and sum of squares that add the newest
+    return and subtract the one leaving the window, so a bar costs O(1);
+    the batch form runs the same recurrence as a cumulative sum.
+    """
+
+    kind = "volatility"
+
+    def __init__(self, window: int = 24):
+        assert int(window) > 1, "The volatility window needs at least 2 returns"
+        self.window = int(window)
+
+    @property
+    def name(self) -> str:
+        return f"volatility_{self.window}"
+
+    @property
+    def spec(self) -> dict:
+        return {"kind": self.kind, "window": self.window}
+
+    @property
+    def history(self) -> int:
+        return self.window + 1
+
+    def _std(self, total, total_of_squares):
+        variance = (total_of_squares - total * total / self.window) / (self.window - 1)
+        return np.sqrt(np.maximum(variance, 0.0))
+
+    def batch(self, candles) -> np.ndarray:
+        close = np.asarray(candles["close"], dtype=float)
+        values = np.full(len(close), np.nan)
+        if len(close) <= self.window:
+            return values
+
+        returns = close[1:] / close[:-1] - 1.0
+        squares = returns * returns
+        added = returns.copy()
+        added[self.window:] = returns[self.window:] - returns[:-self.window]
+        added_squares = squares.copy()
+        added_squares[self.window:] = squares[self.window:] - squares[:-self.window]
+        total = np.cumsum(added)
+        total_of_squares = np.cumsum(added_squares)
+        values[self.window:] = self._std(total, total_of_squares)[self.window - 1:]
+        return values
+
+    def initial_state(self) -> dict:
+        return {"close": None, "returns": [], "total": 0.0, "total_of_squares": 0.0}
+
+    def update(self, state: dict, candle: dict) -> float:
+        close = float(candle["close"])
+        previous_close, state["close"] = state["close"], close
+        if previous_close is None:
+            return None
+
+        value = close / previous_close - 1.0
+        returns = state["returns"]
+        if len(returns) == self.window:
+            oldest = returns.pop(0)
+            state["total"] = state["total"] + (value - oldest)
+            state["total_of_squares"] = state["total_of_squares"] + (
+                value * value - oldest * oldest)
+        else:
+            state["total"] = state["total"] + value
+            state["total_of_squares"] = state["total_of_squares"] + value * value
+        returns.append(value)
+
+        if len(returns) < self.window:
+            return None
+        return float(self._std(state["total"], state["total_of_squares"]))
+
+
+class LaggedReturn(Indicator):
+    """Simple return of the close over the last `lag` bars."""
+
+    kind = "return"
+
+    def __init__(self, lag: int = 1):
+        assert int(lag) > 0, "The return lag must be positive"
+        self.lag = int(lag)
+
+    @property
+    def name(self) -> str:
+        return f"return_{self.lag}"
+
+    @property
+    def spec(self) -> dict:
+        return {"kind": self.kind, "lag": self.lag}
+
+    @property
+    def history(self) -> int:
+        return self.lag
+
+    def batch(self, candles) -> np.ndarray:
+        close = np.asarray(candles["close"], dtype=float)
+        values = np.full(len(close), np.nan)
+        values[self.lag:] = close[self.lag:] / close[:-self.lag] - 1.0
+        return values
+
+    def initial_state(self) -> dict:
+        return {"closes": []}
+
+    def update(self, state: dict, candle: dict) -> float:
+        close = float(candle["close"])
+        closes = state["closes"]
+        closes.append(close)
+        if len(closes) <= self.lag:
+            return None
+        return close / closes.pop(0) - 1.0
+
+
+INDICATORS = {
+    indicator.kind: indicator for indicator in [EMA, RSI, RollingVolatility, LaggedReturn]
+}
+
+
+def from_spec(spec: dict) -> Indicator:
+    """
+    Builds an indicator from a spec such as `{"kind": "ema", "span": 12}`.
+
+    """
+
+    spec = dict(spec)
+    kind = str(spec.pop("kind")).lower()
+    assert kind in INDICATORS, f"Unknown indicator {kind}, expected one of {list(INDICATORS)}"
+    return INDICATORS[kind](**spec)
+
+
+class FeatureSet(object):
+    """
+    An ordered list of indicators, appended to the model features in that
+    order, by `transform` at training time and by `update` in the trader.
+    """
+
+    def __init__(self, indicators: list):
+        self.indicators = list(indicators)
+        names = self.names
+        assert len(set(names)) == len(names), f"Duplicate features: {names}"
+
+    @classmethod
+    def from_specs(cls, specs: list):
+        """:param specs: (list) Indicator specs, see `from_spec`."""
+        return cls([from_spec(spec) for spec in specs])
+
+    @property
+    def names(self) -> list:
+        return [indicator.name for indicator in self.indicators]
+
+    @property
+    def specs(self) -> list:
+        return [indicator.spec for indicator in self.indicators]
+
+    @property
+    def history(self) -> int:
+        """Bars of history a fresh live state is warmed up on."""
+        return max([indicator.history for indicator in self.indicators], default=0)
+
+    def batch(self, candles):
+        """
+        :param candles: (pd.DataFrame) Chronological candles with the
+            columns `open, high, low, close, volume`.
+        :returns: (pd.DataFrame) One column per feature, on the same index.
+        """
+        # pandas is imported where it is used: the live trader only calls
+        # `update`, and the Lambda image does not install pandas.
+        import pandas as pd
+
+        return pd.DataFrame(
+            {indicator.name: indicator.batch(candles) for indicator in self.indicators},
+            index=candles.index,
+        )
+
+    def transform(
+        self,
+        dataset,
+        newest_first: bool = False,
+        columns: dict = None,
+    ):
+        """
+        Appends the features to `dataset` (a copy), after its existing
+        columns.
+
+        :param newest_first: (bool) The rows are in descending time order,
+            as in the processed cryptodatadownload files. Indicators are
+            always computed oldest to newest.
+        :param columns: (dict) Dataset column of each candle field,
+            `dataset_columns` by default.
+        """
+
+        import pandas as pd
+
+        columns = dataset_columns(dataset.columns) if columns is None else columns
+        candles = pd.DataFrame(
+            {field: dataset[column].values for field, column in columns.items()}
+        )
+        if newest_first:
+            candles = candles.iloc[::-1].reset_index(drop=True)
+
+        features = self.batch(candles)
+        if newest_first:
+            features = features.iloc[::-1]
+
+        dataset = dataset.copy()
+        for name in self.names:
+            dataset[name] = features[name].values
+        return dataset
+
+    def initial_state(self) -> dict:
+        return {
+            indicator.name: indicator.initial_state() for indicator in self.indicators
+        }
+
+    def update(self, state: dict, candle: dict) -> list:
+        """
+        Advances every indicator by one candle (a dict with `open, high,
+        low, close, volume`).
+
+        :returns: (list) The feature values, None where not yet defined.
+        """
+        return [
+            indicator.update(state[indicator.name], candle)
+            for indicator in self.indicators
+        ]
+
+    def check_consistency(self, candles) -> dict:
+        """
+        Runs both implementations over `candles` (chronological) and counts,
+        per feature, the candles where they disagree. Undefined values
+        only agree with undefined values.
+
+        :returns: (dict) Feature name to number of mismatching candles.
+        """
+
+        batch_values = self.batch(candles)
+        state = self.initial_state()
+        incremental_values = np.array(
+            [
+                [np.nan if value is None else value for value in self.update(state, candle)]
+                for candle in candles.to_dict("records")
+            ],
+            dtype=float,
+        ).reshape(len(candles), len(self.indicators))
+
+        mismatches = {}
+        for position, name in enumerate(self.names):
+            batch_column = batch_values[name].values
+            incremental_column = incremental_values[:, position]
+            same = (batch_column == incremental_column) | (
+                np.isnan(batch_column) & np.isnan(incremental_column))
+            mismatches[name] = int((~same).sum())
+        return mismatches
+
+
+class LiveFeatureState(object):
+    """
+    The incremental feature state of a deployed model, kept between
+    trader invocations as `<model_name>/feature_state.json`.
+
+    The state remembers the candle it was last advanced with. A repeated
+    candle returns the stored values without advancing; a candle that
+    does not directly follow it (first run, missed hours) means the state
+    has to be rebuilt with `warm_up` from recent history.
+    """
+
+    state_filename = "feature_state.json"
+
+    def __init__(self, feature_set: FeatureSet, granularity: int = 3600):
+        """
+        :param granularity: (int) Seconds between consecutive candles.
+        """
+        self.feature_set = feature_set
+        self.granularity = granularity
+        self.state = self._initial_state()
+
+    def _initial_state(self) -> dict:
+        return {
+            "specs": self.feature_set.specs,
+            "timestamp": None,
+            "values": None,
+            "indicators": self.feature_set.initial_state(),
+        }
+
+    def load(self, data_helper, model_name: str) -> None:
+        """Restores the stored state, unless it was built for other features."""
+
+        logger = logging.getLogger(__name__)
+        try:
+            state = data_helper.get_json(os.path.join(model_name, self.state_filename))
+        except (ClientError, FileNotFoundError):
+            logger.info("No feature state stored yet")
+            return
+        if state.get("specs") != self.feature_set.specs:
+            logger.info("Feature specs changed, discarding the stored feature state")
+            return
+        self.state = state
+
+    def save(self, data_helper, model_name: str) -> None:
+        data_helper.put_json(os.path.join(model_name, self.state_filename), self.state)
+
+    def needs_history(self, timestamp: int) -> bool:
+        """Whether the state cannot be advanced to the candle at `timestamp`."""
+
+        last_timestamp = self.state["timestamp"]
+        return last_timestamp is None or int(timestamp) - int(last_timestamp) not in (
+            0, self.granularity)
+
+    def warm_up(self, candles: list) -> None:
+        """
+        Rebuilds the state from `candles` (dicts with a `timestamp`,
+        oldest first), which should end right before the next candle.
+        """
+
+        self.state = self._initial_state()
+        for candle in candles:
+            self.observe(candle)
+
+    def observe(self, candle: dict) -> list:
+        """
+        :param candle: (dict) The candle, with its `timestamp`.
+        :returns: (list) The feature values at that candle, None where
+            there was not enough history.
+        """
+
+        timestamp = int(candle["timestamp"])
+        if self.state["timestamp"] == timestamp:
+            return self.state["values"]
+
+        values = self.feature_set.update(self.state["indicators"], candle)
+        self.state["values"] = [
+            None if value is None or math.isnan(value) else value for value in values
+        ]
+        self.state["timestamp"] = timestamp
+        return self.state["values"]
@@ -7,9 +7,17 @@ import pandas as pd
 import plotly
 from omegaconf import DictConfig
 from performance_analyzer import PerformanceAnalyzer
+from run_ranking import rank_runs
+
+from hourly_price_prediction.monitoring.profiler import PipelineProfiler
 
 
 def performance_pipeline(cfg: DictConfig):
+    profiler = PipelineProfiler(
+        enabled=cfg.profile.enabled,
+        trace_memory=cfg.profile.trace_memory,
+        capture_cprofile=cfg.profile.cprofile,
+    )
     path_to_model_metrics = os.path.join(
         cfg.data.base_directory, cfg.data.model_name, "model_metrics.csv"
     )
@@ -20,10 +28,11 @@ def performance_pipeline(cfg: DictConfig):
     for filepath in [path_to_model_metrics, path_to_trading_history]:
         assert os.path.isfile(filepath), f"File does not exist: {filepath}"
 
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=path_to_model_metrics,
-        path_to_trading_history=path_to_trading_history,
-    )
+    with profiler.stage("load"):
+        analyzer = PerformanceAnalyzer(
+            path_to_model_metrics=path_to_model_metrics,
+            path_to_trading_history=path_to_trading_history,
+        )
     analysis_directory = os.path.join(
         cfg.data.output_directory, cfg.data.model_name)
     figures_directory = os.path.join(
@@ -33,93 +42,139 @@ def performance_pipeline(cfg: DictConfig):
         if not os.path.exists(directory):
             os.makedirs(directory)
 
-    percentage_assets_html = analyzer.generate_line_plot(
-        y_array=analyzer.trading_history.total_assets.values
-        / analyzer.trading_history.total_assets.values[0],
-        x_axis_title="Hours",
-        y_axis_title="% Difference",
-        graph_title="% Change by Hour",
-        y_axis_unit=",.3%",
-    )
+    with profiler.stage("figures"):
+        percentage_assets_html = analyzer.generate_line_plot(
+            y_array=analyzer.trading_history.total_assets.values
+            / analyzer.trading_history.total_assets.values[0],
+            x_axis_title="Hours",
+            y_axis_title="% Difference",
+            graph_title="% Change by Hour",
+            y_axis_unit=",.3%",
+        )
 
-    percentage_asset_card = analyzer.generate_card(
-        percentage_assets_html,
-        "Total Assets [% Change]",
-    )
+        percentage_asset_card = analyzer.generate_card(
+            percentage_assets_html,
+            "Total Assets [% Change]",
+        )
 
-    current_total_assets = analyzer.trading_history.total_assets.values[-1]
-    initial_total_assets = analyzer.trading_history.total_assets.values[0]
-
-    current_values = [
-        current_total_assets,
-        analyzer.annualized_std(),
-        analyzer.asset_max,
-        analyzer.total_buys,
-        analyzer.total_sells,
-        analyzer.total_do_nothing,
-    ]
-    initial_values = [
-        initial_total_assets,
-        analyzer.annualized_std(),
-        analyzer.asset_min,
-        analyzer.total_buys,
-        analyzer.total_sells,
-        analyzer.total_do_nothing,
-    ]
-    texts = [
-        "Total Assets",
-        "Annualized STD",
-        "Total Asset Max vs Min",
-        "Total Buys",
-        "Total Sells",
-        "Total Do Nothings",
-    ]
-    units = ["$", "", "$", "", "", ""]
-    kpi_chart = analyzer.generate_kpi_plot(
-        current_values=current_values,
-        initial_values=initial_values,
-        texts=texts,
-        units=units,
+        current_total_assets = analyzer.trading_history.total_assets.values[-1]
+        initial_total_assets = analyzer.trading_history.total_assets.values[0]
+
+        current_values = [
+            current_total_assets,
+            analyzer.annualized_std(),
+            analyzer.asset_max,
+            analyzer.total_buys,
+            analyzer.total_sells,
+            analyzer.total_do_nothing,
+        ]
+        initial_values = [
+            initial_total_assets,
+            analyzer.annualized_std(),
+            analyzer.asset_min,
+            analyzer.total_buys,
+            analyzer.total_sells,
+            analyzer.total_do_nothing,
+        ]
+        texts = [
+            "Total Assets",
+            "Annualized STD",
+            "Total Asset Max vs Min",
+            "Total Buys",
+            "Total Sells",
+            "Total Do Nothings",
+        ]
+        units = ["$", "", "$", "", "", ""]
+        kpi_chart = analyzer.generate_kpi_plot(
+            current_values=current_values,
+            initial_values=initial_values,
+            texts=texts,
+            units=units,
+        )
+        kpi_card = analyzer.generate_card(kpi_chart, "KPIs")
+
+    with profiler.stage("save"):
+        body_style = f"margin:0 100; background:{cfg.html.background_color};"
+        html = """<html>
+            <head>
+                <link rel="stylesheet" href="{stylesheet}">
+                <style>body{body_style}</style>
+                <script src="{script}" integrity="{integrity}" crossorigin="{crossorigin}"></script>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="row">
+                        <div class="col-sm-12">
+                            <h1>{text}</h1>
+                        </div>
+                    </div>
+
+                    <div class="row"><div class="col-sm-12">{kpi_card}</div></div>
+                    <div class="row"><div class="col-sm-12">{percentage_asset_card}</div></div>
+
+
+                </div>
+            </body>
+        </html>""".format(
+            stylesheet=cfg.html.stylesheet,
+            script=cfg.html.js.script,
+            integrity=cfg.html.js.integrity,
+            crossorigin=cfg.html.js.crossorigin,
+            body_style=body_style,
+            text=cfg.data.model_name,
+            percentage_asset_card=percentage_asset_card,
+            kpi_card=kpi_card,
+        )
+        analysis_file = os.path.join(analysis_directory, "analysis.html")
+        with open(analysis_file, "w") as afile:
+            afile.write(html)
+            afile.close()
+
+    logging.info(f"Analysis written to {analysis_file}")
+
+    profiler.add_metadata(
+        model_name=cfg.data.model_name,
+        trading_history_rows=len(analyzer.trading_history),
     )
-    kpi_card = analyzer.generate_card(kpi_chart, "KPIs")
+    profile_file = profiler.save(analysis_directory)
+    if profile_file is not None:
+        logging.info(f"Pipeline Profile saved: {profile_file}")
+
+
+def ranking_pipeline(cfg: DictConfig):
+    """
+    Ranks every run under `data.base_directory` by `ranking.sort_by` and
+    writes the table as `run_ranking.csv` and `run_ranking.html`.
+    """
+
+    ranking = rank_runs(cfg.data.base_directory, sort_by=cfg.ranking.sort_by)
+
+    if not os.path.exists(cfg.data.output_directory):
+        os.makedirs(cfg.data.output_directory)
+    ranking.to_csv(os.path.join(cfg.data.output_directory, "run_ranking.csv"), index=None)
 
-    body_style = f"margin:0 100; background:{cfg.html.background_color};"
     html = """<html>
         <head>
             <link rel="stylesheet" href="{stylesheet}">
             <style>body{body_style}</style>
-            <script src="{script}" integrity="{integrity}" crossorigin="{crossorigin}"></script>
         </head>
         <body>
             <div class="container">
-                <div class="row">
-                    <div class="col-sm-12">
-                        <h1>{text}</h1>
-                    </div>
-                </div>
-
-                <div class="row"><div class="col-sm-12">{kpi_card}</div></div>
-                <div class="row"><div class="col-sm-12">{percentage_asset_card}</div></div>
-
-
+                <h1>Run Ranking by {sort_by}</h1>
+                {table}
             </div>
         </body>
     </html>""".format(
         stylesheet=cfg.html.stylesheet,
-        script=cfg.html.js.script,
-        integrity=cfg.html.js.integrity,
-        crossorigin=cfg.html.js.crossorigin,
-        body_style=body_style,
-        text=cfg.data.model_name,
-        percentage_asset_card=percentage_asset_card,
-        kpi_card=kpi_card,
+        body_style=f"margin:0 100; background:{cfg.html.background_color};",
+        sort_by=cfg.ranking.sort_by,
+        table=ranking.to_html(index=False, classes="table table-sm table-striped"),
     )
-    analysis_file = os.path.join(analysis_directory, "analysis.html")
-    with open(analysis_file, "w") as afile:
+    ranking_file = os.path.join(cfg.data.output_directory, "run_ranking.html")
+    with open(ranking_file, "w") as afile:
         afile.write(html)
         afile.close()
-
-    logging.info(f"Analysis written to {analysis_file}")
+    logging.info(f"Ranking of {len(ranking)} runs written to {ranking_file}")
 
 
 @hydra.main(config_path="../../configs/analyze", config_name="analyze_single")
@@ -130,6 +185,7 @@ def analyze_performance(cfg: DictConfig):
             "../../../data/model_results/*",
         )
 
+        ranking_pipeline(cfg)
         for model in models:
             cfg.data.model_name = model.split("/")[-1]
             performance_pipeline(cfg)
@@ -3,10 +3,17 @@ import time
 from datetime import datetime, timedelta
 
 import cbpro
+import numpy as np
 from urllib3.exceptions import ConnectionError, ProtocolError
 
+from hourly_price_prediction.models.tree_compiler import compile_model
+
 
 class AssetTrader(object):
+
+    # Candles Coinbase returns for one `get_product_historic_rates` call.
+    MAX_CANDLES_PER_REQUEST = 300
+
     def __init__(
         self,
         asset: str,
@@ -15,22 +22,39 @@ class AssetTrader(object):
         passphrase: str,
         pickle_file: str,
         use_sandbox: bool = True,
+        public_client=None,
+        private_client=None,
+        model=None,
     ):
+        """
+        `public_client` and `private_client` default to cbpro clients for
+        the Coinbase (sandbox) API. Any object exposing the same methods,
+        e.g. a `SimulatedExchange`, can be passed instead.
+
+        `model` is an already unpickled model; when given, `pickle_file` is
+        not read. Tree models are compiled into flat array predictors (see
+        `tree_compiler`) for single row predictions.
+        """
         self.asset = asset
         self.api_secret = api_secret
-        self.public_client = cbpro.PublicClient()
-        api_url = ""
-        if use_sandbox:
-            api_url = "https://api-public.sandbox.pro.coinbase.com"
-        else:
-            api_url = "https://api.pro.coinbase.com"
+        if public_client is None:
+            public_client = cbpro.PublicClient()
+        self.public_client = public_client
 
-        self.private_client = cbpro.AuthenticatedClient(
-            key=api_key,
-            b64secret=api_secret.encode(),
-            passphrase=passphrase,
-            api_url=api_url,
-        )
+        if private_client is None:
+            api_url = ""
+            if use_sandbox:
+                api_url = "https://api-public.sandbox.pro.coinbase.com"
+            else:
+                api_url = "https://api.pro.coinbase.com"
+
+            private_client = cbpro.AuthenticatedClient(
+                key=api_key,
+                b64secret=api_secret.encode(),
+                passphrase=passphrase,
+                api_url=api_url,
+            )
+        self.private_client = private_client
         self.accounts = self.private_client.get_accounts()
         try:
             for account in self.accounts:
@@ -41,9 +65,20 @@ class AssetTrader(object):
         except TypeError as e:
             print(f'Error retrieving account information: {self.accounts}\n{e}')
 
-        with open(pickle_file, 'rb') as pfile:
-            self.model = pickle.load(pfile)
-            pfile.close()
+        if model is None:
+            with open(pickle_file, 'rb') as pfile:
+                model = pickle.load(pfile)
+                pfile.close()
+        self.model = model
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self.compiled_model = compile_model(model)
 
     def _get_start_end_iso_times(self, hours: int = 1):
         """
@@ -84,16 +119,54 @@ class AssetTrader(object):
                 product_id=self.asset, start=start, end=end, granularity=granularity
             )
         
-        historic_dataset = {
-            'timestamp': historic_data[0][0],
-            'open': historic_data[0][1],
-            'high': historic_data[0][2],
-            'low': historic_data[0][3],
-            'close': historic_data[0][4],
-            'volume': historic_data[0][5]
+        return self._candle_details(historic_data[0])
+
+    @staticmethod
+    def _candle_details(candle: list) -> dict:
+        """Maps one row of `get_product_historic_rates` to named fields."""
+
+        return {
+            'timestamp': candle[0],
+            'open': candle[1],
+            'high': candle[2],
+            'low': candle[3],
+            'close': candle[4],
+            'volume': candle[5]
         }
 
-        return historic_dataset
+    def get_asset_history(self, start: str, end: str, granularity: int = 3600):
+        """
+        Retrieves every candle for the given asset between start and end,
+        e.g. to warm up indicator features. Coinbase returns at most
+        `MAX_CANDLES_PER_REQUEST` candles per request, so longer ranges are
+        requested page by page, newest first.
+
+        :param start: (str) ISO-8601 formatted timestamp.
+        :param end: (str) ISO-8601 formatted timestamp.
+        :returns: (list) Candle dicts, oldest first.
+        """
+        start_datetime = datetime.fromisoformat(start)
+        page_end = datetime.fromisoformat(end)
+        page_length = timedelta(seconds=granularity * (self.MAX_CANDLES_PER_REQUEST - 1))
+
+        candles = {}
+        while True:
+            page_start = max(start_datetime, page_end - page_length)
+            historic_data = self.public_client.get_product_historic_rates(
+                product_id=self.asset,
+                start=page_start.isoformat(),
+                end=page_end.isoformat(),
+                granularity=granularity,
+            )
+            if isinstance(historic_data, dict):
+                raise ValueError(f"Unable to retrieve the asset history: {historic_data}")
+            # Pages share their boundary candle.
+            for candle in historic_data:
+                candles[candle[0]] = candle
+            if page_start <= start_datetime:
+                break
+            page_end = page_start
+        return [self._candle_details(candles[timestamp]) for timestamp in sorted(candles)]
 
     def get_account_balance(self, account_id: str):
         """Retrieves the account balance for a given account_id"""
@@ -108,10 +181,21 @@ class AssetTrader(object):
         low_: float,
         close_: float,
         asset_volume_: float,
+        extra_features: list = None,
     ):
-        """Uses self.model to predict the close price 1-hour from now."""
+        """
+        Uses self.model to predict the close price 1-hour from now, or the
+        closes of every hour of its horizon for a multi-horizon model (an
+        array of shape (1, horizon)), in a single call.
+        `extra_features` (e.g. indicator values) follow the candle fields,
+        in the order the model was trained with.
+        """
 
         batch = [open_, high_, low_, close_, asset_volume_]
+        if extra_features:
+            batch.extend(extra_features)
+        if self.compiled_model is not None:
+            return np.asarray([self.compiled_model.predict_one(batch)])
         model_prediction = self.model.predict([batch])
         return model_prediction
 
@@ -162,8 +246,13 @@ class AssetTrader(object):
         If action is buy, amount is the amount of USD to spend.
         If action is sell, amount is the amount of Asset to sell.
         If action is do_nothing, amount is 0.0.
+
+        `model_prediction` can also be the predicted closes over several
+        hours, in which case the strategy acts on their average.
         """
 
+        model_prediction = float(np.mean(model_prediction))
+
         # threshold_to_act = validation_metrics['mae'] / 3
         action = "do_nothing"
         if abs(model_prediction - current_close_price) > threshold_to_act:
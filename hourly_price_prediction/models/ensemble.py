@@ -0,0 +1,207 @@
+import numpy as np
+from scipy.optimize import nnls
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import (BayesianRidge, ElasticNet, HuberRegressor,
+                                  LinearRegression, Ridge)
+from sklearn.model_selection import train_test_split
+
+from hourly_price_prediction.models.online import OnlineSGDRegressor
+
+# The model classes `train_all_models` trains.
+DEFAULT_MEMBERS = [
+    "linearregressor",
+    "gradientboostingregressor",
+    "decisiontreeregressor",
+    "kneighborsregressor",
+    "mlpregressor",
+    "ridge",
+    "elasticnet",
+    "bayesianridge",
+    "huberregressor",
+]
+
+# Models whose `predict` is exactly `features @ coef_ + intercept_`.
+LINEAR_MODELS = (LinearRegression, Ridge, ElasticNet, BayesianRidge, HuberRegressor)
+
+
+def affine_coefficients(model) -> tuple:
+    """
+    Writes a fitted single-output model that is affine in its features as
+    `predict(X) = X @ coef + intercept`.
+
+    :returns: tuple(coef, intercept), or None for a non-linear model.
+    """
+
+    if isinstance(model, LINEAR_MODELS):
+        coef = np.asarray(model.coef_, dtype=float).reshape(-1)
+        intercept = float(np.asarray(model.intercept_, dtype=float).reshape(-1)[0])
+        return (coef, intercept)
+
+    if isinstance(model, OnlineSGDRegressor):
+        # close + ((X - mean) / scale @ coef + intercept) * target_scale
+        coef = model.coef_ / model.feature_scale_ * model.target_scale_
+        intercept = (
+            model.intercept_ - float(model.feature_mean_ / model.feature_scale_ @ model.coef_)
+        ) * model.target_scale_
+        coef = coef.copy()
+        coef[model.close_index] += 1.0
+        return (coef, float(intercept))
+
+    return None
+
+
+class StackedEnsemble(BaseEstimator, RegressorMixin):
+    """
+    Weighted combination of several next-close regressors, fitted and
+    served as a single model.
+
+    Members that are affine in the features (the linear family) are
+    stacked into one `(n_features, n_linear)` coefficient matrix, so all of
+    them are scored with a single matmul. The non-linear members each
+    predict the whole batch in one call.
+
+    `fit` holds out `holdout_fraction` of the training rows, fits every
+    member on the rest and learns non-negative combination weights from
+    the members' predictions on the holdout (NNLS). Members are then refit
+    on all rows. Because the weighted sum of affine models is affine,
+    `predict` collapses the linear members into one coefficient vector and
+    skips the members that received no weight.
+    """
+
+    def __init__(
+        self,
+        members: list = None,
+        member_params: dict = None,
+        holdout_fraction: float = 0.2,
+        refit: bool = True,
+        random_state: int = 43,
+    ):
+        """
+        :param members: (list) Model classes, as accepted by `get_model_class`;
+            `DEFAULT_MEMBERS` when None.
+        :param member_params: (dict) Keyword arguments per model class.
+        :param holdout_fraction: (float) Share of the training rows the
+            combination weights are learned on.
+        :param refit: (bool) Refit the members on every training row once
+            the weights are known.
+        """
+        self.members = members
+        self.member_params = member_params
+        self.holdout_fraction = holdout_fraction
+        self.refit = refit
+        self.random_state = random_state
+
+    def _fit_members(self, features: np.ndarray, targets: np.ndarray) -> list:
+        from hourly_price_prediction.models.utils import build_model
+
+        member_params = self.member_params or {}
+        return [
+            build_model(member, member_params.get(member, {})).fit(features, targets)
+            for member in self.member_names_
+        ]
+
+    def _set_estimators(self, estimators: list) -> None:
+        """Splits fitted members into the stacked linear block and the rest."""
+
+        self.estimators_ = estimators
+        self.linear_index_, self.nonlinear_index_ = [], []
+        coefficients, intercepts = [], []
+        for index, estimator in enumerate(estimators):
+            affine = affine_coefficients(estimator)
+            if affine is None:
+                self.nonlinear_index_.append(index)
+            else:
+                self.linear_index_.append(index)
+                coefficients.append(affine[0])
+                intercepts.append(affine[1])
+
+        if coefficients:
+            self.coef_matrix_ = np.column_stack(coefficients)
+            self.intercepts_ = np.asarray(intercepts)
+        else:
+            self.coef_matrix_, self.intercepts_ = None, None
+
+    def _set_weights(self, weights: np.ndarray) -> None:
+        self.weights_ = np.asarray(weights, dtype=float)
+        if self.coef_matrix_ is not None:
+            linear_weights = self.weights_[self.linear_index_]
+            self.coef_ = self.coef_matrix_ @ linear_weights
+            self.intercept_ = float(self.intercepts_ @ linear_weights)
+        else:
+            self.coef_, self.intercept_ = None, 0.0
+
+    def fit(self, features, targets):
+        features = np.asarray(features, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        if targets.ndim != 1:
+            raise ValueError("StackedEnsemble predicts a single horizon, got 2D targets")
+        self.member_names_ = list(self.members or DEFAULT_MEMBERS)
+
+        (
+            member_features,
+            holdout_features,
+            member_targets,
+            holdout_targets,
+        ) = train_test_split(
+            features, targets, test_size=self.holdout_fraction, random_state=self.random_state
+        )
+        self._set_estimators(self._fit_members(member_features, member_targets))
+        self.fit_weights(holdout_features, holdout_targets)
+
+        if self.refit:
+            self._set_estimators(self._fit_members(features, targets))
+            self._set_weights(self.weights_)
+        return self
+
+    @classmethod
+    def from_fitted(cls, estimators: dict):
+        """
+        Builds an ensemble from already trained models (e.g. unpickled
+        artifacts); call `fit_weights` on validation data before predicting.
+
+        :param estimators: (dict) Member name -> fitted model.
+        """
+
+        ensemble = cls(members=list(estimators))
+        ensemble.member_names_ = list(estimators)
+        ensemble._set_estimators(list(estimators.values()))
+        return ensemble
+
+    def fit_weights(self, features, targets):
+        """Learns the non-negative combination weights on validation data."""
+
+        member_predictions = self.member_predictions(features)
+        weights, _ = nnls(member_predictions, np.asarray(targets, dtype=float))
+        self._set_weights(weights)
+        return self
+
+    @property
+    def weights(self) -> dict:
+        """Member name -> combination weight."""
+        return dict(zip(self.member_names_, self.weights_.tolist()))
+
+    def member_predictions(self, features) -> np.ndarray:
+        """
+        Every member's prediction, the linear ones from a single matmul.
+
+        :returns: (np.ndarray) Shape (n_rows, n_members), in member order.
+        """
+
+        features = np.asarray(features, dtype=float)
+        predictions = np.empty((len(features), len(self.estimators_)))
+        if self.linear_index_:
+            predictions[:, self.linear_index_] = (
+                features @ self.coef_matrix_ + self.intercepts_)
+        for index in self.nonlinear_index_:
+            predictions[:, index] = self.estimators_[index].predict(features)
+        return predictions
+
+    def predict(self, features) -> np.ndarray:
+        features = np.asarray(features, dtype=float)
+        predictions = np.full(len(features), self.intercept_)
+        if self.coef_ is not None:
+            predictions += features @ self.coef_
+        for index in self.nonlinear_index_:
+            if self.weights_[index] > 0:
+                predictions += self.weights_[index] * self.estimators_[index].predict(features)
+        return predictions
@@ -0,0 +1,325 @@
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import hydra
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig, OmegaConf
+from run_cache import file_fingerprint
+from sklearn.metrics import mean_absolute_error
+from utils import (add_features, build_model, save_model_artifacts,
+                   save_training_results, strategy_simulation,
+                   train_test_val_split, training_pipeline)
+
+_worker_data = {}
+
+
+def sample_candidates(param_space: dict, n_candidates: int, random_state: int = 43) -> list:
+    """
+    Draws `n_candidates` hyperparameter configurations from `param_space`.
+
+    Every entry of `param_space` is either a list of choices, or a range
+    written as {low, high} with optional `log: true` (sample on a log
+    scale) and `type: int`.
+
+    :returns: (list) Configurations, as dictionaries of keyword arguments.
+    """
+
+    rng = np.random.default_rng(random_state)
+    candidates = []
+    for _ in range(n_candidates):
+        candidate = {}
+        for name, space in param_space.items():
+            if isinstance(space, dict):
+                low, high = float(space["low"]), float(space["high"])
+                if space.get("log", False):
+                    value = math.exp(rng.uniform(math.log(low), math.log(high)))
+                else:
+                    value = rng.uniform(low, high)
+                if space.get("type", "float") == "int":
+                    value = int(round(value))
+                candidate[name] = value
+            else:
+                choice = space[rng.integers(len(space))]
+                candidate[name] = tuple(choice) if isinstance(choice, list) else choice
+        candidates.append(candidate)
+    return candidates
+
+
+def _initialize_worker(train_features, train_targets, validation_features, validation_targets):
+    """Keeps one copy of the data in each worker instead of one per task."""
+
+    _worker_data["train_features"] = train_features
+    _worker_data["train_targets"] = train_targets
+    _worker_data["validation_features"] = validation_features
+    _worker_data["validation_targets"] = validation_targets
+
+
+def _evaluate_candidate(
+    model_class: str, candidate_id: int, params: dict, n_rows: int, horizon: int = 1
+) -> dict:
+    """Fits one candidate on the first `n_rows` training rows and scores it."""
+
+    fit_start = time.perf_counter()
+    model = build_model(model_class, params, horizon)
+    model.fit(
+        _worker_data["train_features"][:n_rows],
+        _worker_data["train_targets"][:n_rows],
+    )
+    fit_seconds = time.perf_counter() - fit_start
+
+    validation_predictions = model.predict(_worker_data["validation_features"])
+    return {
+        "model_class": model_class,
+        "candidate_id": candidate_id,
+        "params": params,
+        "n_rows": n_rows,
+        "val_mae": mean_absolute_error(
+            _worker_data["validation_targets"], validation_predictions
+        ),
+        "fit_seconds": fit_seconds,
+    }
+
+
+def successive_halving(
+    executor,
+    model_class: str,
+    candidates: list,
+    number_of_training_rows: int,
+    min_resource: float = 0.1,
+    eta: int = 3,
+    bracket: int = 0,
+    horizon: int = 1,
+) -> list:
+    """
+    Races `candidates` on growing slices of the training data. Each rung
+    fits every surviving candidate on `min_resource * eta**rung` of the
+    rows and keeps the best `1/eta` by validation MAE, so weak
+    configurations are stopped after a cheap fit on a small slice.
+
+    :param executor: An Executor whose workers were set up with
+        `_initialize_worker`.
+    :returns: (list) Every evaluation, tagged with its bracket and rung.
+    """
+
+    logger = logging.getLogger(__name__)
+    evaluations = []
+    survivors = list(enumerate(candidates))
+    resource = min_resource
+    rung = 0
+    while survivors:
+        resource = min(resource, 1.0)
+        n_rows = max(int(number_of_training_rows * resource), 1)
+        futures = [
+            executor.submit(
+                _evaluate_candidate, model_class, candidate_id, params, n_rows, horizon)
+            for candidate_id, params in survivors
+        ]
+        rung_results = [future.result() for future in futures]
+        for result in rung_results:
+            result.update({"bracket": bracket, "rung": rung})
+        evaluations.extend(rung_results)
+
+        rung_results.sort(key=lambda result: result["val_mae"])
+        logger.info(
+            f"{model_class} bracket {bracket} rung {rung}: {len(rung_results)} candidates"
+            f" on {n_rows} rows, best val MAE {rung_results[0]['val_mae']:.5f}"
+        )
+        if resource >= 1.0 or len(rung_results) == 1:
+            break
+
+        number_to_keep = max(len(rung_results) // eta, 1)
+        survivors = [
+            (result["candidate_id"], result["params"])
+            for result in rung_results[:number_to_keep]
+        ]
+        resource *= eta
+        rung += 1
+
+    return evaluations
+
+
+def hyperband(
+    executor,
+    model_class: str,
+    param_space: dict,
+    number_of_training_rows: int,
+    min_resource: float = 0.1,
+    eta: int = 3,
+    random_state: int = 43,
+    horizon: int = 1,
+) -> list:
+    """
+    Runs successive halving in several brackets that trade the number of
+    candidates against the data slice they start on, from many candidates
+    on `min_resource` of the rows down to a few on all of them.
+
+    :returns: (list) Every evaluation across all brackets.
+    """
+
+    max_bracket = int(math.floor(math.log(1.0 / min_resource, eta) + 1e-9))
+    evaluations = []
+    candidate_offset = 0
+    for bracket in range(max_bracket, -1, -1):
+        n_candidates = int(math.ceil((max_bracket + 1) / (bracket + 1) * eta ** bracket))
+        candidates = sample_candidates(
+            param_space, n_candidates, random_state=random_state + bracket
+        )
+        bracket_evaluations = successive_halving(
+            executor,
+            model_class,
+            candidates,
+            number_of_training_rows,
+            min_resource=eta ** -bracket,
+            eta=eta,
+            bracket=bracket,
+            horizon=horizon,
+        )
+        for evaluation in bracket_evaluations:
+            evaluation["candidate_id"] += candidate_offset
+        candidate_offset += n_candidates
+        evaluations.extend(bracket_evaluations)
+    return evaluations
+
+
+def best_full_resource_candidate(evaluations: list) -> dict:
+    """The lowest validation MAE among candidates fitted on the most rows."""
+
+    most_rows = max(evaluation["n_rows"] for evaluation in evaluations)
+    finalists = [e for e in evaluations if e["n_rows"] == most_rows]
+    return min(finalists, key=lambda evaluation: evaluation["val_mae"])
+
+
+@hydra.main(config_path="../../configs/models", config_name="search_config")
+def search_hyperparameters(cfg: DictConfig) -> None:
+
+    assert os.path.isfile(
+        cfg.data.csv_file
+    ), f"CSV File passed does not exist: {cfg.data.csv_file}"
+    dataset = pd.read_csv(cfg.data.csv_file)
+    dataset.columns = [column.lower() for column in dataset.columns]
+    feature_specs = OmegaConf.to_container(cfg.features.indicators, resolve=True)
+    if feature_specs:
+        dataset = add_features(
+            dataset,
+            feature_specs,
+            newest_first=cfg.features.newest_first,
+            verify=cfg.features.verify,
+        )
+
+    (
+        train_features,
+        train_targets,
+        validation_features,
+        validation_targets,
+        test_features,
+        test_targets,
+    ) = train_test_val_split(
+        dataset,
+        test_period_in_days=cfg.model.test_period_in_days,
+        validation_percentage=cfg.model.validation_percentage,
+        target_variable=cfg.model.target_variable,
+        horizon=cfg.model.horizon,
+    )
+
+    param_spaces = OmegaConf.to_container(cfg.search.param_spaces, resolve=True)
+    executor = ProcessPoolExecutor(
+        max_workers=cfg.search.max_workers,
+        initializer=_initialize_worker,
+        initargs=(
+            train_features.values,
+            train_targets.values,
+            validation_features.values,
+            validation_targets.values,
+        ),
+    )
+    with executor:
+        for model_class in cfg.search.model_classes:
+            assert model_class in param_spaces, f"No parameter space for {model_class}"
+            search_start = time.perf_counter()
+            if cfg.search.method == "hyperband":
+                evaluations = hyperband(
+                    executor,
+                    model_class,
+                    param_spaces[model_class],
+                    len(train_features),
+                    min_resource=cfg.search.min_resource,
+                    eta=cfg.search.eta,
+                    random_state=cfg.search.random_state,
+                    horizon=cfg.model.horizon,
+                )
+            elif cfg.search.method == "successive_halving":
+                evaluations = successive_halving(
+                    executor,
+                    model_class,
+                    sample_candidates(
+                        param_spaces[model_class],
+                        cfg.search.n_candidates,
+                        random_state=cfg.search.random_state,
+                    ),
+                    len(train_features),
+                    min_resource=cfg.search.min_resource,
+                    eta=cfg.search.eta,
+                    horizon=cfg.model.horizon,
+                )
+            else:
+                raise AssertionError(
+                    f"Invalid search method passed to --search.method: {cfg.search.method}")
+
+            best = best_full_resource_candidate(evaluations)
+            logging.info(
+                f"{model_class}: {len(evaluations)} fits in"
+                f" {round(time.perf_counter() - search_start, 2)}s,"
+                f" best val MAE {best['val_mae']:.5f} with {best['params']}"
+            )
+
+            model = build_model(model_class, best["params"], cfg.model.horizon)
+            train_metrics, validation_metrics, test_metrics = training_pipeline(
+                model,
+                train_features,
+                train_targets,
+                validation_features,
+                validation_targets,
+                test_features,
+                test_targets,
+            )
+            trading_history, percentage_gain_lost = strategy_simulation(
+                model, test_features, validation_metrics
+            )
+            logging.info(
+                f"Total Gain/Loss after testing: {round(percentage_gain_lost*100, 5)}%"
+            )
+
+            base_model_name = "{}-{}".format(model_class, time.strftime("%Y%m%dT%H%M%S"))
+            results_directory = save_training_results(
+                cfg.data.directory_to_save_training_results_in,
+                base_model_name,
+                trading_history,
+                [train_metrics, validation_metrics, test_metrics],
+                hyperparameters=best["params"],
+            )
+            pd.DataFrame(evaluations).to_csv(
+                os.path.join(results_directory, "search_history.csv"), index=None
+            )
+            if cfg.model.save_artifacts:
+                save_model_artifacts(
+                    cfg.data.directory_to_save_models_in,
+                    base_model_name,
+                    model,
+                    validation_metrics,
+                    bucket=cfg.aws.bucket,
+                    model_class=model_class,
+                    data_fingerprint=file_fingerprint(cfg.data.csv_file),
+                    metrics=[train_metrics, validation_metrics, test_metrics],
+                    feature_specs=feature_specs,
+                    region_name=cfg.aws.region_name,
+                )
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    search_hyperparameters()
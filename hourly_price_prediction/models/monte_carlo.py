@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator
+
+# Paths simulated per task; chunks are seeded independently, so results do
+# not depend on how many processes run them.
+PATHS_PER_CHUNK = 1000
+
+SUMMARY_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def trading_signals(model: BaseEstimator, test_dataset: pd.DataFrame) -> np.ndarray:
+    """
+    The action `strategy_simulation` takes at every row of `test_dataset`:
+    1 buy, -1 sell, 0 do nothing.
+
+    :returns: (np.ndarray) Shape (n_rows,).
+    """
+
+    model_predictions = np.asarray(model.predict(test_dataset.values))
+    if model_predictions.ndim == 2:
+        model_predictions = model_predictions.mean(axis=1)
+    return np.sign(model_predictions - test_dataset["currentclose"].values).astype(np.int8)
+
+
+def block_bootstrap_indices(
+    n_steps: int, n_paths: int, block_length: int = 24, random_state=None
+) -> np.ndarray:
+    """
+    Moving block bootstrap of the hours 1..n_steps-1 (the ones with a
+    return): every path is a concatenation of randomly placed runs of
+    `block_length` consecutive hours, which keeps the autocorrelation of
+    returns and signals within a block.
+
+    :returns: (np.ndarray) Row indices, shape (n_paths, n_steps).
+    """
+
+    if n_steps < 2:
+        # No return to resample: every path is the test period as it is.
+        return np.zeros((n_paths, n_steps), dtype=np.int64)
+    rng = np.random.default_rng(random_state)
+    block_length = max(1, min(block_length, n_steps - 1))
+    n_blocks = -(-n_steps // block_length)
+    starts = rng.integers(1, n_steps - block_length + 1, size=(n_paths, n_blocks))
+    indices = starts[:, :, None] + np.arange(block_length)
+    return indices.reshape(n_paths, -1)[:, :n_steps]
+
+
+def simulate_paths(
+    closes: np.ndarray,
+    signals: np.ndarray,
+    initial_money: float = 100,
+    percent_of_total_money_to_move: float = 0.10,
+) -> dict:
+    """
+    Runs the `strategy_simulation` trading rules on every path at once,
+    one vectorized step per hour. A path stops trading once it has no
+    money left, like `strategy_simulation` does.
+
+    :param closes: (np.ndarray) Close prices, shape (n_paths, n_steps).
+    :param signals: (np.ndarray) Actions (1 buy, -1 sell, 0 nothing),
+        same shape.
+    :returns: (dict) Per path arrays: final_assets, max_drawdown, n_trades.
+    """
+
+    n_paths, n_steps = closes.shape
+    total_money = np.full(n_paths, float(initial_money))
+    asset_wallet_balance = np.zeros(n_paths)
+    total_assets = np.full(n_paths, float(initial_money))
+    peak_assets = np.zeros(n_paths)
+    max_drawdown = np.zeros(n_paths)
+    n_trades = np.zeros(n_paths, dtype=np.int64)
+
+    for step in range(n_steps):
+        current_close = closes[:, step]
+        active = total_money > 0
+        buy = active & (signals[:, step] > 0)
+        sell = active & (signals[:, step] < 0)
+
+        amount_of_usd_to_exchange = percent_of_total_money_to_move * total_money
+        amount_of_asset_to_exchange = amount_of_usd_to_exchange / current_close
+
+        sold = np.where(
+            sell, np.minimum(amount_of_asset_to_exchange, asset_wallet_balance), 0.0)
+        total_money += sold * current_close
+        asset_wallet_balance -= sold
+
+        total_money -= np.where(
+            buy, np.minimum(amount_of_usd_to_exchange, total_money), 0.0)
+        asset_wallet_balance += np.where(buy, amount_of_asset_to_exchange, 0.0)
+
+        total_assets = np.where(
+            active, asset_wallet_balance * current_close + total_money, total_assets)
+        n_trades += buy | (sold > 0)
+
+        peak_assets = np.maximum(peak_assets, total_assets)
+        max_drawdown = np.maximum(max_drawdown, 1.0 - total_assets / peak_assets)
+
+    return {
+        "final_assets": total_assets,
+        "max_drawdown": max_drawdown,
+        "n_trades": n_trades,
+    }
+
+
+def _simulate_chunk(
+    closes: np.ndarray,
+    signals: np.ndarray,
+    n_paths: int,
+    block_length: int,
+    seed: np.random.SeedSequence,
+    initial_money: float,
+    percent_of_total_money_to_move: float,
+) -> dict:
+    """Resamples and simulates `n_paths` paths."""
+
+    indices = block_bootstrap_indices(len(closes), n_paths, block_length, seed)
+    if len(closes) < 2:
+        path_closes = closes[indices]
+    else:
+        returns = closes[1:] / closes[:-1]
+        path_closes = closes[0] * np.cumprod(returns[indices - 1], axis=1)
+    return simulate_paths(
+        path_closes, signals[indices], initial_money, percent_of_total_money_to_move)
+
+
+def monte_carlo_simulation(
+    model: BaseEstimator,
+    test_dataset: pd.DataFrame,
+    n_paths: int = 1000,
+    block_length: int = 24,
+    initial_money: int = 100,
+    percent_of_total_money_to_move: float = 0.10,
+    random_state: int = 43,
+    max_workers: int = None,
+) -> tuple:
+    """
+    Stress tests the `strategy_simulation` strategy on `n_paths` price
+    paths resampled from the test period.
+
+    The model predicts the test set once. Hourly returns are then block
+    bootstrapped together with the model's action at that hour, so each
+    path keeps the relation between what the model said and what the price
+    did next. Paths are simulated in chunks of `PATHS_PER_CHUNK`, spread
+    over `max_workers` processes when there is more than one chunk.
+
+    :returns: tuple(paths, summary) A DataFrame with one row per path
+        (final_assets, percentage_gain_lost, max_drawdown, n_trades) and a
+        dictionary summarizing their distribution.
+    """
+
+    logger = logging.getLogger(__name__)
+    closes = test_dataset["currentclose"].values.astype(float)
+    signals = trading_signals(model, test_dataset)
+
+    chunk_sizes = [
+        min(PATHS_PER_CHUNK, n_paths - start) for start in range(0, n_paths, PATHS_PER_CHUNK)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(chunk_sizes))
+    chunk_arguments = [
+        (closes, signals, chunk_size, block_length, seed, initial_money,
+         percent_of_total_money_to_move)
+        for chunk_size, seed in zip(chunk_sizes, seeds)
+    ]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(chunk_arguments))
+    if max_workers > 1:
+        logger.info(f"Simulating {n_paths} paths on {max_workers} processes")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, *zip(*chunk_arguments)))
+    else:
+        chunks = [_simulate_chunk(*arguments) for arguments in chunk_arguments]
+
+    paths = pd.DataFrame({
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in ["final_assets", "max_drawdown", "n_trades"]
+    })
+    paths.insert(
+        1, "percentage_gain_lost", (paths["final_assets"] - initial_money) / initial_money)
+
+    summary = {
+        "n_paths": n_paths,
+        "block_length": block_length,
+        "mean_final_assets": float(paths["final_assets"].mean()),
+        "probability_of_loss": float((paths["final_assets"] < initial_money).mean()),
+        "mean_max_drawdown": float(paths["max_drawdown"].mean()),
+        "worst_max_drawdown": float(paths["max_drawdown"].max()),
+        "mean_n_trades": float(paths["n_trades"].mean()),
+    }
+    for quantile in SUMMARY_QUANTILES:
+        summary[f"final_assets_p{int(quantile * 100)}"] = float(
+            paths["final_assets"].quantile(quantile))
+        summary[f"max_drawdown_p{int(quantile * 100)}"] = float(
+            paths["max_drawdown"].quantile(quantile))
+
+    return (paths, summary)
+
+
+def save_monte_carlo_results(results_directory: str, paths: pd.DataFrame, summary: dict) -> None:
+    """
+    Writes `monte_carlo_paths.csv` and `monte_carlo_summary.json` next to
+    a run's trading history.
+    """
+    logger = logging.getLogger(__name__)
+    paths.to_csv(os.path.join(results_directory, "monte_carlo_paths.csv"), index=None)
+    with open(os.path.join(results_directory, "monte_carlo_summary.json"), "w") as jfile:
+        jfile.write(json.dumps(summary))
+        jfile.close()
+    logger.info("Monte Carlo Results Saved")
@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import os
+import pickle
+
+import numpy as np
+from botocore.exceptions import ClientError
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import SGDRegressor
+
+
+class OnlineSGDRegressor(BaseEstimator, RegressorMixin):
+    """
+    Linear next-close regressor that can keep learning one candle at a time.
+
+    The batch `fit` standardises the features, models the next close as an
+    offset from the current close (so the target is on the same scale
+    whatever the price level) and trains an `SGDRegressor`. Afterwards the
+    weights live in two small arrays and `partial_fit` applies a plain
+    squared-loss SGD step in numpy, which costs microseconds per candle.
+    """
+
+    def __init__(
+        self,
+        close_index: int = 3,
+        alpha: float = 0.0001,
+        eta0: float = 0.01,
+        power_t: float = 0.25,
+        max_iter: int = 1000,
+        tol: float = 1e-3,
+        online_learning_rate: float = 0.001,
+        random_state: int = 43,
+    ):
+        """
+        :param close_index: (int) Column of the current close in the features.
+        :param alpha: (float) L2 penalty, for the batch fit and the online steps.
+        :param eta0: (float) Initial learning rate of the batch fit.
+        :param power_t: (float) Inverse scaling exponent of the batch fit.
+        :param online_learning_rate: (float) Constant step size of `partial_fit`.
+        """
+        self.close_index = close_index
+        self.alpha = alpha
+        self.eta0 = eta0
+        self.power_t = power_t
+        self.max_iter = max_iter
+        self.tol = tol
+        self.online_learning_rate = online_learning_rate
+        self.random_state = random_state
+
+    def _scaled(self, features: np.ndarray) -> np.ndarray:
+        return (features - self.feature_mean_) / self.feature_scale_
+
+    def fit(self, features, targets):
+        features = np.asarray(features, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        offsets = targets - features[:, self.close_index]
+
+        self.feature_mean_ = features.mean(axis=0)
+        self.feature_scale_ = features.std(axis=0)
+        self.feature_scale_[self.feature_scale_ == 0] = 1.0
+        self.target_scale_ = offsets.std() or 1.0
+
+        regressor = SGDRegressor(
+            alpha=self.alpha,
+            eta0=self.eta0,
+            power_t=self.power_t,
+            max_iter=self.max_iter,
+            tol=self.tol,
+            random_state=self.random_state,
+        )
+        regressor.fit(self._scaled(features), offsets / self.target_scale_)
+        self.coef_ = regressor.coef_.copy()
+        self.intercept_ = float(regressor.intercept_[0])
+        self.n_online_updates_ = 0
+        return self
+
+    def predict(self, features) -> np.ndarray:
+        features = np.asarray(features, dtype=float)
+        offsets = self._scaled(features) @ self.coef_ + self.intercept_
+        return features[:, self.close_index] + offsets * self.target_scale_
+
+    def partial_fit(self, features, targets):
+        """One SGD step per row, in the order given."""
+
+        features = np.asarray(features, dtype=float)
+        targets = np.asarray(targets, dtype=float).reshape(-1)
+        scaled_features = self._scaled(features)
+        scaled_offsets = (targets - features[:, self.close_index]) / self.target_scale_
+        for row, target in zip(scaled_features, scaled_offsets):
+            error = row @ self.coef_ + self.intercept_ - target
+            self.coef_ -= self.online_learning_rate * (error * row + self.alpha * self.coef_)
+            self.intercept_ -= self.online_learning_rate * error
+            self.n_online_updates_ += 1
+        return self
+
+
+class OnlineModelUpdater(object):
+    """
+    Keeps a deployed model learning from the live candles.
+
+    Every tick labels the previous tick's features with the close that has
+    just been observed, scores the model on that label before learning
+    from it (so the tracked error is out-of-sample), then takes one
+    `partial_fit` step. When the mean absolute error over the last
+    `error_window` labelled ticks exceeds `max_error_ratio` times the
+    validation MAE, the online changes are discarded and the model rolls
+    back to the deployed artifact.
+
+    The state (model, pending features, recent errors) is a small pickle
+    stored next to the model as `<model_name>/online_state.pickle`.
+    """
+
+    state_filename = "online_state.pickle"
+
+    def __init__(
+        self,
+        base_model_bytes: bytes,
+        validation_mae: float,
+        granularity: int = 3600,
+        error_window: int = 24,
+        max_error_ratio: float = 1.0,
+    ):
+        """
+        :param base_model_bytes: (bytes) The deployed, batch trained model pickle.
+        :param validation_mae: (float) MAE of the deployed model on the
+            validation set; the guardrail threshold.
+        :param granularity: (int) Seconds between consecutive candles. Ticks
+            that are not consecutive are not used as labels.
+        """
+        self.base_model_bytes = base_model_bytes
+        self.base_fingerprint = hashlib.sha256(base_model_bytes).hexdigest()
+        self.validation_mae = float(validation_mae)
+        self.granularity = granularity
+        self.error_window = error_window
+        self.max_error_ratio = max_error_ratio
+        self.state = self._initial_state()
+
+    def _initial_state(self) -> dict:
+        return {
+            "base_fingerprint": self.base_fingerprint,
+            "model": pickle.loads(self.base_model_bytes),
+            "pending_features": None,
+            "pending_timestamp": None,
+            "errors": [],
+            "updates": 0,
+            "rollbacks": 0,
+        }
+
+    @property
+    def model(self):
+        return self.state["model"]
+
+    @property
+    def online_mae(self) -> float:
+        errors = self.state["errors"]
+        return float(np.mean(errors)) if errors else None
+
+    def load(self, data_helper, model_name: str) -> None:
+        """
+        Restores the state stored for `model_name`, unless it belongs to a
+        different deployed artifact, in which case learning starts afresh.
+        """
+
+        logger = logging.getLogger(__name__)
+        try:
+            state_bytes = data_helper.get_object_bytes(
+                os.path.join(model_name, self.state_filename))
+        except (ClientError, FileNotFoundError):
+            logger.info("No online state stored yet, starting from the deployed model")
+            return
+
+        state = pickle.loads(state_bytes)
+        if state.get("base_fingerprint") != self.base_fingerprint:
+            logger.info("Deployed model changed, discarding the stored online state")
+            return
+        self.state = state
+
+    def save(self, data_helper, model_name: str) -> None:
+        data_helper.put_object_bytes(
+            os.path.join(model_name, self.state_filename),
+            pickle.dumps(self.state, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+
+    def observe(self, features: list, close: float, timestamp: int) -> dict:
+        """
+        Learns from the previous tick, now that its next close is known,
+        and remembers this tick's features for the next one.
+
+        :param features: (list) This tick's model features.
+        :param close: (float) This tick's close, the label of the previous tick.
+        :param timestamp: (int) This tick's candle time, in epoch seconds.
+        :returns: (dict) What happened: `updated`, `rolled_back`, `online_mae`.
+        """
+
+        logger = logging.getLogger(__name__)
+        state = self.state
+        outcome = {"updated": False, "rolled_back": False}
+
+        pending_features = state["pending_features"]
+        consecutive = (
+            pending_features is not None
+            and state["pending_timestamp"] is not None
+            and int(timestamp) - int(state["pending_timestamp"]) == self.granularity
+        )
+        if consecutive:
+            labelled = np.asarray([pending_features], dtype=float)
+            error = abs(float(state["model"].predict(labelled)[0]) - float(close))
+            state["errors"] = (state["errors"] + [error])[-self.error_window:]
+            state["model"].partial_fit(labelled, [close])
+            state["updates"] += 1
+            outcome["updated"] = True
+
+            if (
+                len(state["errors"]) >= self.error_window
+                and self.online_mae > self.max_error_ratio * self.validation_mae
+            ):
+                logger.warning(
+                    f"Online MAE {self.online_mae:.5f} exceeds the validation MAE"
+                    f" {self.validation_mae:.5f}, rolling back to the deployed model"
+                )
+                rollbacks = state["rollbacks"] + 1
+                state = self.state = self._initial_state()
+                state["rollbacks"] = rollbacks
+                outcome["rolled_back"] = True
+
+        state["pending_features"] = list(features)
+        state["pending_timestamp"] = int(timestamp)
+        outcome["online_mae"] = self.online_mae
+        return outcome
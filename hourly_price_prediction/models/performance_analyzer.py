@@ -6,12 +6,26 @@ import plotly.graph_objects as go
 from plotly.io import to_html
 from plotly.subplots import make_subplots
 
+from hourly_price_prediction.monitoring.risk_metrics import HOURS_PER_YEAR
+
 
 class PerformanceAnalyzer(object):
     def __init__(self, path_to_model_metrics: str, path_to_trading_history: str):
 
-        self.model_metrics = pd.read_csv(path_to_model_metrics)
-        self.trading_history = pd.read_csv(path_to_trading_history)
+        self._set_results(
+            pd.read_csv(path_to_model_metrics), pd.read_csv(path_to_trading_history))
+
+    @classmethod
+    def from_dataframes(cls, model_metrics: pd.DataFrame, trading_history: pd.DataFrame):
+        """An analyzer of results already loaded, e.g. from a `ResultsCache`."""
+        analyzer = cls.__new__(cls)
+        analyzer._set_results(model_metrics, trading_history)
+        return analyzer
+
+    def _set_results(self, model_metrics: pd.DataFrame, trading_history: pd.DataFrame):
+
+        self.model_metrics = model_metrics
+        self.trading_history = trading_history
 
         self.trading_history_descriptive_statistics = self.trading_history[
             "total_assets"
@@ -125,9 +139,9 @@ class PerformanceAnalyzer(object):
         if series is None:
             series = self.trading_history["total_assets"]
 
-        log_differential = np.log(series / series.shift(-1))
+        log_differential = np.log(series / series.shift(1))
         hourly_std = np.std(log_differential)
-        annualized_std = hourly_std * np.sqrt(365)
+        annualized_std = hourly_std * np.sqrt(HOURS_PER_YEAR)
         return annualized_std
 
     def generate_line_plot(
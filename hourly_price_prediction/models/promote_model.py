@@ -0,0 +1,31 @@
+import logging
+
+import hydra
+from omegaconf import DictConfig
+
+from hourly_price_prediction.data.s3_helper import S3Helper
+from hourly_price_prediction.models.registry import ModelRegistry
+
+
+@hydra.main(config_path="../../configs/models", config_name="promote_config")
+def promote_model(cfg: DictConfig) -> None:
+
+    registry = ModelRegistry(
+        S3Helper(cfg.aws.bucket, cfg.aws.region_name), prefix=cfg.registry.prefix
+    )
+    for record in registry.versions():
+        logging.info(
+            f"v{record['version']} {record['stage']:<10} {record['model_name']}"
+            f" | val MAE {record['validation_metrics']['mae']:.5f}"
+        )
+
+    manifest = registry.promote(cfg.registry.version)
+    logging.info(
+        f"Production is now {manifest['model_name']} (version {manifest['version']})"
+    )
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    promote_model()
@@ -0,0 +1,31 @@
+import logging
+
+import hydra
+from omegaconf import DictConfig
+
+from hourly_price_prediction.data.s3_helper import S3Helper
+from hourly_price_prediction.models.registry import ModelRegistry
+
+
+@hydra.main(config_path="../../configs/models", config_name="register_config")
+def register_model(cfg: DictConfig) -> None:
+
+    registry = ModelRegistry(
+        S3Helper(cfg.aws.bucket, cfg.aws.region_name), prefix=cfg.registry.prefix
+    )
+    record = registry.register_uploaded(
+        cfg.registry.model_name, model_class=cfg.registry.model_class
+    )
+    logging.info(f"Registered {record['model_name']} as version {record['version']}")
+
+    if cfg.registry.promote:
+        manifest = registry.promote(record["version"])
+        logging.info(
+            f"Production is now {manifest['model_name']} (version {manifest['version']})"
+        )
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    register_model()
@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+STAGES = ("candidate", "production", "archived")
+
+
+def file_sha256(filepath: str) -> str:
+    """SHA-256 of the contents of `filepath`."""
+
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(chunk)
+        data_file.close()
+    return digest.hexdigest()
+
+
+class ModelRegistry(object):
+    """
+    Versioned record of the trained model artifacts in the bucket.
+
+    Two objects live under `prefix`:
+
+        index.json       every registered version with its metrics, data
+                         fingerprint and stage (candidate/production/archived)
+        production.json  a small pointer to the production version, with its
+                         validation metrics inline, so the trader needs one
+                         read to know which artifact to run and how
+
+    Promotion rewrites the index and then swaps `production.json` in a
+    single PUT, which readers observe either entirely before or entirely
+    after. The registry assumes one writer at a time (training and
+    promotion are run by hand or by CI, not concurrently).
+    """
+
+    index_filename = "index.json"
+    production_filename = "production.json"
+
+    def __init__(self, data_helper, prefix: str = "registry"):
+        """
+        :param data_helper: An `S3Helper` (or `LocalS3Helper`) for the bucket.
+        :param prefix: (str) Key prefix of the registry objects.
+        """
+        self.data_helper = data_helper
+        self.prefix = prefix
+
+    def _key(self, filename: str) -> str:
+        return os.path.join(self.prefix, filename)
+
+    def _read_json(self, filename: str):
+        try:
+            return self.data_helper.get_json(self._key(filename))
+        except (ClientError, FileNotFoundError):
+            return None
+
+    def _write_json(self, filename: str, document) -> None:
+        self.data_helper.put_json(self._key(filename), document)
+
+    def versions(self) -> list:
+        """:returns: (list) Every registered version, oldest first."""
+        index = self._read_json(self.index_filename)
+        return [] if index is None else index["versions"]
+
+    def get(self, version: int) -> dict:
+        for record in self.versions():
+            if record["version"] == int(version):
+                return record
+        raise KeyError(f"Model version {version} is not registered")
+
+    def register(
+        self,
+        model_name: str,
+        model_class: str,
+        artifact_key: str,
+        artifact_sha256: str,
+        validation_metrics: dict,
+        data_fingerprint: str = None,
+        metrics: list = None,
+        features: list = None,
+    ) -> dict:
+        """
+        Records an uploaded artifact as a new `candidate` version.
+
+        :param artifact_key: (str) Key of the pickled model in the bucket.
+        :param artifact_sha256: (str) Digest of the pickle, checked by readers.
+        :param data_fingerprint: (str) Digest of the training dataset.
+        :param metrics: (list) Optional train/val/test metric records.
+        :param features: (list) Indicator specs the model expects after the
+            raw candle fields, if any.
+        :returns: (dict) The new version's record.
+        """
+
+        logger = logging.getLogger(__name__)
+        versions = self.versions()
+        record = {
+            "version": max([r["version"] for r in versions], default=0) + 1,
+            "model_name": model_name,
+            "model_class": model_class,
+            "artifact_key": artifact_key,
+            "artifact_sha256": artifact_sha256,
+            "validation_metrics": validation_metrics,
+            "metrics": metrics,
+            "data_fingerprint": data_fingerprint,
+            "features": features or [],
+            "stage": "candidate",
+            "registered_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        versions.append(record)
+        self._write_json(self.index_filename, {"versions": versions})
+        logger.info(f"Registered {model_name} as version {record['version']}")
+        return record
+
+    def register_uploaded(self, model_name: str, model_class: str = None) -> dict:
+        """
+        Registers an artifact that was uploaded to `<model_name>/` before the
+        registry existed, reading its pickle, validation metrics and (when
+        present) features back from the bucket.
+
+        :param model_name: (str) Key prefix the model was uploaded under.
+        :returns: (dict) The new version's record.
+        """
+
+        model_bytes = self.data_helper.get_object_bytes(
+            os.path.join(model_name, "model.pickle"))
+        validation_metrics = self.data_helper.get_json(
+            os.path.join(model_name, "validation_metrics.json"))
+        try:
+            features = self.data_helper.get_json(os.path.join(model_name, "features.json"))
+        except (ClientError, FileNotFoundError):
+            features = []
+
+        return self.register(
+            model_name=model_name,
+            model_class=model_class,
+            artifact_key=os.path.join(model_name, "model.pickle"),
+            artifact_sha256=hashlib.sha256(model_bytes).hexdigest(),
+            validation_metrics=validation_metrics,
+            features=features,
+        )
+
+    def promote(self, version: int) -> dict:
+        """
+        Makes `version` the production model. The previous production
+        version is archived.
+
+        :returns: (dict) The production manifest that was written.
+        """
+
+        logger = logging.getLogger(__name__)
+        versions = self.versions()
+        promoted = None
+        for record in versions:
+            if record["version"] == int(version):
+                record["stage"] = "production"
+                record["promoted_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                promoted = record
+            elif record["stage"] == "production":
+                record["stage"] = "archived"
+        if promoted is None:
+            raise KeyError(f"Model version {version} is not registered")
+
+        self._write_json(self.index_filename, {"versions": versions})
+        manifest = {
+            "version": promoted["version"],
+            "model_name": promoted["model_name"],
+            "artifact_key": promoted["artifact_key"],
+            "artifact_sha256": promoted["artifact_sha256"],
+            "validation_metrics": promoted["validation_metrics"],
+            "features": promoted.get("features", []),
+            "promoted_at": promoted["promoted_at"],
+        }
+        self._write_json(self.production_filename, manifest)
+        logger.info(f"Promoted {promoted['model_name']} (version {version}) to production")
+        return manifest
+
+    def production(self) -> dict:
+        """
+        Reads the production pointer, the only registry object the trader
+        touches.
+
+        :returns: (dict) The production manifest, or None when nothing has
+            been promoted yet.
+        """
+        return self._read_json(self.production_filename)
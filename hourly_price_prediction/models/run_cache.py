@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+import pandas as pd
+import sklearn
+
+# Bump when the training/simulation logic changes in a way that makes
+# previously cached runs stale.
+CACHE_FORMAT_VERSION = 1
+
+_fingerprints = {}
+
+
+def file_fingerprint(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of the contents of `filepath`, read in chunks. The digest is
+    memoised per (path, size, mtime) so a multirun sweep hashes the dataset
+    once rather than once per job.
+
+    :returns: (str) Hex digest.
+    """
+
+    stat = os.stat(filepath)
+    memo_key = (os.path.realpath(filepath), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as data_file:
+            for chunk in iter(lambda: data_file.read(chunk_size), b""):
+                digest.update(chunk)
+            data_file.close()
+        _fingerprints[memo_key] = digest.hexdigest()
+    return _fingerprints[memo_key]
+
+
+def run_cache_key(
+    dataset_fingerprint: str,
+    model_class: str,
+    model_params: dict,
+    test_period_in_days: int,
+    validation_percentage: float,
+    target_variable: str,
+    features: list = None,
+    horizon: int = 1,
+) -> str:
+    """
+    Content address of a training run: everything that determines the
+    fitted model, its metrics and its simulated trading history.
+
+    :param features: (list) Indicator specs added to the dataset, if any.
+    :param horizon: (int) Number of future closes the model predicts.
+
+    :returns: (str) Hex digest.
+    """
+
+    description = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "sklearn_version": sklearn.__version__,
+        "dataset": dataset_fingerprint,
+        "model_class": str(model_class).lower(),
+        "model_params": model_params,
+        "test_period_in_days": int(test_period_in_days),
+        "validation_percentage": float(validation_percentage),
+        "target_variable": target_variable,
+    }
+    if features:
+        description["features"] = features
+    if int(horizon) != 1:
+        description["horizon"] = int(horizon)
+    encoded = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class RunCache(object):
+    """
+    Stores finished training runs under `cache_directory/<key>/` so an
+    unchanged dataset + config can skip refitting:
+
+        model.pickle          the fitted model
+        trading_history.csv   the simulated trading history
+        model_metrics.csv     train/val/test metrics
+        manifest.json         key inputs, run name and validation metrics
+
+    Entries are written to a temporary directory and renamed into place,
+    so a crashed or concurrent run never leaves a half written entry.
+    """
+
+    def __init__(self, cache_directory: str):
+        """
+        :param cache_directory: (str) Root directory of the cache.
+        """
+        self.cache_directory = cache_directory
+
+    def _entry_directory(self, key: str) -> str:
+        return os.path.join(self.cache_directory, key)
+
+    def get(self, key: str) -> dict:
+        """
+        :returns: (dict) The cached run (`model`, `trading_history`,
+            `metrics`, `manifest`), or None on a miss.
+        """
+
+        logger = logging.getLogger(__name__)
+        entry_directory = self._entry_directory(key)
+        manifest_file = os.path.join(entry_directory, "manifest.json")
+        if not os.path.isfile(manifest_file):
+            return None
+
+        try:
+            with open(manifest_file, "r") as jfile:
+                manifest = json.loads(jfile.read())
+                jfile.close()
+            with open(os.path.join(entry_directory, "model.pickle"), "rb") as mfile:
+                model = pickle.load(mfile)
+                mfile.close()
+            trading_history = pd.read_csv(
+                os.path.join(entry_directory, "trading_history.csv"))
+            metrics = pd.read_csv(
+                os.path.join(entry_directory, "model_metrics.csv")
+            ).to_dict("records")
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError) as error:
+            logger.warning(f"Ignoring unreadable run cache entry {key}: {error}")
+            return None
+
+        return {
+            "model": model,
+            "trading_history": trading_history,
+            "metrics": metrics,
+            "manifest": manifest,
+        }
+
+    def put(
+        self,
+        key: str,
+        model,
+        trading_history: pd.DataFrame,
+        metrics: list,
+        manifest: dict,
+    ) -> str:
+        """
+        Stores a finished run under `key`. An existing entry for the same
+        key is left untouched.
+
+        :returns: (str) The entry's directory.
+        """
+
+        entry_directory = self._entry_directory(key)
+        if os.path.isdir(entry_directory):
+            return entry_directory
+        if not os.path.exists(self.cache_directory):
+            os.makedirs(self.cache_directory, exist_ok=True)
+
+        staging_directory = tempfile.mkdtemp(
+            prefix=f".{key[:12]}-", dir=self.cache_directory)
+        try:
+            with open(os.path.join(staging_directory, "model.pickle"), "wb") as mfile:
+                pickle.dump(model, mfile)
+                mfile.close()
+            trading_history.to_csv(
+                os.path.join(staging_directory, "trading_history.csv"), index=None
+            )
+            pd.DataFrame(metrics).to_csv(
+                os.path.join(staging_directory, "model_metrics.csv"), index=None
+            )
+            with open(os.path.join(staging_directory, "manifest.json"), "w") as jfile:
+                jfile.write(json.dumps(manifest, indent=2, default=str))
+                jfile.close()
+            os.rename(staging_directory, entry_directory)
+        except OSError:
+            # Another run stored the same key first.
+            if not os.path.isdir(entry_directory):
+                raise
+        finally:
+            shutil.rmtree(staging_directory, ignore_errors=True)
+
+        return entry_directory
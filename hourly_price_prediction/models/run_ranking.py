@@ -0,0 +1,78 @@
+import csv
+import logging
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from hourly_price_prediction.monitoring.risk_metrics import (
+    TRADE_ACTIONS, risk_metrics_matrix)
+
+# Metrics where a lower value ranks a run higher.
+LOWER_IS_BETTER = ("annualized_volatility", "max_drawdown")
+
+
+def _read_trading_history(run_directory: str) -> tuple:
+    """
+    (total_assets, trades) of a run's `trading_history.csv`. The csv module
+    reads these small files about twice as fast as `pd.read_csv`, whose
+    per-call overhead dominates at a few hundred rows.
+    """
+
+    with open(os.path.join(run_directory, "trading_history.csv"), newline="") as cfile:
+        reader = csv.reader(cfile)
+        header = next(reader)
+        action_index = header.index("action")
+        total_assets_index = header.index("total_assets")
+        rows = list(reader)
+        cfile.close()
+    total_assets = np.array([float(row[total_assets_index]) for row in rows])
+    trades = np.array([row[action_index] in TRADE_ACTIONS for row in rows], dtype=bool)
+    return (total_assets, trades)
+
+
+def load_run_histories(run_directories: list) -> tuple:
+    """
+    Reads the trading history of every run into one array, aligned on the
+    first hour and padded with NaN after a run's last hour.
+
+    :returns: tuple(total_assets, trades) Arrays of shape
+        (n_runs, longest history); `trades` is True where a run bought or
+        sold.
+    """
+
+    histories = [_read_trading_history(directory) for directory in run_directories]
+    n_hours = max((len(history[0]) for history in histories), default=0)
+    total_assets = np.full((len(histories), n_hours), np.nan)
+    trades = np.zeros((len(histories), n_hours), dtype=bool)
+    for row, (run_total_assets, run_trades) in enumerate(histories):
+        total_assets[row, :len(run_total_assets)] = run_total_assets
+        trades[row, :len(run_trades)] = run_trades
+    return (total_assets, trades)
+
+
+def rank_runs(base_directory: str, sort_by: str = "sharpe_ratio") -> pd.DataFrame:
+    """
+    Risk metrics of every training run under `base_directory` (the
+    `save_training_results` layout), computed for all runs at once and
+    ranked by `sort_by`.
+
+    :returns: (pd.DataFrame) One row per run, best first, with its `rank`
+        and `model` (the run directory name).
+    """
+
+    logger = logging.getLogger(__name__)
+    run_directories = sorted(
+        os.path.dirname(path)
+        for path in glob(os.path.join(base_directory, "*", "trading_history.csv"))
+    )
+    total_assets, trades = load_run_histories(run_directories)
+    metrics = risk_metrics_matrix(total_assets, trades)
+    metrics.insert(0, "model", [os.path.basename(directory) for directory in run_directories])
+
+    metrics = metrics.sort_values(
+        sort_by, ascending=sort_by in LOWER_IS_BETTER, na_position="last", kind="stable")
+    metrics.insert(0, "rank", np.arange(1, len(metrics) + 1))
+    logger.info(f"Ranked {len(metrics)} runs by {sort_by}")
+    return metrics.reset_index(drop=True)
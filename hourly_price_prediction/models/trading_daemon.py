@@ -0,0 +1,520 @@
+import hashlib
+import logging
+import math
+import os
+import pickle
+import signal
+import threading
+import time as _time
+from datetime import datetime
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from hourly_price_prediction.features.indicators import (FeatureSet,
+                                                          LiveFeatureState)
+from hourly_price_prediction.models.registry import ModelRegistry
+from hourly_price_prediction.monitoring.latency import StageTimer
+from hourly_price_prediction.monitoring.risk_metrics import StreamingRiskMetrics
+
+
+class WallClock(object):
+    """
+    The real clock, with the interface of `SimulatedClock`. `sleep`
+    returns early once `interrupt` is called, so a shutdown does not wait
+    for the next candle.
+    """
+
+    def __init__(self):
+        self._interrupted = threading.Event()
+
+    def time(self) -> float:
+        return _time.time()
+
+    def sleep(self, seconds: float) -> None:
+        self._interrupted.wait(max(seconds, 0.0))
+
+    def interrupt(self) -> None:
+        self._interrupted.set()
+
+    def strftime(self, format: str, t: _time.struct_time = None) -> str:
+        return _time.strftime(format, _time.localtime() if t is None else t)
+
+
+def load_deployed_model(data_helper, model_name: str = None) -> dict:
+    """
+    Finds the model the trader runs the way `lambda_handler` does: the
+    registry's production version, or the pinned `model_name`.
+
+    :returns: (dict) name, version (None when pinned), model, model_bytes,
+        validation_metrics and feature_specs.
+    """
+
+    if model_name in (None, "None", ""):
+        manifest = ModelRegistry(data_helper).production()
+        if manifest is None:
+            raise RuntimeError("No production model has been promoted in the registry")
+        model_bytes = data_helper.get_object_bytes(manifest["artifact_key"], immutable=True)
+        if hashlib.sha256(model_bytes).hexdigest() != manifest["artifact_sha256"]:
+            raise RuntimeError(f"Checksum mismatch for {manifest['artifact_key']}")
+        return {
+            "name": manifest["model_name"],
+            "version": manifest["version"],
+            "model": pickle.loads(model_bytes),
+            "model_bytes": model_bytes,
+            "validation_metrics": manifest["validation_metrics"],
+            "feature_specs": manifest.get("features", []),
+        }
+
+    model_bytes = data_helper.get_object_bytes(os.path.join(model_name, "model.pickle"))
+    try:
+        feature_specs = data_helper.get_json(os.path.join(model_name, "features.json"))
+    except (ClientError, FileNotFoundError):
+        feature_specs = []
+    return {
+        "name": model_name,
+        "version": None,
+        "model": pickle.loads(model_bytes),
+        "model_bytes": model_bytes,
+        "validation_metrics": data_helper.get_json(
+            os.path.join(model_name, "validation_metrics.json")),
+        "feature_specs": feature_specs,
+    }
+
+
+def _iso(epoch: float) -> str:
+    # Naive local time, like `AssetTrader._get_start_end_iso_times`.
+    return datetime.fromtimestamp(epoch).isoformat()
+
+
+class TradingDaemon(object):
+    """
+    Long-running alternative to the hourly `lambda_handler`, trading the
+    same strategy and writing the same trading history records.
+
+    Everything the Lambda rebuilds on every invocation stays warm: the
+    `AssetTrader` with its compiled model and exchange clients, the
+    account balances, the feature, risk metrics and registry state. Ticks
+    are scheduled on the exchange clock (`get_time`), so the only work
+    between a candle closing and the order being placed is fetching that
+    candle, one prediction, the checkpoint and the order itself. Balances
+    are refreshed `balance_refresh_lead` seconds before the close, and
+    fills and uploads happen after the order.
+
+    Before an order is placed, the candle is written to `checkpoint_key`
+    as the last traded one; a restarted daemon never trades a candle
+    twice, and trades a candle it missed if it is back within
+    `catch_up_seconds` of that candle's close. An error (exchange or S3)
+    is logged and retried after a backoff growing from `error_backoff` up
+    to `max_error_backoff` seconds, without ending the daemon. `stop`
+    (SIGTERM, SIGINT) lets the current tick finish and returns from `run`.
+
+    `clock` is an object with `time()`, `sleep()` and `strftime()`: a
+    `WallClock` live, or a `SimulatedClock` shared with a
+    `SimulatedExchange` to run through days of candles in seconds.
+    """
+
+    checkpoint_key = "daemon/{asset}/checkpoint.json"
+
+    def __init__(
+        self,
+        asset_trader,
+        data_helper,
+        deployed: dict,
+        clock=None,
+        granularity: int = 3600,
+        follow_registry: bool = None,
+        percent_of_total_money_to_move: float = 0.10,
+        close_delay: float = 0.0,
+        balance_refresh_lead: float = 5.0,
+        candle_poll_interval: float = 0.1,
+        candle_timeout: float = 30.0,
+        fill_poll_interval: float = 0.25,
+        fill_timeout: float = 10.0,
+        catch_up_seconds: float = 300.0,
+        error_backoff: float = 5.0,
+        max_error_backoff: float = 300.0,
+    ):
+        """
+        :param asset_trader: (AssetTrader) Trader whose clients and model are used.
+        :param data_helper: (S3Helper) Where records, state and checkpoints go.
+        :param deployed: (dict) The model to run, see `load_deployed_model`.
+        :param follow_registry: (bool) Switch to a newly promoted production
+            model between ticks; defaults to whether `deployed` came from
+            the registry.
+        :param close_delay: (float) Seconds after the close to ask for the
+            candle.
+        :param candle_timeout: (float) Seconds to wait for the closed candle
+            to be published before skipping the tick.
+        :param fill_timeout: (float) Seconds to wait for an order to settle
+            before reading the balances.
+        :param error_backoff: (float) Seconds to wait after a first error,
+            doubled after every further consecutive error.
+        """
+        self.asset_trader = asset_trader
+        self.data_helper = data_helper
+        self.clock = WallClock() if clock is None else clock
+        self.granularity = granularity
+        if follow_registry is None:
+            follow_registry = deployed["version"] is not None
+        self.follow_registry = follow_registry
+        self.percent_of_total_money_to_move = percent_of_total_money_to_move
+        self.close_delay = close_delay
+        self.balance_refresh_lead = balance_refresh_lead
+        self.candle_poll_interval = candle_poll_interval
+        self.candle_timeout = candle_timeout
+        self.fill_poll_interval = fill_poll_interval
+        self.fill_timeout = fill_timeout
+        self.catch_up_seconds = catch_up_seconds
+        self.error_backoff = error_backoff
+        self.max_error_backoff = max_error_backoff
+        self.checkpoint_key = self.checkpoint_key.format(asset=asset_trader.asset)
+
+        self.stopping = False
+        self.clock_offset = 0.0
+        self.usd_wallet = None
+        self.asset_wallet = None
+        self.checkpoint = {"last_close": None, "ticks": 0}
+        self.risk_metrics = StreamingRiskMetrics(
+            asset=asset_trader.asset, trader="trading-daemon")
+        self.deploy(deployed)
+
+    def deploy(self, deployed: dict) -> None:
+        """Switches the trader to `deployed`, with its own feature state."""
+
+        self.deployed = deployed
+        self.asset_trader.model = deployed["model"]
+        self.live_features = None
+        if deployed["feature_specs"]:
+            self.live_features = LiveFeatureState(
+                FeatureSet.from_specs(deployed["feature_specs"]), granularity=self.granularity)
+            self.live_features.load(self.data_helper, deployed["name"])
+
+    def exchange_time(self) -> float:
+        return self.clock.time() + self.clock_offset
+
+    def sync_clock(self) -> None:
+        """Measures the offset of the exchange clock from ours."""
+
+        before = self.clock.time()
+        epoch = float(self.asset_trader.public_client.get_time()["epoch"])
+        after = self.clock.time()
+        self.clock_offset = epoch - (before + after) / 2
+
+    def refresh_balances(self) -> None:
+        self.usd_wallet = self.asset_trader.get_account_balance(self.asset_trader.usd_wallet)
+        self.asset_wallet = self.asset_trader.get_account_balance(self.asset_trader.asset_wallet)
+
+    def next_close(self) -> int:
+        """Exchange time of the next candle close."""
+        return (math.floor(self.exchange_time() / self.granularity) + 1) * self.granularity
+
+    def close_to_trade(self) -> int:
+        """
+        Exchange time of the close to trade next: the last close when its
+        candle was missed less than `catch_up_seconds` ago, otherwise the
+        next one.
+        """
+
+        last_close = self.next_close() - self.granularity
+        if (
+            self.checkpoint["last_close"] is not None
+            and self.checkpoint["last_close"] < last_close
+            and self.exchange_time() - last_close <= self.catch_up_seconds
+        ):
+            return last_close
+        return last_close + self.granularity
+
+    def stop(self, *args) -> None:
+        """Finishes the current tick, then returns from `run`."""
+
+        logger = logging.getLogger(__name__)
+        logger.info("Stopping the trading daemon")
+        self.stopping = True
+        if hasattr(self.clock, "interrupt"):
+            self.clock.interrupt()
+
+    def install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def load_checkpoint(self) -> None:
+        logger = logging.getLogger(__name__)
+        try:
+            self.checkpoint = self.data_helper.get_json(self.checkpoint_key)
+        except (ClientError, FileNotFoundError):
+            logger.info("No daemon checkpoint stored yet")
+
+    def save_checkpoint(self) -> None:
+        self.data_helper.put_json(self.checkpoint_key, self.checkpoint)
+
+    def wait_until(self, exchange_epoch: float) -> bool:
+        """
+        Sleeps until the exchange clock reads `exchange_epoch`.
+
+        :returns: (bool) False when the daemon was stopped first.
+        """
+
+        while not self.stopping:
+            remaining = exchange_epoch - self.exchange_time()
+            if remaining <= 0:
+                return True
+            self.clock.sleep(remaining)
+        return False
+
+    def closed_candle(self, close: int) -> dict:
+        """
+        The candle that closed at `close`, polled until the exchange
+        publishes it; None after `candle_timeout` seconds.
+        """
+
+        candle_time = close - self.granularity
+        deadline = self.exchange_time() + self.candle_timeout
+        while True:
+            candles = self.asset_trader.get_asset_history(
+                start=_iso(candle_time), end=_iso(close), granularity=self.granularity)
+            for candle in reversed(candles):
+                if int(candle["timestamp"]) == candle_time:
+                    return candle
+            if self.stopping or self.exchange_time() >= deadline:
+                return None
+            self.clock.sleep(self.candle_poll_interval)
+
+    def wait_for_fill(self, order_response: dict) -> None:
+        if not order_response or "id" not in order_response:
+            return
+        deadline = self.exchange_time() + self.fill_timeout
+        while self.exchange_time() < deadline:
+            order = self.asset_trader.private_client.get_order(order_response["id"])
+            if order.get("settled") or order.get("status") == "done":
+                return
+            self.clock.sleep(self.fill_poll_interval)
+
+    def features(self, candle: dict) -> list:
+        """The deployed model's features at `candle`, warming them up if needed."""
+
+        if self.live_features is None:
+            return []
+        timestamp = candle["timestamp"]
+        if self.live_features.needs_history(timestamp):
+            history_start = timestamp - self.live_features.feature_set.history * self.granularity
+            history = self.asset_trader.get_asset_history(
+                start=_iso(history_start), end=_iso(timestamp + self.granularity),
+                granularity=self.granularity)
+            self.live_features.warm_up(
+                [candle for candle in history if candle["timestamp"] < timestamp])
+        return self.live_features.observe(candle)
+
+    def tick(self, close: int) -> dict:
+        """
+        Trades the candle that closed at `close`.
+
+        :returns: (dict) The trading history record, None when the candle
+            never came.
+        """
+
+        timer = StageTimer(
+            dimensions={"Service": "trading-daemon", "Asset": self.asset_trader.asset})
+        properties = {"model": self.deployed["name"], "action": None, "error": None}
+        # Emitted whether or not the tick succeeds, as in `lambda_handler`.
+        try:
+            return self._tick(close, timer, properties)
+        except Exception as e:
+            properties["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            timer.emit(properties=properties)
+
+    def _tick(self, close: int, timer: StageTimer, properties: dict) -> dict:
+        """The body of `tick`, writing the action to `properties`."""
+
+        logger = logging.getLogger(__name__)
+        asset_trader = self.asset_trader
+        val_metrics = self.deployed["validation_metrics"]
+
+        with timer.stage("exchange_candles"):
+            candle = self.closed_candle(close)
+        if candle is None:
+            logger.warning(f"No candle closed at {close}, skipping the tick")
+            return None
+
+        with timer.stage("features"):
+            feature_values = self.features(candle)
+        with timer.stage("prediction"):
+            if None in feature_values:
+                model_prediction = candle["close"]
+            else:
+                model_prediction = asset_trader.predict(
+                    candle["open"], candle["high"], candle["low"], candle["close"],
+                    candle["volume"], feature_values,
+                )[0]
+        horizon_predictions = [float(value) for value in np.ravel(model_prediction)]
+
+        action, amount = asset_trader.trading_strategy(
+            model_prediction=model_prediction,
+            threshold_to_act=float(val_metrics["mae"]) / 3,
+            current_close_price=candle["close"],
+            percent_of_total_money_to_move=self.percent_of_total_money_to_move,
+            total_money_in_usd=self.usd_wallet,
+        )
+        properties["action"] = action
+        # Checkpointed before the order: a crash from here on must not
+        # make a restarted daemon trade this candle again.
+        self.checkpoint["last_close"] = close
+        self.checkpoint["ticks"] += 1
+        self.checkpoint["model"] = self.deployed["name"]
+        with timer.stage("checkpoint"):
+            self.save_checkpoint()
+        with timer.stage("order_placement"):
+            if action == "buy":
+                order_response = asset_trader.place_buy_order(amount)
+            elif action == "sell":
+                order_response = asset_trader.place_sell_order(amount)
+            else:
+                order_response = None
+        close_to_order_ms = (self.exchange_time() - close) * 1000
+        timer.record("close_to_order", close_to_order_ms)
+        logger.info(f"{action} {amount} {round(close_to_order_ms, 3)}ms after the close")
+
+        with timer.stage("fill_wait"):
+            self.wait_for_fill(order_response)
+        with timer.stage("exchange_balances_post_fill"):
+            self.refresh_balances()
+
+        record = {
+            "model": self.deployed["name"],
+            "open": candle["open"],
+            "high": candle["high"],
+            "low": candle["low"],
+            "close": candle["close"],
+            "volume": candle["volume"],
+            "model_prediction": float(np.mean(horizon_predictions)),
+            "sat_out": None in feature_values,
+            "action": action,
+            "usd_wallet": self.usd_wallet,
+            "asset_wallet": self.asset_wallet,
+            "timestamp": candle["timestamp"],
+            "close_to_order_ms": close_to_order_ms,
+        }
+        if hasattr(asset_trader.model, "member_predictions") and None not in feature_values:
+            member_predictions = asset_trader.model.member_predictions(
+                [[candle["open"], candle["high"], candle["low"], candle["close"],
+                  candle["volume"]] + feature_values])[0]
+            for name, value in zip(asset_trader.model.member_names_, member_predictions):
+                record[f"member_{name}"] = float(value)
+        if len(horizon_predictions) > 1:
+            for step, value in enumerate(horizon_predictions, start=1):
+                record[f"model_prediction_{step}"] = value
+        if order_response is not None:
+            for key in order_response.keys():
+                record[key] = order_response[key]
+        if self.live_features is not None:
+            for name, value in zip(self.live_features.feature_set.names, feature_values):
+                record[name] = value
+
+        with timer.stage("s3_upload"):
+            self.data_helper.put_json(
+                "trading_history/{}/{}.json".format(
+                    self.data_helper.generate_partition(),
+                    self.clock.strftime("%Y%m%dT%H%M%S%MS"),
+                ),
+                record,
+            )
+        with timer.stage("state_save"):
+            if self.live_features is not None:
+                self.live_features.save(self.data_helper, self.deployed["name"])
+            # After the upload and non-fatal, as in `lambda_handler`.
+            try:
+                self.risk_metrics.update(record)
+                self.risk_metrics.save(self.data_helper)
+            except Exception:
+                logger.exception("Unable to update the risk metrics")
+
+        return record
+
+    def follow_promotions(self) -> None:
+        """Deploys a newly promoted production model, between ticks."""
+
+        logger = logging.getLogger(__name__)
+        if not self.follow_registry:
+            return
+        manifest = ModelRegistry(self.data_helper).production()
+        if manifest is not None and manifest["version"] != self.deployed["version"]:
+            logger.info(f"Deploying {manifest['model_name']} (version {manifest['version']})")
+            self.deploy(load_deployed_model(self.data_helper))
+
+    def start(self) -> None:
+        """Restores the checkpointed state and warms up the exchange state."""
+
+        self.load_checkpoint()
+        self.risk_metrics.load(self.data_helper)
+        self.sync_clock()
+        self.refresh_balances()
+
+    def run(self, max_ticks: int = None) -> int:
+        """
+        Trades every candle close until stopped, or `max_ticks` ticks.
+
+        :returns: (int) Number of ticks traded.
+        """
+
+        logger = logging.getLogger(__name__)
+        started = False
+        ticks = 0
+        consecutive_errors = 0
+        while not self.stopping and (max_ticks is None or ticks < max_ticks):
+            try:
+                if not started:
+                    self.start()
+                    started = True
+                close = self.close_to_trade()
+                if close < self.next_close():
+                    logger.info(f"Catching up on the candle closed at {close}")
+                if not self.wait_until(close - self.balance_refresh_lead):
+                    break
+                self.sync_clock()
+                self.refresh_balances()
+                if not self.wait_until(close + self.close_delay):
+                    break
+                if self.tick(close) is not None:
+                    ticks += 1
+                self.follow_promotions()
+            except Exception:
+                consecutive_errors += 1
+                backoff = min(
+                    self.error_backoff * 2 ** (consecutive_errors - 1), self.max_error_backoff)
+                logger.exception(f"Trading daemon error, retrying in {backoff}s")
+                self.clock.sleep(backoff)
+            else:
+                consecutive_errors = 0
+
+        logger.info(f"Trading daemon stopped after {ticks} ticks")
+        return ticks
+
+if __name__ == "__main__":
+    from hourly_price_prediction.data.s3_cache import S3Cache
+    from hourly_price_prediction.data.s3_helper import S3Helper
+    from hourly_price_prediction.models.asset_trader import AssetTrader
+
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    use_sandbox = str(os.getenv("USE_SANDBOX")).lower() == "true"
+    data_helper = S3Helper(
+        str(os.getenv("S3_BUCKET")),
+        str(os.getenv("REGION_NAME")),
+        cache=S3Cache("/tmp/s3-cache", max_bytes=256 * 1024 ** 2),
+    )
+    deployed = load_deployed_model(data_helper, str(os.getenv("MODEL_NAME")))
+    asset_trader = AssetTrader(
+        asset=str(os.getenv("ASSET")),
+        api_secret=str(os.getenv("API_SECRET")),
+        api_key=str(os.getenv("API_KEY")),
+        passphrase=str(os.getenv("PASSPHRASE")),
+        pickle_file=None,
+        use_sandbox=use_sandbox,
+        model=deployed["model"],
+    )
+    daemon = TradingDaemon(asset_trader, data_helper, deployed)
+    daemon.install_signal_handlers()
+    daemon.run()
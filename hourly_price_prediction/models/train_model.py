@@ -1,46 +1,155 @@
-import json
 import logging
 import os
-import pickle
 import time
 
 import hydra
 import pandas as pd
-from omegaconf import DictConfig
-from utils import (get_model_class, strategy_simulation, train_test_val_split,
-                   training_pipeline, write_to_s3)
+from monte_carlo import monte_carlo_simulation, save_monte_carlo_results
+from omegaconf import DictConfig, OmegaConf
+from run_cache import RunCache, file_fingerprint, run_cache_key
+from utils import (add_features, build_model, horizon_targets,
+                   save_model_artifacts, save_training_results,
+                   strategy_simulation, train_test_val_split,
+                   training_pipeline)
+
+from hourly_price_prediction.monitoring.profiler import PipelineProfiler
+
+
+def restore_cached_run(
+    cfg: DictConfig, cached_run: dict, model_params: dict, feature_specs: list = None
+) -> str:
+    """
+    Puts a cached run back in place of a fresh one: the results directory
+    of the run that produced it is reused when it still exists, otherwise
+    it is rewritten from the cache under the same name. Model artifacts are
+    only written when they are requested and missing.
+
+    :returns: (str) The run's results directory.
+    """
+
+    manifest = cached_run["manifest"]
+    base_model_name = manifest["base_model_name"]
+    logging.info(
+        f"Total Gain/Loss after testing: {round(manifest['percentage_gain_lost']*100, 5)}%"
+    )
+
+    results_directory = os.path.join(
+        cfg.data.directory_to_save_training_results_in, base_model_name)
+    if os.path.isfile(os.path.join(results_directory, "trading_history.csv")):
+        logging.info(f"Reusing training results: {results_directory}")
+    else:
+        results_directory = save_training_results(
+            cfg.data.directory_to_save_training_results_in,
+            base_model_name,
+            cached_run["trading_history"],
+            cached_run["metrics"],
+            hyperparameters=model_params,
+        )
+
+    model_artifact = os.path.join(
+        cfg.data.directory_to_save_models_in, base_model_name, f"{base_model_name}.pickle")
+    if cfg.model.save_artifacts and not os.path.isfile(model_artifact):
+        save_model_artifacts(
+            cfg.data.directory_to_save_models_in,
+            base_model_name,
+            cached_run["model"],
+            manifest["validation_metrics"],
+            bucket=cfg.aws.bucket,
+            model_class=cfg.model.model_class,
+            data_fingerprint=file_fingerprint(cfg.data.csv_file),
+            metrics=cached_run["metrics"],
+            feature_specs=feature_specs,
+            region_name=cfg.aws.region_name,
+        )
+
+    return results_directory
 
 
 @hydra.main(config_path="../../configs/models", config_name="linear_config")
 def train_model(cfg: DictConfig) -> None:
 
-    model_object = get_model_class(cfg.model.model_class)
+    profiler = PipelineProfiler(
+        enabled=cfg.profile.enabled,
+        trace_memory=cfg.profile.trace_memory,
+        capture_cprofile=cfg.profile.cprofile,
+    )
 
     assert os.path.isfile(
         cfg.data.csv_file
     ), f"CSV File passed does not exist: {cfg.data.csv_file}"
-    dataset = pd.read_csv(cfg.data.csv_file)
-    dataset.columns = [column.lower() for column in dataset.columns]
-
-    assert (
-        cfg.model.target_variable in dataset.columns
-    ), f"Target variable passed (--target_variable {cfg.model.target_variable}) is not in the dataset (dataset.columns {dataset.columns})"
 
-    (
-        train_features,
-        train_targets,
-        validation_features,
-        validation_targets,
-        test_features,
-        test_targets,
-    ) = train_test_val_split(
-        dataset,
-        test_period_in_days=cfg.model.test_period_in_days,
-        validation_percentage=cfg.model.validation_percentage,
-        target_variable=cfg.model.target_variable,
+    model_params = OmegaConf.to_container(cfg.model.params, resolve=True)
+    feature_specs = OmegaConf.to_container(cfg.features.indicators, resolve=True)
+    run_cache, cache_key = None, None
+    if cfg.cache.enabled:
+        with profiler.stage("fingerprint"):
+            cache_key = run_cache_key(
+                file_fingerprint(cfg.data.csv_file),
+                model_class=cfg.model.model_class,
+                model_params=model_params,
+                test_period_in_days=cfg.model.test_period_in_days,
+                validation_percentage=cfg.model.validation_percentage,
+                target_variable=cfg.model.target_variable,
+                features=feature_specs,
+                horizon=cfg.model.horizon,
+            )
+            run_cache = RunCache(cfg.cache.directory)
+            # Cached runs have no Monte Carlo results, so they are
+            # retrained (and cached again) when those are requested.
+            cached_run = None if cfg.monte_carlo.n_paths else run_cache.get(cache_key)
+
+        if cached_run is not None:
+            logging.info(f"Run cache hit ({cache_key[:12]}), skipping training")
+            profiler.add_metadata(model_class=cfg.model.model_class, cache_hit=True)
+            with profiler.stage("restore"):
+                results_directory = restore_cached_run(
+                    cfg, cached_run, model_params, feature_specs)
+            profile_file = profiler.save(results_directory)
+            if profile_file is not None:
+                logging.info(f"Pipeline Profile saved: {profile_file}")
+            return
+
+    with profiler.stage("load"):
+        dataset = pd.read_csv(cfg.data.csv_file)
+        dataset.columns = [column.lower() for column in dataset.columns]
+    profiler.add_metadata(
+        model_class=cfg.model.model_class,
+        dataset_rows=len(dataset),
+        dataset_columns=len(dataset.columns),
+        dataset_bytes=os.path.getsize(cfg.data.csv_file),
     )
 
-    model = model_object()
+    for target_variable in horizon_targets(cfg.model.target_variable, cfg.model.horizon):
+        assert (
+            target_variable in dataset.columns
+        ), f"Target variable {target_variable} (--target_variable {cfg.model.target_variable}, --horizon {cfg.model.horizon}) is not in the dataset (dataset.columns {dataset.columns})"
+
+    if feature_specs:
+        with profiler.stage("features"):
+            dataset = add_features(
+                dataset,
+                feature_specs,
+                newest_first=cfg.features.newest_first,
+                verify=cfg.features.verify,
+            )
+
+    with profiler.stage("split"):
+        (
+            train_features,
+            train_targets,
+            validation_features,
+            validation_targets,
+            test_features,
+            test_targets,
+        ) = train_test_val_split(
+            dataset,
+            test_period_in_days=cfg.model.test_period_in_days,
+            validation_percentage=cfg.model.validation_percentage,
+            target_variable=cfg.model.target_variable,
+            horizon=cfg.model.horizon,
+        )
+
+    model = build_model(cfg.model.model_class, model_params, cfg.model.horizon)
     train_metrics, validation_metrics, test_metrics = training_pipeline(
         model,
         train_features,
@@ -49,78 +158,86 @@ def train_model(cfg: DictConfig) -> None:
         validation_targets,
         test_features,
         test_targets,
+        profiler=profiler,
     )
 
-    trading_history, percentage_gain_lost = strategy_simulation(
-        model, test_features, validation_metrics
-    )
+    with profiler.stage("simulate"):
+        trading_history, percentage_gain_lost = strategy_simulation(
+            model, test_features, validation_metrics
+        )
     logging.info(
         f"Total Gain/Loss after testing: {round(percentage_gain_lost*100, 5)}%"
     )
 
+    monte_carlo_results = None
+    if cfg.monte_carlo.n_paths:
+        with profiler.stage("monte_carlo"):
+            monte_carlo_results = monte_carlo_simulation(
+                model,
+                test_features,
+                n_paths=cfg.monte_carlo.n_paths,
+                block_length=cfg.monte_carlo.block_length,
+                random_state=cfg.monte_carlo.random_state,
+                max_workers=cfg.monte_carlo.max_workers,
+            )
+        summary = monte_carlo_results[1]
+        logging.info(
+            f"Monte Carlo over {summary['n_paths']} paths: median final assets "
+            f"{round(summary['final_assets_p50'], 5)}, P(loss) "
+            f"{round(summary['probability_of_loss']*100, 2)}%, mean max drawdown "
+            f"{round(summary['mean_max_drawdown']*100, 2)}%"
+        )
+
     base_model_name = "{}-{}".format(
         cfg.model.model_class, time.strftime("%Y%m%dT%H%M%S")
     )
 
-    model_directory = os.path.join(
-        cfg.data.directory_to_save_models_in, base_model_name
-    )
-    model_directories = [
-        cfg.data.directory_to_save_models_in,
-        cfg.data.directory_to_save_training_results_in,
-        os.path.join(
-            cfg.data.directory_to_save_training_results_in, base_model_name),
-        model_directory,
-    ]
-    for directory in model_directories:
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-    trading_history.to_csv(
-        os.path.join(
-            cfg.data.directory_to_save_training_results_in,
-            base_model_name,
-            "trading_history.csv",
-        ),
-        index=None,
-    )
-    logging.info("Trading History Saved")
-
-    metrics_dataframe = pd.DataFrame(
-        [train_metrics, validation_metrics, test_metrics])
-    metrics_dataframe.to_csv(
-        os.path.join(
+    with profiler.stage("save"):
+        results_directory = save_training_results(
             cfg.data.directory_to_save_training_results_in,
             base_model_name,
-            "model_metrics.csv",
-        ),
-        index=None,
-    )
-    logging.info("Model Metrics Saved")
-
-    if cfg.model.save_artifacts:
-
-        model_artifact = os.path.join(
-            model_directory, f"{base_model_name}.pickle")
-        with open(model_artifact, 'wb') as mfile:
-            pickle.dump(model, mfile)
-            mfile.close()
-        logging.info(f"Model Artifact saved: {model_artifact}")
-
-        val_metrics_json_file = os.path.join(
-            model_directory, "validation_metrics.json")
-        with open(val_metrics_json_file, "w") as jfile:
-            jfile.write(json.dumps(validation_metrics))
-            jfile.close()
-        logging.info(
-            f"Model Validation Metrics saved: {val_metrics_json_file}")
-
-        write_to_s3(cfg.aws.bucket,
-                    f"{base_model_name}/model.pickle", model_artifact)
-        write_to_s3(
-            cfg.aws.bucket,
-            f"{base_model_name}/validation_metrics.json",
-            val_metrics_json_file
+            trading_history,
+            [train_metrics, validation_metrics, test_metrics],
+            hyperparameters=model_params,
         )
+        if monte_carlo_results is not None:
+            save_monte_carlo_results(results_directory, *monte_carlo_results)
+
+        if cfg.model.save_artifacts:
+            save_model_artifacts(
+                cfg.data.directory_to_save_models_in,
+                base_model_name,
+                model,
+                validation_metrics,
+                bucket=cfg.aws.bucket,
+                model_class=cfg.model.model_class,
+                data_fingerprint=file_fingerprint(cfg.data.csv_file),
+                metrics=[train_metrics, validation_metrics, test_metrics],
+                feature_specs=feature_specs,
+                region_name=cfg.aws.region_name,
+            )
+
+        if run_cache is not None:
+            run_cache.put(
+                cache_key,
+                model,
+                trading_history,
+                [train_metrics, validation_metrics, test_metrics],
+                manifest={
+                    "base_model_name": base_model_name,
+                    "model_class": cfg.model.model_class,
+                    "model_params": model_params,
+                    "features": feature_specs,
+                    "horizon": cfg.model.horizon,
+                    "csv_file": cfg.data.csv_file,
+                    "validation_metrics": validation_metrics,
+                    "percentage_gain_lost": percentage_gain_lost,
+                },
+            )
+
+    profile_file = profiler.save(results_directory)
+    if profile_file is not None:
+        logging.info(f"Pipeline Profile saved: {profile_file}")
 
 
 if __name__ == "__main__":
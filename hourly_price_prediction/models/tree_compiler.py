@@ -0,0 +1,225 @@
+import weakref
+
+import numpy as np
+from sklearn.dummy import DummyRegressor
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+_compiled = weakref.WeakKeyDictionary()
+
+
+class CompiledTrees(object):
+    """
+    A fitted tree model flattened into contiguous node arrays:
+
+        feature[node]     feature tested at the node
+        threshold[node]   go left when `x[feature] <= threshold`
+        left/right[node]  child nodes; a leaf points to itself
+        value[node]       leaf output(s), shape (n_nodes, n_outputs)
+        roots[tree]       first node of each tree
+
+    The prediction is `base + scale * sum(tree values)`, divided by the
+    number of trees when `average` is set, which covers a single tree,
+    a random forest (mean of trees) and gradient boosting (initial
+    constant plus learning rate times the stages).
+
+    Like sklearn, features are cast to float32 before being compared with
+    the float64 thresholds, and tree values are accumulated in the same
+    order with the same operations, so predictions are bitwise identical
+    to the sklearn model's. The exception is a random forest with
+    `n_jobs > 1`: sklearn then sums the trees in whatever order its
+    threads finish, which changes between calls, and both only agree to
+    within a few ulps (the same forest with `n_jobs=1` agrees exactly).
+    """
+
+    def __init__(self, trees: list, base: float = 0.0, scale: float = 1.0, average: bool = False):
+        """
+        :param trees: (list) The fitted `sklearn.tree._tree.Tree` objects.
+        """
+
+        self.n_trees = len(trees)
+        self.base = base
+        self.scale = scale
+        self.average = average
+        self.n_outputs = int(trees[0].n_outputs)
+        self.max_depth = max(int(tree.max_depth) for tree in trees)
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            values.append(tree.value[:, :, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.left = np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp)
+        self.right = np.ascontiguousarray(np.concatenate(rights), dtype=np.intp)
+        self.value = np.ascontiguousarray(np.concatenate(values), dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+
+        # Python lists for the single row path, where indexing numpy
+        # arrays element by element would cost more than the walk itself.
+        self._nodes = list(zip(
+            self.feature.tolist(),
+            self.threshold.tolist(),
+            self.left.tolist(),
+            self.right.tolist(),
+        ))
+        self._leaf_values = self.value.tolist()
+        self._leaf_value = self.value[:, 0].tolist()
+        self._roots = self.roots.tolist()
+
+    def apply(self, features) -> np.ndarray:
+        """
+        Leaf reached in every tree by every row, all rows and trees moving
+        down one level per step.
+
+        :returns: (np.ndarray) Node ids, shape (n_rows, n_trees).
+        """
+
+        features = np.asarray(features, dtype=np.float32)
+        row_index = np.arange(len(features))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(features), self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = features[row_index, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, features) -> np.ndarray:
+        leaf_values = self.value[self.apply(features)]
+        predictions = np.full((len(leaf_values), self.n_outputs), self.base, dtype=np.float64)
+        for tree in range(self.n_trees):
+            predictions += self.scale * leaf_values[:, tree]
+        if self.average:
+            predictions /= self.n_trees
+        return predictions[:, 0] if self.n_outputs == 1 else predictions
+
+    def predict_one(self, row: list):
+        """
+        Prediction for a single row, walking the trees in plain Python.
+
+        :returns: (float) Or a list with one value per output.
+        """
+
+        row = np.asarray(row, dtype=np.float32).tolist()
+        nodes, scale = self._nodes, self.scale
+        leaves = []
+        for node in self._roots:
+            while True:
+                feature, threshold, left, right = nodes[node]
+                next_node = left if row[feature] <= threshold else right
+                if next_node == node:
+                    break
+                node = next_node
+            leaves.append(node)
+
+        if self.n_outputs == 1:
+            leaf_values = self._leaf_value
+            output = self.base
+            for node in leaves:
+                output += scale * leaf_values[node]
+            return output / self.n_trees if self.average else output
+
+        leaf_values = self._leaf_values
+        outputs = [self.base] * self.n_outputs
+        for node in leaves:
+            for index, value in enumerate(leaf_values[node]):
+                outputs[index] += scale * value
+        if self.average:
+            outputs = [output / self.n_trees for output in outputs]
+        return outputs
+
+
+class CompiledMultiOutput(object):
+    """One compiled model per output, for a `MultiOutputRegressor`."""
+
+    def __init__(self, compiled_estimators: list):
+        self.compiled_estimators = compiled_estimators
+
+    def predict(self, features) -> np.ndarray:
+        return np.column_stack(
+            [compiled.predict(features) for compiled in self.compiled_estimators])
+
+    def predict_one(self, row: list) -> list:
+        return [compiled.predict_one(row) for compiled in self.compiled_estimators]
+
+
+def _compile(model):
+    if isinstance(model, DecisionTreeRegressor):
+        return CompiledTrees([model.tree_])
+
+    if isinstance(model, RandomForestRegressor):
+        return CompiledTrees([tree.tree_ for tree in model.estimators_], average=True)
+
+    if isinstance(model, GradientBoostingRegressor):
+        if isinstance(model.init_, str) and model.init_ == "zero":
+            base = 0.0
+        elif isinstance(model.init_, DummyRegressor):
+            base = float(np.ravel(model.init_.constant_)[0])
+        else:
+            return None
+        return CompiledTrees(
+            [tree.tree_ for tree in model.estimators_[:, 0]],
+            base=base,
+            scale=float(model.learning_rate),
+        )
+
+    if isinstance(model, MultiOutputRegressor):
+        compiled_estimators = [compile_model(estimator) for estimator in model.estimators_]
+        if any(compiled is None for compiled in compiled_estimators):
+            return None
+        return CompiledMultiOutput(compiled_estimators)
+
+    return None
+
+
+def compile_model(model):
+    """
+    Compiles a fitted DecisionTreeRegressor, RandomForestRegressor,
+    GradientBoostingRegressor (or a MultiOutputRegressor of them) into a
+    flat array predictor. Results are cached per model object.
+
+    :returns: (CompiledTrees) Or None when `model` is not a supported tree
+        model, in which case the model itself should be used.
+    """
+
+    try:
+        return _compiled[model]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+
+    compiled = _compile(model)
+    _compiled[model] = compiled
+    return compiled
+
+
+def count_mismatches(model, compiled, features, max_ulps: int = 0) -> int:
+    """
+    Number of predictions on `features` where the compiled model, batched
+    or row by row, differs from the sklearn `model`.
+
+    :param max_ulps: (int) Differences of up to this many units in the
+        last place are not mismatches; 0 counts every difference.
+    """
+
+    features = np.asarray(features, dtype=np.float64)
+    expected = np.asarray(model.predict(features), dtype=np.float64)
+    batched = np.asarray(compiled.predict(features), dtype=np.float64)
+    single = np.asarray([compiled.predict_one(row) for row in features.tolist()])
+    tolerance = max_ulps * np.spacing(np.abs(expected))
+
+    def mismatching_rows(predictions: np.ndarray) -> int:
+        differs = np.abs(predictions.reshape(expected.shape) - expected) > tolerance
+        return int(np.sum(np.any(differs.reshape(len(features), -1), axis=1)))
+
+    return mismatching_rows(batched) + mismatching_rows(single)
@@ -1,11 +1,19 @@
+import json
 import logging
+import os
+import pickle
+from contextlib import nullcontext
 from math import sqrt
 
-import boto3
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import train_test_split
+from sklearn.multioutput import MultiOutputRegressor
+
+from hourly_price_prediction.data.s3_helper import (TRANSFER_CONFIG, S3Helper,
+                                                    get_s3_client)
 
 
 def get_model_class(model_class: str) -> BaseEstimator:
@@ -48,6 +56,14 @@ def get_model_class(model_class: str) -> BaseEstimator:
     elif model_class == "HuberRegressor".lower():
         from sklearn.linear_model import HuberRegressor as model_object
 
+    elif model_class == "OnlineSGDRegressor".lower():
+        from hourly_price_prediction.models.online import \
+            OnlineSGDRegressor as model_object
+
+    elif model_class == "StackedEnsemble".lower():
+        from hourly_price_prediction.models.ensemble import \
+            StackedEnsemble as model_object
+
     else:
         raise AssertionError(
             "Invalid Model Class passed to --model_class object")
@@ -55,40 +71,151 @@ def get_model_class(model_class: str) -> BaseEstimator:
     return model_object
 
 
+# Model classes whose `fit` accepts a 2D target natively; the others are
+# wrapped in a `MultiOutputRegressor` (one estimator per horizon step).
+NATIVE_MULTI_OUTPUT_MODELS = [
+    "linearregressor",
+    "ridge",
+    "elasticnet",
+    "decisiontreeregressor",
+    "randomforestregressor",
+    "kneighborsregressor",
+    "mlpregressor",
+]
+
+
+def build_model(model_class: str, model_params: dict = None, horizon: int = 1):
+    """
+    Instantiates `model_class` with `model_params`, as a multi-output model
+    predicting `horizon` values per row when `horizon` is above 1.
+
+    """
+
+    model = get_model_class(model_class)(**(model_params or {}))
+    if int(horizon) > 1 and model_class.lower() not in NATIVE_MULTI_OUTPUT_MODELS:
+        model = MultiOutputRegressor(model)
+    return model
+
+
+def horizon_targets(target_variable: str, horizon: int = 1) -> list:
+    """
+    The target columns of a `horizon` step model, as named by
+    `make_dataset.target_columns` (lower-cased): `nextclose`, then
+    `nextclose_2` ... `nextclose_<horizon>`.
+    """
+
+    return [target_variable] + [
+        f"{target_variable}_{step}" for step in range(2, int(horizon) + 1)
+    ]
+
+
 def score_metrics(actual_values: list, model_predictions: list, mode: str) -> dict:
     """
     Given a set of true values (actual_values) and model predicted values (model_predictions)
     this function will return a dictionary with various regression metrics.
+
+    For multi-horizon predictions (one column per step) the metrics are
+    averaged over the steps, `horizon` is recorded and the MAE of every
+    step is added as `mae_<step>`.
     """
 
     mse = mean_squared_error(actual_values, model_predictions)
-    return {
+    metrics = {
         "mode": str(mode).lower(),
         "mae": mean_absolute_error(actual_values, model_predictions),
         "mse": mean_squared_error(actual_values, model_predictions),
         "rmse": sqrt(mse),
         "r2": r2_score(actual_values, model_predictions),
     }
+    if np.ndim(model_predictions) == 2:
+        step_maes = mean_absolute_error(
+            actual_values, model_predictions, multioutput="raw_values")
+        metrics["horizon"] = len(step_maes)
+        for step, step_mae in enumerate(step_maes, start=1):
+            metrics[f"mae_{step}"] = step_mae
+    return metrics
 
 
-def feature_target_split(dataset: pd.DataFrame, target_variable: str) -> tuple:
+def feature_target_split(
+    dataset: pd.DataFrame, target_variable: str, horizon: int = 1
+) -> tuple:
     """
     Splits `dataset` into a feature and target dataframe on the `target_variable`
-    attribute.
+    attribute. Every target column of the dataset (`target_variable` and
+    its `_<step>` variants) is removed from the features, whatever the
+    `horizon` trained on, so future closes never leak into the features.
 
-    :returns: tuple(features, targets)
+    :returns: tuple(features, targets), targets being a dataframe of the
+        `horizon_targets` when `horizon` is above 1.
     """
 
-    features = dataset.drop(target_variable, axis=1)
-    targets = dataset[target_variable]
+    target_prefix = f"{target_variable}_"
+    all_targets = [
+        column for column in dataset.columns
+        if column == target_variable
+        or (column.startswith(target_prefix) and column[len(target_prefix):].isdigit())
+    ]
+    features = dataset.drop(all_targets, axis=1)
+    if int(horizon) > 1:
+        targets = dataset[horizon_targets(target_variable, horizon)]
+    else:
+        targets = dataset[target_variable]
     return (features, targets)
 
 
+def add_features(
+    dataset: pd.DataFrame,
+    feature_specs: list,
+    newest_first: bool = True,
+    verify: bool = True,
+) -> pd.DataFrame:
+    """
+    Appends the indicator features described by `feature_specs` to the
+    processed `dataset` and drops the rows at the start of the series
+    where they are not defined yet.
+
+    :param newest_first: (bool) `dataset` is in descending time order.
+    :param verify: (bool) Check that the incremental implementation the
+        trader runs reproduces every batch value on this dataset.
+    :returns: (pd.DataFrame) The dataset with one extra column per feature.
+    """
+    from hourly_price_prediction.features.indicators import (FeatureSet,
+                                                              dataset_columns)
+
+    logger = logging.getLogger(__name__)
+    feature_set = FeatureSet.from_specs(feature_specs)
+    if verify:
+        candles = pd.DataFrame(
+            {
+                field: dataset[column].values
+                for field, column in dataset_columns(dataset.columns).items()
+            }
+        )
+        if newest_first:
+            candles = candles.iloc[::-1].reset_index(drop=True)
+        mismatches = {
+            name: count
+            for name, count in feature_set.check_consistency(candles).items()
+            if count
+        }
+        assert not mismatches, f"Batch and incremental features disagree: {mismatches}"
+
+    dataset = feature_set.transform(dataset, newest_first=newest_first)
+    number_of_rows = len(dataset)
+    dataset = dataset.dropna(subset=feature_set.names)
+    logger.info(
+        f"Added features {feature_set.names}, dropped {number_of_rows - len(dataset)}"
+        " warm-up rows"
+    )
+    return dataset
+
+
 def train_test_val_split(
     dataset: pd.DataFrame,
     test_period_in_days: int,
     validation_percentage: float,
     target_variable: str,
+    horizon: int = 1,
 ) -> tuple:
     """
     Splits the `dataset` into training, testing, and validation splits by first
@@ -98,6 +225,7 @@ def train_test_val_split(
     data into training and validation sets according to the `validation_percentage`
     size.
 
+    :param horizon: (int) Number of target steps, see `feature_target_split`.
     :returns: tuple(train_features, train_targets, validation_features, validation_targets, test_features, test_targets)
     """
 
@@ -110,11 +238,11 @@ def train_test_val_split(
     if test_period_in_hours != 0:
         test_dataset = dataset.iloc[-test_period_in_hours:]
         test_features, test_targets = feature_target_split(
-            test_dataset, target_variable)
+            test_dataset, target_variable, horizon)
 
         dataset = dataset.iloc[:-test_period_in_hours]
 
-    features, targets = feature_target_split(dataset, target_variable)
+    features, targets = feature_target_split(dataset, target_variable, horizon)
     (
         train_features,
         validation_features,
@@ -153,21 +281,34 @@ def training_pipeline(
     validation_features,
     validation_targets,
     test_features,
-    test_targets
+    test_targets,
+    profiler=None,
 ) -> list:
+    """
+    Fits `model`, predicts every split and scores the predictions. When a
+    `PipelineProfiler` is passed the fit, predict and score stages are
+    recorded on it.
+    """
     logger = logging.getLogger(__name__)
-    model.fit(train_features, train_targets)
+
+    def stage(name):
+        return nullcontext() if profiler is None else profiler.stage(name)
+
+    with stage("fit"):
+        model.fit(train_features, train_targets)
     logger.info('Model Trained')
 
-    train_predictions = model.predict(train_features)
-    validation_predictions = model.predict(validation_features)
-    test_predictions = model.predict(test_features)
+    with stage("predict"):
+        train_predictions = model.predict(train_features)
+        validation_predictions = model.predict(validation_features)
+        test_predictions = model.predict(test_features)
     logger.info('Predictions Made')
 
-    train_metrics = score_metrics(train_targets, train_predictions, "train")
-    validation_metrics = score_metrics(
-        validation_targets, validation_predictions, "val")
-    test_metrics = score_metrics(test_targets, test_predictions, "test")
+    with stage("score"):
+        train_metrics = score_metrics(train_targets, train_predictions, "train")
+        validation_metrics = score_metrics(
+            validation_targets, validation_predictions, "val")
+        test_metrics = score_metrics(test_targets, test_predictions, "test")
     logger.info('Metrics Generated')
 
     return [train_metrics, validation_metrics, test_metrics]
@@ -183,6 +324,9 @@ def strategy_simulation(
     """
     This function tests a simple trading strategy given a model, dataset, and 
     the model's performance dictionary on the validation dataset.
+
+    The whole test set is predicted in one batched call. A multi-horizon
+    model acts on its average predicted close over the horizon.
     """
 
     asset_wallet_balance = 0.0
@@ -190,15 +334,18 @@ def strategy_simulation(
     amount_of_asset_to_exchange = 0.0
     amount_of_usd_to_exchange = 0.0
 
+    model_predictions = np.asarray(model.predict(test_dataset.values))
+    if model_predictions.ndim == 2:
+        model_predictions = model_predictions.mean(axis=1)
+
     trading_history = []
-    for step, (_, series) in enumerate(test_dataset.iterrows()):
+    for step, (current_close, model_prediction) in enumerate(
+        zip(test_dataset['currentclose'].values, model_predictions)
+    ):
 
         if step == 0:
             total_money = initial_money
 
-        current_close = series['currentclose']
-        model_prediction = model.predict(series.values.reshape(1, -1))
-
         action = 'do_nothing'
         if abs(model_prediction - current_close):
             if model_prediction - current_close > 0:
@@ -252,15 +399,154 @@ def strategy_simulation(
     return (trading_history, percentage_gain_lost)
 
 
-def download_from_s3(bucket: str, key: str, filename: str, region_name: str = 'us-east-2'):
+def save_training_results(
+    directory_to_save_training_results_in: str,
+    base_model_name: str,
+    trading_history: pd.DataFrame,
+    metrics: list,
+    hyperparameters: dict = None,
+) -> str:
+    """
+    Writes a training run into the results layout the analysis tools and
+    dashboards read: `<results>/<base_model_name>/trading_history.csv`,
+    `model_metrics.csv` and, when given, `hyperparameters.json`.
+
+    :returns: (str) The run's results directory.
+    """
+    logger = logging.getLogger(__name__)
+    results_directory = os.path.join(
+        directory_to_save_training_results_in, base_model_name)
+    if not os.path.exists(results_directory):
+        os.makedirs(results_directory)
+
+    trading_history.to_csv(
+        os.path.join(results_directory, "trading_history.csv"), index=None
+    )
+    logger.info("Trading History Saved")
+
+    metrics_dataframe = pd.DataFrame(metrics)
+    metrics_dataframe.to_csv(
+        os.path.join(results_directory, "model_metrics.csv"), index=None
+    )
+    logger.info("Model Metrics Saved")
+
+    if hyperparameters:
+        with open(os.path.join(results_directory, "hyperparameters.json"), "w") as jfile:
+            jfile.write(json.dumps(hyperparameters, default=str))
+            jfile.close()
+        logger.info("Hyperparameters Saved")
+
+    return results_directory
+
+
+def save_model_artifacts(
+    directory_to_save_models_in: str,
+    base_model_name: str,
+    model: BaseEstimator,
+    validation_metrics: dict,
+    bucket: str = None,
+    model_class: str = None,
+    data_fingerprint: str = None,
+    metrics: list = None,
+    feature_specs: list = None,
+    region_name: str = 'us-east-2',
+) -> tuple:
+    """
+    Pickles `model` and its validation metrics into
+    `<models>/<base_model_name>/` and, when a bucket is given, uploads both
+    to `<bucket>/<base_model_name>/` and registers the artifact as a
+    candidate version in the bucket's `ModelRegistry`.
+
+    :param data_fingerprint: (str) Digest of the training dataset, recorded
+        in the registry.
+    :param metrics: (list) Train/val/test metrics, recorded in the registry.
+    :param feature_specs: (list) Indicator features the model was trained
+        with, saved as `features.json` and recorded in the registry.
+    :param region_name: (str) AWS region of `bucket`.
+    :returns: tuple(model_artifact, validation_metrics_json_file)
+    """
+    logger = logging.getLogger(__name__)
+    model_directory = os.path.join(
+        directory_to_save_models_in, base_model_name)
+    if not os.path.exists(model_directory):
+        os.makedirs(model_directory)
+
+    model_artifact = os.path.join(
+        model_directory, f"{base_model_name}.pickle")
+    with open(model_artifact, 'wb') as mfile:
+        pickle.dump(model, mfile)
+        mfile.close()
+    logger.info(f"Model Artifact saved: {model_artifact}")
+
+    val_metrics_json_file = os.path.join(
+        model_directory, "validation_metrics.json")
+    with open(val_metrics_json_file, "w") as jfile:
+        jfile.write(json.dumps(validation_metrics))
+        jfile.close()
+    logger.info(
+        f"Model Validation Metrics saved: {val_metrics_json_file}")
+
+    features_json_file = None
+    if feature_specs:
+        features_json_file = os.path.join(model_directory, "features.json")
+        with open(features_json_file, "w") as jfile:
+            jfile.write(json.dumps(feature_specs))
+            jfile.close()
+        logger.info(f"Model Features saved: {features_json_file}")
+
+    if bucket is not None:
+        write_to_s3(bucket,
+                    f"{base_model_name}/model.pickle", model_artifact,
+                    region_name=region_name)
+        write_to_s3(
+            bucket,
+            f"{base_model_name}/validation_metrics.json",
+            val_metrics_json_file,
+            region_name=region_name,
+        )
+        if features_json_file is not None:
+            write_to_s3(
+                bucket, f"{base_model_name}/features.json", features_json_file,
+                region_name=region_name)
+
+        from hourly_price_prediction.models.registry import (ModelRegistry,
+                                                             file_sha256)
+        ModelRegistry(S3Helper(bucket, region_name=region_name)).register(
+            model_name=base_model_name,
+            model_class=model_class,
+            artifact_key=f"{base_model_name}/model.pickle",
+            artifact_sha256=file_sha256(model_artifact),
+            validation_metrics=validation_metrics,
+            data_fingerprint=data_fingerprint,
+            metrics=metrics,
+            features=feature_specs,
+        )
+
+    return (model_artifact, val_metrics_json_file)
+
+
+def download_from_s3(
+    bucket: str,
+    key: str,
+    filename: str,
+    region_name: str = 'us-east-2',
+    cache_directory: str = None,
+):
     """
     Given a Bucket and Key, this function will download the file
-    and store it at filename.
+    and store it at filename. With a `cache_directory` the download goes
+    through an `S3Cache` there and is skipped when the object is unchanged.
 
     """
 
-    s3_client = boto3.client('s3', region_name=region_name)
-    s3_response = s3_client.download_file(bucket, key, filename)
+    if cache_directory is not None:
+        from hourly_price_prediction.data.s3_cache import S3Cache
+        data_helper = S3Helper(bucket, region_name, cache=S3Cache(cache_directory))
+        return data_helper.download_from_s3(key, filename)
+
+    s3_client = get_s3_client(region_name)
+    s3_response = s3_client.download_file(
+        bucket, key, filename, Config=TRANSFER_CONFIG)
     return s3_response
 
 
@@ -271,6 +557,7 @@ def write_to_s3(bucket: str, key: str, filename: str, region_name: str = 'us-eas
 
     """
 
-    s3_client = boto3.client('s3', region_name='us-east-2')
-    s3_response = s3_client.upload_file(filename, bucket, key)
+    s3_client = get_s3_client(region_name)
+    s3_response = s3_client.upload_file(
+        filename, bucket, key, Config=TRANSFER_CONFIG)
     return s3_response
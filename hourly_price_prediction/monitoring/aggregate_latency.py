@@ -0,0 +1,71 @@
+import logging
+import os
+from glob import glob
+
+import hydra
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+from latency import emf_stage_latencies, parse_emf_line
+
+
+def collect_stage_latencies(log_files: list) -> pd.DataFrame:
+    """
+    Reads every EMF line emitted by `StageTimer` from `log_files` into a
+    DataFrame with one row per invocation and one column per stage.
+    """
+
+    invocations = []
+    for log_file in log_files:
+        with open(log_file, "r") as lfile:
+            for line in lfile:
+                document = parse_emf_line(line)
+                if document is not None:
+                    invocations.append(emf_stage_latencies(document))
+            lfile.close()
+    return pd.DataFrame(invocations)
+
+
+def summarize_stage_latencies(latencies: pd.DataFrame) -> pd.DataFrame:
+    """Count, mean, p50, p95, p99 and max in milliseconds for every stage."""
+
+    summary = {}
+    for stage in latencies.columns:
+        values = latencies[stage].dropna().values
+        summary[stage] = {
+            "count": len(values),
+            "mean": np.mean(values),
+            "p50": np.percentile(values, 50),
+            "p95": np.percentile(values, 95),
+            "p99": np.percentile(values, 99),
+            "max": np.max(values),
+        }
+    summary = pd.DataFrame(summary).T
+    summary.index.name = "stage"
+    return summary.sort_values("p50", ascending=False)
+
+
+@hydra.main(config_path="../../configs/monitoring", config_name="latency")
+def aggregate_latency(cfg: DictConfig):
+
+    log_files = sorted(glob(cfg.data.log_files))
+    assert log_files, f"No log files match: {cfg.data.log_files}"
+
+    latencies = collect_stage_latencies(log_files)
+    assert not latencies.empty, f"No EMF lines found in {len(log_files)} log files"
+    summary = summarize_stage_latencies(latencies)
+
+    output_directory = os.path.dirname(cfg.data.output_file)
+    if output_directory and not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    summary.to_csv(cfg.data.output_file)
+
+    logging.info(f"{len(latencies)} invocations from {len(log_files)} log files")
+    logging.info(f"Stage latencies [ms]:\n{summary.round(3).to_string()}")
+    logging.info(f"Latency summary written to {cfg.data.output_file}")
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    aggregate_latency()
@@ -0,0 +1,247 @@
+import logging
+import math
+
+from botocore.exceptions import ClientError
+
+
+class ResidualDriftMonitor(object):
+    """
+    Tracks how far the deployed model's live predictions drift from the
+    error it showed on the validation set.
+
+    Every trading history record holds the next close the model expected
+    (`model_prediction_1` for a multi-horizon model, whose
+    `model_prediction` is the mean over its horizon), and the following
+    record holds the `close` that came; their difference is one residual.
+    Ticks the trader sat out for lack of feature history carry the
+    current close instead of a prediction and are not scored. Residuals over the last
+    `window` hours are kept with running sums, so each record costs O(1):
+
+        mae_ratio   rolling MAE over the validation MAE
+        rmse_ratio  rolling RMSE over the validation RMSE, when known
+        bias_z      mean residual over its standard error: the model
+                    keeps predicting too high (or too low)
+        cusum       one-sided CUSUM of |residual| / validation MAE above
+                    1 + `cusum_slack`, which catches a sustained, moderate
+                    rise in error before the window average does
+
+    Drift is reported once at least `min_residuals` residuals are in the
+    window and any of them crosses its threshold. The state is kept
+    between runs as `state_key`, and starts afresh whenever the deployed
+    model changes.
+    """
+
+    state_key = "monitoring/drift_state.json"
+
+    def __init__(
+        self,
+        window: int = 168,
+        min_residuals: int = 24,
+        max_error_ratio: float = 1.5,
+        max_bias_z: float = 4.0,
+        cusum_slack: float = 0.5,
+        cusum_threshold: float = 24.0,
+        granularity: int = 3600,
+    ):
+        """
+        :param window: (int) Residuals in the rolling statistics.
+        :param min_residuals: (int) Residuals needed before drift is reported.
+        :param max_error_ratio: (float) Largest rolling MAE (and RMSE), as a
+            multiple of the validation MAE (and RMSE), that is not drift.
+        :param max_bias_z: (float) Largest |bias_z| that is not drift.
+        :param cusum_slack: (float) Error ratio above 1 the CUSUM tolerates.
+        :param cusum_threshold: (float) CUSUM value that is drift.
+        :param granularity: (int) Seconds between consecutive records. A
+            prediction is only scored against the close of the next record.
+        """
+        self.window = window
+        self.min_residuals = min_residuals
+        self.max_error_ratio = max_error_ratio
+        self.max_bias_z = max_bias_z
+        self.cusum_slack = cusum_slack
+        self.cusum_threshold = cusum_threshold
+        self.granularity = granularity
+        self.state = self._initial_state()
+
+    @staticmethod
+    def _initial_state() -> dict:
+        return {
+            "model": None,
+            "validation_mae": None,
+            "validation_rmse": None,
+            "last_key": None,
+            "pending_prediction": None,
+            "pending_timestamp": None,
+            "last_timestamp": None,
+            "residuals": [],
+            "residual_sum": 0.0,
+            "absolute_sum": 0.0,
+            "squared_sum": 0.0,
+            "cusum": 0.0,
+            "n_residuals": 0,
+            "last_retrain_timestamp": None,
+            "retrains": 0,
+        }
+
+    def load(self, data_helper, state_key: str = None) -> None:
+        logger = logging.getLogger(__name__)
+        try:
+            self.state = data_helper.get_json(state_key or self.state_key)
+        except (ClientError, FileNotFoundError):
+            logger.info("No drift state stored yet")
+
+    def save(self, data_helper, state_key: str = None) -> None:
+        data_helper.put_json(state_key or self.state_key, self.state)
+
+    def set_model(self, model_name: str, validation_metrics: dict) -> None:
+        """
+        Monitors `model_name` from now on. The residuals of the previous
+        model are dropped; the history watermark and the retrain bookkeeping
+        are kept.
+        """
+
+        logger = logging.getLogger(__name__)
+        state = self.state
+        if state["model"] is not None:
+            logger.info(f"Deployed model changed from {state['model']} to {model_name}")
+        kept = {
+            name: state[name]
+            for name in ["last_key", "last_timestamp", "last_retrain_timestamp", "retrains"]
+        }
+        self.state = self._initial_state()
+        self.state.update(kept)
+        self.state["model"] = model_name
+        self.state["validation_mae"] = float(validation_metrics["mae"])
+        if validation_metrics.get("rmse") is not None:
+            self.state["validation_rmse"] = float(validation_metrics["rmse"])
+        elif validation_metrics.get("mse") is not None:
+            self.state["validation_rmse"] = math.sqrt(float(validation_metrics["mse"]))
+
+    def update(self, record: dict) -> bool:
+        """
+        Scores the previous record's prediction against this record's close
+        and keeps this record's prediction for the next one. Records not
+        newer than the last one seen are ignored. Call `set_model` first.
+
+        :returns: (bool) Whether a residual was added.
+        """
+
+        state = self.state
+        timestamp = record["timestamp"]
+        if state["last_timestamp"] is not None and timestamp <= state["last_timestamp"]:
+            return False
+        state["last_timestamp"] = timestamp
+
+        added = False
+        if (
+            state["pending_prediction"] is not None
+            and timestamp - state["pending_timestamp"] == self.granularity
+        ):
+            self._add_residual(float(record["close"]) - state["pending_prediction"])
+            added = True
+
+        state["pending_prediction"] = self._prediction(record)
+        state["pending_timestamp"] = timestamp
+        return added
+
+    @staticmethod
+    def _prediction(record: dict) -> float:
+        """The next close `record` predicted, None when it sat out."""
+
+        prediction = record.get("model_prediction_1", record.get("model_prediction"))
+        if prediction is None or record.get("sat_out"):
+            return None
+        # Records written before `sat_out` existed: a sit-out tick stores
+        # the current close as its prediction.
+        if "sat_out" not in record and float(prediction) == float(record["close"]):
+            return None
+        return float(prediction)
+
+    def _add_residual(self, residual: float) -> None:
+        state = self.state
+        residuals = state["residuals"]
+        residuals.append(residual)
+        state["residual_sum"] += residual
+        state["absolute_sum"] += abs(residual)
+        state["squared_sum"] += residual * residual
+        if len(residuals) > self.window:
+            dropped = residuals.pop(0)
+            state["residual_sum"] -= dropped
+            state["absolute_sum"] -= abs(dropped)
+            state["squared_sum"] -= dropped * dropped
+        state["n_residuals"] += 1
+        state["cusum"] = max(
+            0.0,
+            state["cusum"] + abs(residual) / state["validation_mae"] - (1.0 + self.cusum_slack),
+        )
+
+    @property
+    def statistics(self) -> dict:
+        """The rolling residual statistics; None where undefined."""
+
+        state = self.state
+        n = len(state["residuals"])
+        statistics = {
+            "model": state["model"],
+            "window_residuals": n,
+            "rolling_mae": None,
+            "mae_ratio": None,
+            "rolling_rmse": None,
+            "rmse_ratio": None,
+            "bias": None,
+            "bias_z": None,
+            "cusum": state["cusum"],
+        }
+        if n == 0:
+            return statistics
+
+        rolling_mae = state["absolute_sum"] / n
+        rolling_rmse = math.sqrt(max(state["squared_sum"] / n, 0.0))
+        bias = state["residual_sum"] / n
+        statistics["rolling_mae"] = rolling_mae
+        statistics["mae_ratio"] = rolling_mae / state["validation_mae"]
+        statistics["rolling_rmse"] = rolling_rmse
+        if state["validation_rmse"]:
+            statistics["rmse_ratio"] = rolling_rmse / state["validation_rmse"]
+        statistics["bias"] = bias
+        if n > 1:
+            residual_std = math.sqrt(max(state["squared_sum"] / n - bias * bias, 0.0))
+            if residual_std > 0:
+                statistics["bias_z"] = bias / (residual_std / math.sqrt(n))
+        return statistics
+
+    def drift_reasons(self) -> list:
+        """:returns: (list) The thresholds crossed, empty when there is no drift."""
+
+        statistics = self.statistics
+        if statistics["window_residuals"] < self.min_residuals:
+            return []
+
+        reasons = []
+        if statistics["mae_ratio"] > self.max_error_ratio:
+            reasons.append(
+                f"rolling MAE is {statistics['mae_ratio']:.2f}x the validation MAE")
+        rmse_ratio = statistics["rmse_ratio"]
+        if rmse_ratio is not None and rmse_ratio > self.max_error_ratio:
+            reasons.append(
+                f"rolling RMSE is {rmse_ratio:.2f}x the validation RMSE")
+        if statistics["bias_z"] is not None and abs(statistics["bias_z"]) > self.max_bias_z:
+            reasons.append(f"residuals are biased, z = {statistics['bias_z']:.1f}")
+        if statistics["cusum"] > self.cusum_threshold:
+            reasons.append(f"error CUSUM is {statistics['cusum']:.1f}")
+        return reasons
+
+    def mark_retrained(self) -> None:
+        """
+        Records a retrain at the last record's time. The residuals are
+        cleared, so another retrain needs fresh evidence of drift.
+        """
+
+        state = self.state
+        state["residuals"] = []
+        state["residual_sum"] = 0.0
+        state["absolute_sum"] = 0.0
+        state["squared_sum"] = 0.0
+        state["cusum"] = 0.0
+        state["last_retrain_timestamp"] = state["last_timestamp"]
+        state["retrains"] += 1
@@ -0,0 +1,114 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+EMF_NAMESPACE = "HourlyPricePrediction"
+
+
+class StageTimer(object):
+    """
+    Collects wall-clock durations for the named stages of one invocation
+    and emits them as a single CloudWatch Embedded Metric Format line.
+
+    Usage:
+        timer = StageTimer(dimensions={"Service": "asset-trader"})
+        with timer.stage("model_download"):
+            ...
+        timer.emit(properties={"model": model_name})
+    """
+
+    def __init__(
+        self,
+        namespace: str = EMF_NAMESPACE,
+        dimensions: dict = None,
+        clock=time.perf_counter,
+    ):
+        self.namespace = namespace
+        self.dimensions = {} if dimensions is None else dict(dimensions)
+        self.clock = clock
+        self.stages = {}
+        self._started = clock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the body of the `with` block under `name`."""
+
+        stage_start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, (self.clock() - stage_start) * 1000)
+
+    def record(self, name: str, milliseconds: float) -> None:
+        """Adds `milliseconds` to stage `name`, repeated stages accumulate."""
+        self.stages[name] = self.stages.get(name, 0.0) + milliseconds
+
+    def to_emf(self, properties: dict = None) -> dict:
+        """
+        Builds the EMF document: every stage, plus `total`, becomes a metric
+        in milliseconds under `self.dimensions`; `properties` are attached
+        as searchable, non-metric fields.
+        """
+
+        stages = dict(self.stages)
+        stages["total"] = (self.clock() - self._started) * 1000
+
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(self.dimensions.keys())],
+                        "Metrics": [
+                            {"Name": name, "Unit": "Milliseconds"}
+                            for name in stages
+                        ],
+                    }
+                ],
+            }
+        }
+        document.update(properties or {})
+        document.update(self.dimensions)
+        document.update(stages)
+        return document
+
+    def emit(self, properties: dict = None, stream=None) -> str:
+        """Writes the EMF document as one JSON line to `stream` (stdout)."""
+
+        line = json.dumps(self.to_emf(properties), default=str)
+        stream = sys.stdout if stream is None else stream
+        stream.write(line + "\n")
+        stream.flush()
+        return line
+
+
+def parse_emf_line(line: str) -> dict:
+    """
+    Extracts the EMF document from a log line, tolerating the timestamp and
+    request id prefixes CloudWatch adds. Returns None for any other line.
+    """
+
+    start = line.find("{")
+    if start < 0:
+        return None
+    try:
+        document = json.loads(line[start:])
+    except ValueError:
+        return None
+    if not isinstance(document, dict) or "_aws" not in document:
+        return None
+    return document
+
+
+def emf_stage_latencies(document: dict) -> dict:
+    """Returns {stage: milliseconds} for the metrics declared in `document`."""
+
+    latencies = {}
+    for directive in document["_aws"].get("CloudWatchMetrics", []):
+        for metric in directive.get("Metrics", []):
+            name = metric["Name"]
+            if name in document:
+                latencies[name] = float(document[name])
+    return latencies
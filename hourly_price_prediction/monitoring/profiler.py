@@ -0,0 +1,148 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def max_rss_megabytes() -> float:
+    """Peak resident set size of this process so far, in megabytes."""
+
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss / 1024 ** 2
+    return max_rss / 1024
+
+
+class PipelineProfiler(object):
+    """
+    Records wall time, CPU time and memory for each stage of an offline
+    pipeline. Disabled profilers cost nothing, so pipelines can always wrap
+    their stages and let the `profile.enabled` config flag decide.
+
+    Usage:
+        profiler = PipelineProfiler(enabled=cfg.profile.enabled)
+        with profiler.stage("fit"):
+            model.fit(features, targets)
+        profiler.save(results_directory)
+    """
+
+    def __init__(
+        self, enabled: bool = False, trace_memory: bool = True, capture_cprofile: bool = False
+    ):
+        """
+        :param enabled: (bool) Whether to record anything at all.
+        :param trace_memory: (bool) Track the peak Python heap of each stage
+            with tracemalloc. Accurate, but slows allocation heavy stages.
+        :param capture_cprofile: (bool) Run every stage under cProfile and
+            keep the stats of the slowest one.
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.capture_cprofile = capture_cprofile
+        self.stages = []
+        self.metadata = {}
+        self._slowest_profile = None
+        self._slowest_wall_seconds = -1.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profiles the body of the `with` block as stage `name`."""
+
+        if not self.enabled:
+            yield
+            return
+
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            traced_start, _ = tracemalloc.get_traced_memory()
+
+        profile = cProfile.Profile() if self.capture_cprofile else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+
+            stage_record = {
+                "stage": name,
+                "wall_seconds": wall_seconds,
+                "cpu_seconds": cpu_seconds,
+                "peak_traced_memory_mb": None,
+                "max_rss_mb": max_rss_megabytes(),
+            }
+            if self.trace_memory:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                stage_record["peak_traced_memory_mb"] = (
+                    max(traced_peak - traced_start, 0) / 1024 ** 2
+                )
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(stage_record)
+
+            if profile is not None and wall_seconds > self._slowest_wall_seconds:
+                self._slowest_wall_seconds = wall_seconds
+                self._slowest_profile = (name, profile)
+
+    def add_metadata(self, **metadata) -> None:
+        """Attaches run details (model class, dataset size, ...) to the report."""
+        self.metadata.update(metadata)
+
+    def to_dict(self) -> dict:
+        slowest_stage = None
+        if self.stages:
+            slowest_stage = max(self.stages, key=lambda s: s["wall_seconds"])["stage"]
+        return {
+            "metadata": self.metadata,
+            "total_wall_seconds": sum(s["wall_seconds"] for s in self.stages),
+            "total_cpu_seconds": sum(s["cpu_seconds"] for s in self.stages),
+            "slowest_stage": slowest_stage,
+            "stages": self.stages,
+        }
+
+    def save(self, directory: str, filename: str = "profile.json") -> str:
+        """
+        Writes the report to `directory/filename` and, when cProfile capture
+        is on, the slowest stage's stats to `directory/profile-<stage>.prof`
+        (open with `python -m pstats` or snakeviz).
+
+        :returns: (str) Path to the JSON report, or None when disabled.
+        """
+
+        if not self.enabled:
+            return None
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        report = self.to_dict()
+        if self._slowest_profile is not None:
+            stage_name, profile = self._slowest_profile
+            profile_file = os.path.join(directory, f"profile-{stage_name}.prof")
+            profile.dump_stats(profile_file)
+            report["cprofile_file"] = os.path.basename(profile_file)
+
+        report_file = os.path.join(directory, filename)
+        with open(report_file, "w") as jfile:
+            jfile.write(json.dumps(report, indent=2))
+            jfile.close()
+        return report_file
@@ -0,0 +1,114 @@
+import logging
+import os
+import subprocess
+
+import hydra
+from botocore.exceptions import ClientError
+from omegaconf import DictConfig
+
+from hourly_price_prediction.data.s3_helper import S3Helper
+from hourly_price_prediction.data.trading_history import TRADING_HISTORY_PREFIX
+from hourly_price_prediction.models.registry import ModelRegistry
+from hourly_price_prediction.monitoring.drift import ResidualDriftMonitor
+
+
+def validation_metrics_of(data_helper, model_name: str) -> dict:
+    """
+    The validation metrics the trader compares `model_name` with: the
+    production manifest's when it is the registry's production model,
+    `<model_name>/validation_metrics.json` otherwise (a pinned MODEL_NAME).
+    """
+
+    manifest = ModelRegistry(data_helper).production()
+    if manifest is not None and manifest["model_name"] == model_name:
+        return manifest["validation_metrics"]
+    return data_helper.get_json(os.path.join(model_name, "validation_metrics.json"))
+
+
+def observe_new_records(data_helper, monitor: ResidualDriftMonitor) -> int:
+    """
+    Feeds the trading history records written since the monitor's last run
+    to it, in time order. Only the keys after the stored `last_key` are
+    listed and read.
+
+    :returns: (int) Number of records read.
+    """
+
+    logger = logging.getLogger(__name__)
+    keys = data_helper.list_keys(
+        prefix=TRADING_HISTORY_PREFIX, start_after=monitor.state["last_key"])
+    for key in keys:
+        record = data_helper.get_json(key, immutable=True)
+        model_name = record.get("model")
+        if model_name is not None and model_name != monitor.state["model"]:
+            try:
+                monitor.set_model(model_name, validation_metrics_of(data_helper, model_name))
+            except (ClientError, FileNotFoundError):
+                logger.warning(f"No validation metrics for {model_name}, skipping its records")
+                monitor.state["model"] = None
+        if monitor.state["model"] is not None:
+            monitor.update(record)
+        monitor.state["last_key"] = key
+    return len(keys)
+
+
+def cooling_down(monitor: ResidualDriftMonitor, cooldown_hours: float) -> bool:
+    """
+    Whether the last retrain was less than `cooldown_hours` ago, measured
+    in trading history time so that a backlog of records counts.
+    """
+
+    last_retrain = monitor.state["last_retrain_timestamp"]
+    return (
+        last_retrain is not None
+        and monitor.state["last_timestamp"] - last_retrain < cooldown_hours * 3600
+    )
+
+
+def run_retrain_job(commands: list, working_directory: str) -> bool:
+    """
+    Runs the retrain-and-evaluate `commands` one after the other.
+
+    :returns: (bool) Whether every command succeeded.
+    """
+
+    logger = logging.getLogger(__name__)
+    for command in commands:
+        logger.info(f"Running: {command}")
+        completed = subprocess.run(command, shell=True, cwd=working_directory)
+        if completed.returncode != 0:
+            logger.error(f"Retrain job failed with exit code {completed.returncode}: {command}")
+            return False
+    return True
+
+
+@hydra.main(config_path="../../configs/monitoring", config_name="drift")
+def schedule_retraining(cfg: DictConfig):
+
+    data_helper = S3Helper(cfg.aws.bucket, cfg.aws.region_name)
+    monitor = ResidualDriftMonitor(**cfg.drift)
+    monitor.load(data_helper)
+
+    n_records = observe_new_records(data_helper, monitor)
+    statistics = monitor.statistics
+    logging.info(f"Read {n_records} new trading history records")
+    logging.info(f"Residual statistics: {statistics}")
+
+    reasons = monitor.drift_reasons()
+    if not reasons:
+        logging.info("No drift, nothing to retrain")
+    elif cooling_down(monitor, cfg.retrain.cooldown_hours):
+        logging.info(f"Drift ({'; '.join(reasons)}), but a retrain ran recently")
+    else:
+        logging.info(f"Drift detected: {'; '.join(reasons)}")
+        if run_retrain_job(list(cfg.retrain.commands), hydra.utils.get_original_cwd()):
+            monitor.mark_retrained()
+            logging.info("Retrained and evaluated, promote the new model to deploy it")
+
+    monitor.save(data_helper)
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    schedule_retraining()
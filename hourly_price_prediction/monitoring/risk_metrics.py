@@ -0,0 +1,388 @@
+import logging
+import math
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+HOURS_PER_YEAR = 24 * 365
+
+TRADE_ACTIONS = ("buy", "sell")
+
+# Columns of `risk_metrics_matrix`, before the optional trade columns.
+MATRIX_METRICS = (
+    "n_records",
+    "total_assets",
+    "total_return",
+    "annualized_return",
+    "annualized_volatility",
+    "sharpe_ratio",
+    "sortino_ratio",
+    "max_drawdown",
+    "calmar_ratio",
+)
+
+
+def _record_fields(record: dict) -> tuple:
+    """
+    (total_assets, cash, action) of a trading history record, either a
+    live trader record (`close`, `asset_wallet`, `usd_wallet`) or a
+    `strategy_simulation` row (`total_assets`, `total_money`).
+    """
+
+    if "total_assets" in record:
+        total_assets = float(record["total_assets"])
+    else:
+        total_assets = float(record["close"]) * float(record["asset_wallet"]) + float(
+            record["usd_wallet"])
+    cash = float(record["usd_wallet"] if "usd_wallet" in record else record["total_money"])
+    return (total_assets, cash, record.get("action", "do_nothing"))
+
+
+def _history_columns(trading_history) -> tuple:
+    """`_record_fields` for every row of a trading history, in time order."""
+
+    if "total_assets" in trading_history.columns:
+        total_assets = trading_history["total_assets"].values.astype(float)
+    else:
+        total_assets = (
+            trading_history["close"].values.astype(float)
+            * trading_history["asset_wallet"].values.astype(float)
+            + trading_history["usd_wallet"].values.astype(float)
+        )
+    cash_column = "usd_wallet" if "usd_wallet" in trading_history.columns else "total_money"
+    cash = trading_history[cash_column].values.astype(float)
+    if "action" in trading_history.columns:
+        actions = trading_history["action"].values
+    else:
+        actions = np.full(len(trading_history), "do_nothing", dtype=object)
+    return (total_assets, cash, actions)
+
+
+def _drawdown(total_assets: float, peak_assets: float) -> float:
+    """Fall from `peak_assets`; 0 while there has been no positive peak."""
+    return 1.0 - total_assets / peak_assets if peak_assets > 0 else 0.0
+
+
+def _metrics(
+    n_records: int,
+    first_assets: float,
+    last_assets: float,
+    n_returns: int,
+    return_sum: float,
+    squared_return_sum: float,
+    downside_squared_sum: float,
+    peak_assets: float,
+    max_drawdown: float,
+    trades: int,
+    wins: int,
+    traded_value: float,
+    assets_sum: float,
+) -> dict:
+    """The reported metrics, from the running sums; None where undefined."""
+
+    metrics = {
+        "n_records": n_records,
+        "total_assets": last_assets,
+        "total_return": None,
+        "annualized_volatility": None,
+        "sharpe_ratio": None,
+        "sortino_ratio": None,
+        "max_drawdown": max_drawdown,
+        "current_drawdown": None,
+        "trades": trades,
+        "win_rate": None,
+        "turnover": None,
+    }
+    if n_records == 0:
+        return metrics
+
+    if first_assets > 0:
+        metrics["total_return"] = last_assets / first_assets - 1.0
+    metrics["current_drawdown"] = _drawdown(last_assets, peak_assets)
+    if assets_sum > 0:
+        metrics["turnover"] = traded_value / (assets_sum / n_records)
+    if trades:
+        metrics["win_rate"] = wins / trades
+    if n_returns:
+        mean_return = return_sum / n_returns
+        hourly_std = math.sqrt(max(squared_return_sum / n_returns - mean_return ** 2, 0.0))
+        metrics["annualized_volatility"] = hourly_std * math.sqrt(HOURS_PER_YEAR)
+        if hourly_std > 0:
+            metrics["sharpe_ratio"] = mean_return / hourly_std * math.sqrt(HOURS_PER_YEAR)
+        downside_deviation = math.sqrt(downside_squared_sum / n_returns)
+        if downside_deviation > 0:
+            metrics["sortino_ratio"] = (
+                mean_return / downside_deviation * math.sqrt(HOURS_PER_YEAR))
+    return metrics
+
+
+def risk_metrics(trading_history) -> dict:
+    """
+    Batch computation of the `StreamingRiskMetrics` metrics over a whole
+    trading history, sorted in ascending time order.
+
+    Running sums are taken with `np.cumsum`, which adds in the same order
+    as the streaming updates, so both give bitwise identical metrics. The
+    sums of returns and squared returns are safe here because hourly
+    returns have a mean far below their standard deviation.
+    """
+
+    total_assets, cash, actions = _history_columns(trading_history)
+    n_records = len(total_assets)
+    if n_records == 0:
+        return _metrics(0, None, None, 0, 0.0, 0.0, 0.0, None, 0.0, 0, 0, 0.0, 0.0)
+
+    def running_sum(values: np.ndarray) -> float:
+        return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+    # Like `update`, a return is only taken between positive total assets.
+    # math.log, like `update`: numpy's vectorized log can round the last
+    # bit differently.
+    has_return = (total_assets[1:] > 0) & (total_assets[:-1] > 0)
+    returns = np.fromiter(
+        map(math.log, total_assets[1:][has_return] / total_assets[:-1][has_return]),
+        dtype=float,
+        count=int(np.sum(has_return)),
+    )
+    downside_returns = np.minimum(returns, 0.0)
+    peaks = np.maximum.accumulate(total_assets)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdowns = np.where(peaks > 0, 1.0 - total_assets / peaks, 0.0)
+    is_trade = np.isin(actions[:-1], TRADE_ACTIONS)[has_return]
+
+    return _metrics(
+        n_records=n_records,
+        first_assets=float(total_assets[0]),
+        last_assets=float(total_assets[-1]),
+        n_returns=len(returns),
+        return_sum=running_sum(returns),
+        squared_return_sum=running_sum(returns * returns),
+        downside_squared_sum=running_sum(downside_returns * downside_returns),
+        peak_assets=float(peaks[-1]),
+        max_drawdown=float(np.max(drawdowns)),
+        trades=int(np.sum(is_trade)),
+        wins=int(np.sum(is_trade & (returns > 0))),
+        traded_value=running_sum(np.abs(np.diff(cash))),
+        assets_sum=running_sum(total_assets),
+    )
+
+
+class StreamingRiskMetrics(object):
+    """
+    Risk metrics of a growing trading history, updated in O(1) per new
+    record and kept between trader invocations as `state_key`:
+
+        annualized_volatility  std of hourly log returns of total assets,
+                               scaled by sqrt(24 * 365)
+        sharpe_ratio           annualized mean / std of hourly returns
+        sortino_ratio          annualized mean / downside deviation
+        max_drawdown           largest fall from a previous peak
+        win_rate               share of buys and sells followed by a gain
+        turnover               traded cash over average total assets
+
+    Returns are only taken between records with positive total assets, so
+    an empty or drained account (or a zero balance read) is skipped rather
+    than failing the trader; drawdowns are 0 until there is a positive peak.
+
+    The state holds running sums only, so `metrics` is read without
+    touching the history and matches `risk_metrics` on the same records.
+    It is stored per trader and asset, so the Lambda and the trading daemon
+    each have a single writer for their own state.
+    """
+
+    state_key = "monitoring/{trader}/{asset}/risk_metrics.json"
+
+    def __init__(self, asset: str = "ETH-USD", trader: str = "asset-trader"):
+        """
+        :param asset: (str) Product the trader trades, e.g. ETH-USD.
+        :param trader: (str) `asset-trader` (the Lambda) or `trading-daemon`.
+        """
+        self.state_key = self.state_key.format(trader=trader, asset=asset)
+        self.state = self._initial_state()
+
+    @staticmethod
+    def _initial_state() -> dict:
+        return {
+            "timestamp": None,
+            "n_records": 0,
+            "first_assets": None,
+            "last_assets": None,
+            "last_cash": None,
+            "last_action": None,
+            "n_returns": 0,
+            "return_sum": 0.0,
+            "squared_return_sum": 0.0,
+            "downside_squared_sum": 0.0,
+            "peak_assets": None,
+            "max_drawdown": 0.0,
+            "trades": 0,
+            "wins": 0,
+            "traded_value": 0.0,
+            "assets_sum": 0.0,
+        }
+
+    def load(self, data_helper, state_key: str = None) -> None:
+        logger = logging.getLogger(__name__)
+        try:
+            self.state = data_helper.get_json(state_key or self.state_key)
+        except (ClientError, FileNotFoundError):
+            logger.info("No risk metrics stored yet")
+
+    def save(self, data_helper, state_key: str = None) -> None:
+        data_helper.put_json(state_key or self.state_key, self.state)
+
+    def update(self, record: dict) -> dict:
+        """
+        Adds the next trading history record. A record with the same
+        `timestamp` as the previous one is ignored.
+
+        :returns: (dict) The current metrics.
+        """
+
+        state = self.state
+        timestamp = record.get("timestamp")
+        if timestamp is not None and state["timestamp"] == timestamp:
+            return self.metrics
+        total_assets, cash, action = _record_fields(record)
+
+        if state["n_records"] == 0:
+            state["first_assets"] = total_assets
+            state["peak_assets"] = total_assets
+        else:
+            # No return into or out of an empty (or unread) account.
+            if total_assets > 0 and state["last_assets"] > 0:
+                log_return = math.log(total_assets / state["last_assets"])
+                state["n_returns"] += 1
+                state["return_sum"] += log_return
+                state["squared_return_sum"] += log_return * log_return
+                downside_return = min(log_return, 0.0)
+                state["downside_squared_sum"] += downside_return * downside_return
+                if state["last_action"] in TRADE_ACTIONS:
+                    state["trades"] += 1
+                    state["wins"] += log_return > 0
+            state["traded_value"] += abs(cash - state["last_cash"])
+            state["peak_assets"] = max(state["peak_assets"], total_assets)
+
+        state["max_drawdown"] = max(
+            state["max_drawdown"], _drawdown(total_assets, state["peak_assets"]))
+        state["n_records"] += 1
+        state["assets_sum"] += total_assets
+        state["last_assets"] = total_assets
+        state["last_cash"] = cash
+        state["last_action"] = action
+        state["timestamp"] = timestamp
+        return self.metrics
+
+    def update_many(self, records: list) -> dict:
+        for record in records:
+            self.update(record)
+        return self.metrics
+
+    @property
+    def metrics(self) -> dict:
+        state = self.state
+        return _metrics(
+            n_records=state["n_records"],
+            first_assets=state["first_assets"],
+            last_assets=state["last_assets"],
+            n_returns=state["n_returns"],
+            return_sum=state["return_sum"],
+            squared_return_sum=state["squared_return_sum"],
+            downside_squared_sum=state["downside_squared_sum"],
+            peak_assets=state["peak_assets"],
+            max_drawdown=state["max_drawdown"],
+            trades=state["trades"],
+            wins=state["wins"],
+            traded_value=state["traded_value"],
+            assets_sum=state["assets_sum"],
+        )
+
+
+def risk_metrics_matrix(total_assets: np.ndarray, trades: np.ndarray = None):
+    """
+    The risk metrics of many trading histories at once, one row of
+    `total_assets` per history, aligned on their first hour and padded
+    with NaN after their last one. Every metric is a single vectorized
+    pass over the (n_histories, n_hours) array. Definitions follow
+    `risk_metrics`, plus
+
+        annualized_return  geometric mean hourly return, annualized
+        calmar_ratio       annualized_return / max_drawdown
+
+    Like `risk_metrics`, a return is only taken between positive total
+    assets.
+
+    :param trades: (np.ndarray) Optional boolean array of the same shape,
+        True where the record's action was a buy or a sell; used for the
+        win rate.
+    :returns: (pd.DataFrame) One row per history, none when there are no
+        histories.
+    """
+
+    # Imported here: the live trader's `StreamingRiskMetrics` needs no
+    # pandas, and the Lambda image does not install it.
+    import pandas as pd
+
+    total_assets = np.asarray(total_assets, dtype=float)
+    if len(total_assets) == 0:
+        columns = list(MATRIX_METRICS)
+        if trades is not None:
+            columns += ["trades", "win_rate"]
+        return pd.DataFrame(columns=columns, dtype=float)
+    if total_assets.shape[1] == 0:
+        # Only empty histories: one undefined hour keeps the shapes valid.
+        total_assets = np.full((len(total_assets), 1), np.nan)
+        if trades is not None:
+            trades = np.zeros((len(total_assets), 1), dtype=bool)
+
+    n_records = np.sum(~np.isnan(total_assets), axis=1)
+    last_index = np.maximum(n_records - 1, 0)
+    rows = np.arange(len(total_assets))
+    first_assets = total_assets[:, 0]
+    last_assets = total_assets[rows, last_index]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positive = total_assets > 0
+        returns = np.where(
+            positive[:, 1:] & positive[:, :-1],
+            np.log(total_assets[:, 1:] / total_assets[:, :-1]),
+            np.nan,
+        )
+        n_returns = np.sum(~np.isnan(returns), axis=1)
+        mean_return = np.nansum(returns, axis=1) / n_returns
+        hourly_std = np.sqrt(np.nansum((returns - mean_return[:, None]) ** 2, axis=1) / n_returns)
+        downside_deviation = np.sqrt(
+            np.nansum(np.minimum(returns, 0.0) ** 2, axis=1) / n_returns)
+
+        peaks = np.fmax.accumulate(total_assets, axis=1)
+        drawdowns = np.where(
+            peaks > 0, 1.0 - total_assets / peaks, np.where(np.isnan(total_assets), np.nan, 0.0))
+        max_drawdown = np.fmax.reduce(drawdowns, axis=1)
+        annualized_return = np.expm1(mean_return * HOURS_PER_YEAR)
+
+        metrics = pd.DataFrame({
+            "n_records": n_records,
+            "total_assets": last_assets,
+            "total_return": np.where(first_assets > 0, last_assets / first_assets - 1.0, np.nan),
+            "annualized_return": annualized_return,
+            "annualized_volatility": hourly_std * np.sqrt(HOURS_PER_YEAR),
+            "sharpe_ratio": np.where(
+                hourly_std > 0, mean_return / hourly_std * np.sqrt(HOURS_PER_YEAR), np.nan),
+            "sortino_ratio": np.where(
+                downside_deviation > 0,
+                mean_return / downside_deviation * np.sqrt(HOURS_PER_YEAR),
+                np.nan,
+            ),
+            "max_drawdown": max_drawdown,
+            "calmar_ratio": np.where(
+                max_drawdown > 0, annualized_return / max_drawdown, np.nan),
+        })
+
+        if trades is not None:
+            trade_returns = np.asarray(trades, dtype=bool)[:, :-1]
+            n_trades = np.sum(trade_returns & ~np.isnan(returns), axis=1)
+            wins = np.sum(trade_returns & (returns > 0), axis=1)
+            metrics["trades"] = n_trades
+            metrics["win_rate"] = np.where(n_trades > 0, wins / n_trades, np.nan)
+
+    return metrics
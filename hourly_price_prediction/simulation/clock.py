@@ -0,0 +1,55 @@
+import time as _time
+
+
+class SimulatedClock(object):
+    """
+    A stand-in for the `time` module whose notion of "now" only moves
+    when it is told to. Sleeping advances the clock instantly, which lets
+    code that waits on the exchange run thousands of ticks per second.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = float(start)
+
+    def time(self) -> float:
+        """Returns the current simulated epoch in seconds."""
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        """Advances the clock by `seconds` without blocking."""
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> float:
+        """
+        Moves the clock forward by `seconds`.
+
+        :param seconds: (float) Number of seconds to move forward.
+        :returns: (float) The new simulated epoch.
+        """
+        if seconds < 0:
+            raise ValueError(f"Cannot move the clock backwards: {seconds}")
+        self._now += float(seconds)
+        return self._now
+
+    def set(self, epoch: float) -> None:
+        """Jumps the clock to `epoch`, which may not be in the past."""
+        if epoch < self._now:
+            raise ValueError(
+                f"Cannot move the clock backwards: {epoch} < {self._now}")
+        self._now = float(epoch)
+
+    def localtime(self, seconds: float = None) -> _time.struct_time:
+        if seconds is None:
+            seconds = self._now
+        return _time.localtime(seconds)
+
+    def gmtime(self, seconds: float = None) -> _time.struct_time:
+        if seconds is None:
+            seconds = self._now
+        return _time.gmtime(seconds)
+
+    def strftime(self, format: str, t: _time.struct_time = None) -> str:
+        """Mirrors `time.strftime`, defaulting to the simulated local time."""
+        if t is None:
+            t = self.localtime()
+        return _time.strftime(format, t)
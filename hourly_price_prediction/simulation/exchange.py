@@ -0,0 +1,458 @@
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from hourly_price_prediction.data.candles import (CANDLE_COLUMNS,
+                                                  load_candles,
+                                                  resample_candles)
+from hourly_price_prediction.simulation.clock import SimulatedClock
+
+def _to_epoch(value) -> float:
+    """Converts the ISO-8601 strings and numbers cbpro accepts to an epoch."""
+
+    if value is None:
+        return None
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+
+    value = str(value)
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    # naive timestamps are local time, matching `datetime.fromtimestamp`
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _iso(epoch: float) -> str:
+    return (
+        datetime.fromtimestamp(epoch, tz=timezone.utc)
+        .isoformat(timespec="microseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def _amount(value: float) -> str:
+    return "{:.16f}".format(value)
+
+
+class SimulatedExchange(object):
+    """
+    An in-process fake of the parts of `cbpro.PublicClient` and
+    `cbpro.AuthenticatedClient` that `AssetTrader` uses, replaying prices
+    from a candle file against a simulated clock.
+
+    Market orders fill at the open of the candle in progress (the first
+    price printed after the last closed candle) less a taker fee, the same
+    way Coinbase reports `funds`, `fill_fees` and `filled_size`. The same
+    object can be passed as both the public and the private client.
+    """
+
+    def __init__(
+        self,
+        candles: pd.DataFrame,
+        product_id: str = "ETH-USD",
+        initial_balances: dict = None,
+        fee_rate: float = 0.005,
+        latency: float = 0.0,
+        fill_delay: float = 0.0,
+        clock=None,
+        granularity: int = None,
+    ):
+        """
+        :param candles: (pd.DataFrame) Candles as returned by `load_candles`.
+        :param product_id: (str) The product being traded, e.g. ETH-USD.
+        :param initial_balances: (dict) Starting balance per currency.
+        :param fee_rate: (float) Taker fee charged on every fill.
+        :param latency: (float) Seconds every API call takes. Spent on the
+            simulated clock, or for real when `clock` is the `time` module.
+        :param fill_delay: (float) Seconds between placing an order and it
+            being settled into the account balances.
+        :param clock: Object with `time()` and `sleep()`; defaults to a
+            `SimulatedClock` positioned at the close of the first candle.
+        :param granularity: (int) Seconds per candle; inferred if omitted.
+            Candle requests for any multiple of it are served by resampling.
+        """
+
+        assert len(candles) > 1, "At least two candles are required"
+        self.product_id = product_id
+        self.base_currency, self.quote_currency = product_id.split("-")
+        self.fee_rate = float(fee_rate)
+        self.latency = float(latency)
+        self.fill_delay = float(fill_delay)
+
+        self._times = candles["time"].values.astype("int64")
+        self._candles = candles[CANDLE_COLUMNS].values.astype(float)
+        if granularity is None:
+            granularity = int(np.median(np.diff(self._times)))
+        self.granularity = int(granularity)
+        self._base_candles = candles[CANDLE_COLUMNS].reset_index(drop=True)
+        self._series = {self.granularity: (self._times, self._candles)}
+
+        if clock is None:
+            clock = SimulatedClock(start=self._times[0] + self.granularity)
+        self.clock = clock
+
+        if initial_balances is None:
+            initial_balances = {self.quote_currency: 1000.0}
+        self._accounts = {}
+        for currency in [self.quote_currency, self.base_currency]:
+            account_id = str(uuid.uuid4())
+            self._accounts[account_id] = {
+                "id": account_id,
+                "currency": currency,
+                "balance": float(initial_balances.get(currency, 0.0)),
+                "hold": 0.0,
+            }
+        self._orders = {}
+        self._pending_orders = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_csv(cls, candle_file: str, **kwargs):
+        """Builds an exchange from a candle file, see `load_candles`."""
+        return cls(load_candles(candle_file), **kwargs)
+
+    @property
+    def first_time(self) -> int:
+        return int(self._times[0])
+
+    @property
+    def last_time(self) -> int:
+        return int(self._times[-1])
+
+    def _call(self):
+        if self.latency > 0:
+            self.clock.sleep(self.latency)
+        self._settle_orders()
+
+    def _account_for(self, currency: str) -> dict:
+        for account in self._accounts.values():
+            if account["currency"] == currency:
+                return account
+
+    def _public_account(self, account: dict) -> dict:
+        return {
+            "id": account["id"],
+            "currency": account["currency"],
+            "balance": _amount(account["balance"]),
+            "available": _amount(account["balance"] - account["hold"]),
+            "hold": _amount(account["hold"]),
+            "profile_id": "simulated",
+            "trading_enabled": True,
+        }
+
+    def balance(self, currency: str) -> float:
+        """Returns the settled balance of `currency` as a float."""
+        with self._lock:
+            self._settle_orders()
+            return self._account_for(currency)["balance"]
+
+    def current_price(self) -> float:
+        """The price a market order placed right now would fill at."""
+
+        now = self.clock.time()
+        index = int(np.searchsorted(self._times, now, side="right")) - 1
+        if index < 0:
+            return self._candles[0, 3]
+        if now >= self._times[index] + self.granularity:
+            # past the end of the data, the last close is the best guess
+            return self._candles[index, 4]
+        return self._candles[index, 3]
+
+    def _candle_series(self, granularity: int) -> tuple:
+        """
+        (times, candles) arrays at `granularity`, resampled from the candle
+        file on first use and cached. None when it is not a multiple of the
+        file's granularity.
+        """
+
+        if granularity not in self._series:
+            if granularity <= 0 or granularity % self.granularity != 0:
+                return None
+            resampled = resample_candles(self._base_candles, granularity)
+            self._series[granularity] = (
+                resampled["time"].values.astype("int64"),
+                resampled[CANDLE_COLUMNS].values.astype(float),
+            )
+        return self._series[granularity]
+
+    def get_time(self) -> dict:
+        with self._lock:
+            self._call()
+            epoch = self.clock.time()
+            return {"iso": _iso(epoch), "epoch": epoch}
+
+    def get_product_historic_rates(
+        self, product_id: str, start=None, end=None, granularity: int = None
+    ):
+        """
+        Returns up to 300 closed candles that overlap [start, end], newest
+        first, each as [time, low, high, open, close, volume].
+        """
+
+        with self._lock:
+            self._call()
+            if product_id != self.product_id:
+                return {"message": "NotFound"}
+            if granularity is None:
+                granularity = self.granularity
+            granularity = int(granularity)
+            series = self._candle_series(granularity)
+            if series is None:
+                return {"message": "Unsupported granularity"}
+            times, candles = series
+
+            now = self.clock.time()
+            end_epoch = now if end is None else min(_to_epoch(end), now)
+            if start is None:
+                start_epoch = end_epoch - 300 * granularity
+            else:
+                start_epoch = _to_epoch(start)
+
+            lower = np.searchsorted(times, start_epoch - granularity, side="right")
+            upper = min(
+                np.searchsorted(times, end_epoch, side="right"),
+                np.searchsorted(times, now - granularity, side="right"),
+            )
+            lower = max(lower, upper - 300)
+            rows = candles[lower:upper][::-1]
+            return [[int(row[0])] + row[1:].tolist() for row in rows]
+
+    def get_accounts(self) -> list:
+        with self._lock:
+            self._call()
+            return [
+                self._public_account(account)
+                for account in self._accounts.values()
+            ]
+
+    def get_account(self, account_id: str) -> dict:
+        with self._lock:
+            self._call()
+            if account_id not in self._accounts:
+                return {"message": "NotFound"}
+            return self._public_account(self._accounts[account_id])
+
+    def get_order(self, order_id: str) -> dict:
+        with self._lock:
+            self._call()
+            if order_id not in self._orders:
+                return {"message": "NotFound"}
+            return dict(self._orders[order_id]["response"])
+
+    def place_market_order(
+        self,
+        product_id: str,
+        side: str,
+        size: float = None,
+        funds: float = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Places a market order for `size` of the base currency or `funds` of
+        the quote currency. Errors are returned as `{"message": ...}`
+        dictionaries, the way the Coinbase REST API reports them.
+        """
+
+        with self._lock:
+            self._call()
+            if product_id != self.product_id:
+                return {"message": "NotFound"}
+            if side not in ["buy", "sell"]:
+                return {"message": "side is not valid"}
+            if (size is None) == (funds is None):
+                return {"message": "Exactly one of size or funds is required"}
+
+            price = self.current_price()
+            fee_multiplier = 1.0 + self.fee_rate
+            if funds is not None:
+                specified_funds = float(funds)
+                if specified_funds <= 0:
+                    return {"message": "funds is too small"}
+                if side == "buy":
+                    order_funds = specified_funds / fee_multiplier
+                    filled_size = order_funds / price
+                else:
+                    filled_size = specified_funds / price
+                    order_funds = specified_funds
+            else:
+                filled_size = float(size)
+                if filled_size <= 0:
+                    return {"message": "size is too small"}
+                order_funds = filled_size * price
+                specified_funds = None
+
+            executed_value = filled_size * price
+            fill_fees = executed_value * self.fee_rate
+            quote_account = self._account_for(self.quote_currency)
+            base_account = self._account_for(self.base_currency)
+
+            if side == "buy":
+                hold_account = quote_account
+                hold_amount = executed_value + fill_fees
+            else:
+                hold_account = base_account
+                hold_amount = filled_size
+            available = hold_account["balance"] - hold_account["hold"]
+            if hold_amount > available + 1e-12:
+                return {"message": "Insufficient funds"}
+            hold_account["hold"] += hold_amount
+
+            now = self.clock.time()
+            order_id = str(uuid.uuid4())
+            response = {
+                "id": order_id,
+                "product_id": product_id,
+                "profile_id": "simulated",
+                "side": side,
+                "type": "market",
+                "post_only": False,
+                "created_at": _iso(now),
+                "fill_fees": "0.0000000000000000",
+                "filled_size": "0.00000000",
+                "executed_value": "0.0000000000000000",
+                "status": "pending",
+                "settled": False,
+            }
+            if funds is not None:
+                response["funds"] = _amount(order_funds)
+                response["specified_funds"] = _amount(specified_funds)
+            else:
+                response["size"] = "{:.8f}".format(filled_size)
+
+            self._orders[order_id] = {
+                "response": response,
+                "fill_at": now + self.fill_delay,
+                "hold_account": hold_account,
+                "hold_amount": hold_amount,
+                "filled_size": filled_size,
+                "executed_value": executed_value,
+                "fill_fees": fill_fees,
+            }
+            placed = dict(response)
+            self._pending_orders.append(order_id)
+            self._settle_orders()
+            return placed
+
+    def _settle_orders(self) -> None:
+        """Moves every order whose fill time has passed into the balances."""
+
+        if not self._pending_orders:
+            return
+        now = self.clock.time()
+        still_pending = []
+        for order_id in self._pending_orders:
+            order = self._orders[order_id]
+            if order["fill_at"] > now:
+                still_pending.append(order_id)
+                continue
+
+            quote_account = self._account_for(self.quote_currency)
+            base_account = self._account_for(self.base_currency)
+            order["hold_account"]["hold"] -= order["hold_amount"]
+            if order["response"]["side"] == "buy":
+                quote_account["balance"] -= (
+                    order["executed_value"] + order["fill_fees"]
+                )
+                base_account["balance"] += order["filled_size"]
+            else:
+                base_account["balance"] -= order["filled_size"]
+                quote_account["balance"] += (
+                    order["executed_value"] - order["fill_fees"]
+                )
+
+            order["response"].update(
+                {
+                    "done_at": _iso(order["fill_at"]),
+                    "done_reason": "filled",
+                    "fill_fees": _amount(order["fill_fees"]),
+                    "filled_size": "{:.8f}".format(order["filled_size"]),
+                    "executed_value": _amount(order["executed_value"]),
+                    "status": "done",
+                    "settled": True,
+                }
+            )
+        self._pending_orders = still_pending
+
+
+def serve_exchange(exchange: SimulatedExchange, host: str = "127.0.0.1", port: int = 0):
+    """
+    Exposes `exchange` over HTTP with the Coinbase Pro REST routes, so that
+    unmodified `cbpro` clients can be pointed at it through `api_url`.
+    Authentication headers are accepted and ignored.
+
+    :returns: (ThreadingHTTPServer) A running server; its URL is
+        f"http://{host}:{server.server_port}". Call `shutdown()` to stop it.
+    """
+
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class ExchangeRequestHandler(BaseHTTPRequestHandler):
+        def _respond(self, body):
+            status = 200
+            if isinstance(body, dict) and set(body.keys()) == {"message"}:
+                status = 404 if body["message"] == "NotFound" else 400
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+            if parts == ["time"]:
+                return self._respond(exchange.get_time())
+            if len(parts) == 3 and parts[0] == "products" and parts[2] == "candles":
+                granularity = query.get("granularity")
+                return self._respond(
+                    exchange.get_product_historic_rates(
+                        product_id=parts[1],
+                        start=query.get("start"),
+                        end=query.get("end"),
+                        granularity=None if granularity is None else int(granularity),
+                    )
+                )
+            if parts == ["accounts"]:
+                return self._respond(exchange.get_accounts())
+            if len(parts) == 2 and parts[0] == "accounts":
+                return self._respond(exchange.get_account(parts[1]))
+            if len(parts) == 2 and parts[0] == "orders":
+                return self._respond(exchange.get_order(parts[1]))
+            return self._respond({"message": "NotFound"})
+
+        def do_POST(self):
+            parts = [part for part in urlparse(self.path).path.split("/") if part]
+            if parts != ["orders"]:
+                return self._respond({"message": "NotFound"})
+
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if params.get("type", "market") != "market":
+                return self._respond({"message": "Only market orders are simulated"})
+            return self._respond(
+                exchange.place_market_order(
+                    product_id=params.get("product_id"),
+                    side=params.get("side"),
+                    size=params.get("size"),
+                    funds=params.get("funds"),
+                )
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), ExchangeRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,387 @@
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import hydra
+import numpy as np
+import pandas as pd
+from omegaconf import DictConfig
+
+project_dir = Path(__file__).resolve().parents[2]
+if str(project_dir) not in sys.path:
+    sys.path.insert(0, str(project_dir))
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper  # noqa: E402
+from hourly_price_prediction.models.asset_trader import AssetTrader  # noqa: E402
+from hourly_price_prediction.models.trading_daemon import (  # noqa: E402
+    TradingDaemon, load_deployed_model)
+from hourly_price_prediction.monitoring.latency import (  # noqa: E402
+    emf_stage_latencies, parse_emf_line)
+from hourly_price_prediction.monitoring.risk_metrics import (  # noqa: E402
+    risk_metrics)
+from hourly_price_prediction.simulation.clock import SimulatedClock  # noqa: E402
+from hourly_price_prediction.simulation.exchange import (  # noqa: E402
+    SimulatedExchange, load_candles)
+
+
+class RecordingS3Helper(LocalS3Helper):
+    """A `LocalS3Helper` that remembers the keys it has been sent."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploaded_keys = []
+
+    def upload_to_s3(self, s3_key: str, local_filepath: str):
+        response = super().upload_to_s3(s3_key, local_filepath)
+        self.uploaded_keys.append(s3_key)
+        return response
+
+    def put_object_bytes(self, s3_key: str, body: bytes, content_type: str = None):
+        response = super().put_object_bytes(s3_key, body, content_type)
+        self.uploaded_keys.append(s3_key)
+        return response
+
+
+@contextlib.contextmanager
+def patched_lambda_module(
+    lambda_module,
+    exchange: SimulatedExchange,
+    s3_helper: LocalS3Helper,
+    model_name: str,
+    online_learning: bool = False,
+):
+    """
+    Points the module level dependencies of `lambda_function` at the
+    simulated exchange, the local object store and the simulated clock for
+    the duration of the context, restoring them afterwards.
+    """
+
+    patches = {
+        "S3Helper": lambda bucket, region_name, **kwargs: s3_helper,
+        "AssetTrader": partial(
+            AssetTrader, public_client=exchange, private_client=exchange
+        ),
+        "time": exchange.clock,
+        "model_name": model_name,
+        "asset": exchange.product_id,
+        "bucket": s3_helper.bucket,
+        "online_learning": online_learning,
+    }
+    originals = {name: getattr(lambda_module, name) for name in patches}
+    for name, value in patches.items():
+        setattr(lambda_module, name, value)
+    try:
+        yield lambda_module
+    finally:
+        for name, value in originals.items():
+            setattr(lambda_module, name, value)
+
+
+def upload_model_files(
+    s3_helper: LocalS3Helper,
+    model_name: str,
+    model_artifact: str,
+    validation_metrics_file: str,
+    features_file: str = None,
+) -> None:
+    """Serves the model files under `model_name/`, as training uploads them."""
+
+    model_files = [
+        (model_artifact, "model.pickle"),
+        (validation_metrics_file, "validation_metrics.json"),
+    ]
+    if features_file is not None:
+        model_files.append((features_file, "features.json"))
+    for local_filepath, filename in model_files:
+        s3_helper.upload_to_s3(
+            s3_key=os.path.join(model_name, filename),
+            local_filepath=local_filepath,
+        )
+
+
+def replay_close_times(
+    candles: pd.DataFrame, granularity: int, start: str = None, end: str = None
+) -> np.ndarray:
+    """Close time of every candle to replay, see `replay_lambda_handler`."""
+
+    close_times = candles["time"].values + granularity
+    if start is not None:
+        start_epoch = pd.Timestamp(start, tz="UTC").timestamp()
+        close_times = close_times[close_times - granularity >= start_epoch]
+    if end is not None:
+        end_epoch = pd.Timestamp(end, tz="UTC").timestamp()
+        close_times = close_times[close_times - granularity <= end_epoch]
+    return close_times
+
+
+def replay_lambda_handler(
+    candles: pd.DataFrame,
+    model_artifact: str,
+    validation_metrics_file: str,
+    model_name: str = "replay",
+    initial_balances: dict = None,
+    fee_rate: float = 0.005,
+    trigger_delay: float = 5.0,
+    start: str = None,
+    end: str = None,
+    online_learning: bool = False,
+    features_file: str = None,
+    verbose: bool = False,
+) -> pd.DataFrame:
+    """
+    Runs the production `lambda_handler` once per candle close in
+    `candles`, with a simulated clock, a `SimulatedExchange` and a
+    `LocalS3Helper` standing in for Coinbase and S3.
+
+    :param candles: (pd.DataFrame) Candles as returned by `load_candles`.
+    :param model_artifact: (str) Pickled model served as `model.pickle`.
+    :param validation_metrics_file: (str) JSON served as `validation_metrics.json`.
+    :param trigger_delay: (float) Seconds after each candle close the
+        handler is invoked, like the scheduled Lambda trigger.
+    :param start: (str) Optional first candle time to replay (inclusive).
+    :param end: (str) Optional last candle time to replay (inclusive).
+    :param online_learning: (bool) Replay with `ONLINE_LEARNING` switched on.
+    :param features_file: (str) Optional JSON served as `features.json`, for
+        models trained with indicator features.
+    :returns: (pd.DataFrame) One trading history record per tick, as
+        uploaded by the handler, plus the handler latency and the per-stage
+        latencies it emitted (`stage_<name>_ms`) in milliseconds.
+    """
+
+    lambda_module = importlib.import_module("lambda_function")
+
+    store_directory = tempfile.mkdtemp(prefix="replay-s3-")
+    try:
+        clock = SimulatedClock(start=candles["time"].iloc[0])
+        exchange = SimulatedExchange(
+            candles,
+            initial_balances=initial_balances,
+            fee_rate=fee_rate,
+            clock=clock,
+        )
+        s3_helper = RecordingS3Helper(store_directory, clock=clock)
+        upload_model_files(
+            s3_helper, model_name, model_artifact, validation_metrics_file, features_file)
+        close_times = replay_close_times(candles, exchange.granularity, start, end)
+
+        records = []
+        output = io.StringIO()
+        with patched_lambda_module(
+            lambda_module, exchange, s3_helper, model_name, online_learning=online_learning
+        ):
+            for close_time in close_times:
+                clock.set(max(close_time + trigger_delay, clock.time()))
+                output.seek(0)
+                output.truncate()
+                number_of_uploads = len(s3_helper.uploaded_keys)
+
+                tick_start = time.perf_counter()
+                with contextlib.redirect_stdout(output):
+                    lambda_module.lambda_handler({}, None)
+                handler_latency = (time.perf_counter() - tick_start) * 1000
+                if verbose:
+                    sys.stdout.write(output.getvalue())
+
+                history_keys = [
+                    key for key in s3_helper.uploaded_keys[number_of_uploads:]
+                    if key.startswith("trading_history/")
+                ]
+                if not history_keys:
+                    continue
+                history_key = history_keys[-1]
+                record = s3_helper.get_json(history_key)
+                record["handler_latency_ms"] = handler_latency
+                for line in output.getvalue().splitlines():
+                    document = parse_emf_line(line)
+                    if document is not None:
+                        for stage, latency in emf_stage_latencies(document).items():
+                            record[f"stage_{stage}_ms"] = latency
+                records.append(record)
+    finally:
+        shutil.rmtree(store_directory, ignore_errors=True)
+
+    history = pd.DataFrame(records)
+    history["total_assets"] = (
+        history["close"] * history["asset_wallet"] + history["usd_wallet"]
+    )
+    return history
+
+
+def replay_trading_daemon(
+    candles: pd.DataFrame,
+    model_artifact: str,
+    validation_metrics_file: str,
+    model_name: str = "replay",
+    initial_balances: dict = None,
+    fee_rate: float = 0.005,
+    start: str = None,
+    end: str = None,
+    features_file: str = None,
+) -> pd.DataFrame:
+    """
+    Runs a `TradingDaemon` over `candles` against a `SimulatedExchange`,
+    sharing its `SimulatedClock`: the daemon sleeps to every candle close
+    and trades it, the clock jumping ahead instead of waiting.
+
+    Arguments and result are those of `replay_lambda_handler`; every
+    record also has the daemon's `close_to_order_ms`, measured on the
+    simulated exchange clock.
+    """
+
+    store_directory = tempfile.mkdtemp(prefix="replay-s3-")
+    try:
+        clock = SimulatedClock(start=candles["time"].iloc[0])
+        exchange = SimulatedExchange(
+            candles,
+            initial_balances=initial_balances,
+            fee_rate=fee_rate,
+            clock=clock,
+        )
+        s3_helper = RecordingS3Helper(store_directory, clock=clock)
+        upload_model_files(
+            s3_helper, model_name, model_artifact, validation_metrics_file, features_file)
+        close_times = replay_close_times(candles, exchange.granularity, start, end)
+
+        deployed = load_deployed_model(s3_helper, model_name)
+        asset_trader = AssetTrader(
+            asset=exchange.product_id,
+            api_secret="",
+            api_key="",
+            passphrase="",
+            pickle_file=None,
+            public_client=exchange,
+            private_client=exchange,
+            model=deployed["model"],
+        )
+        daemon = TradingDaemon(
+            asset_trader, s3_helper, deployed, clock=clock, granularity=exchange.granularity)
+
+        records = []
+        tick = daemon.tick
+
+        def timed_tick(close: int) -> dict:
+            output = io.StringIO()
+            tick_start = time.perf_counter()
+            with contextlib.redirect_stdout(output):
+                record = tick(close)
+            if record is not None:
+                record["handler_latency_ms"] = (time.perf_counter() - tick_start) * 1000
+                for line in output.getvalue().splitlines():
+                    document = parse_emf_line(line)
+                    if document is not None:
+                        for stage, latency in emf_stage_latencies(document).items():
+                            record[f"stage_{stage}_ms"] = latency
+                records.append(record)
+            return record
+
+        daemon.tick = timed_tick
+        # Start right as the candle before the first close to replay opens.
+        clock.set(max(close_times[0] - exchange.granularity, clock.time()))
+        daemon.run(max_ticks=len(close_times))
+    finally:
+        shutil.rmtree(store_directory, ignore_errors=True)
+
+    history = pd.DataFrame(records)
+    history["total_assets"] = (
+        history["close"] * history["asset_wallet"] + history["usd_wallet"]
+    )
+    return history
+
+
+def summarize_replay(history: pd.DataFrame, wall_time: float) -> dict:
+    """Latency and PnL summary of a `replay_lambda_handler` run."""
+
+    latencies = history["handler_latency_ms"].values
+    initial_assets = history["total_assets"].values[0]
+    final_assets = history["total_assets"].values[-1]
+    return {
+        "ticks": int(len(history)),
+        "wall_time_seconds": wall_time,
+        "ticks_per_second": len(history) / wall_time if wall_time else None,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "latency_ms_p99": float(np.percentile(latencies, 99)),
+        "initial_total_assets": float(initial_assets),
+        "final_total_assets": float(final_assets),
+        "percentage_gain_lost": float((final_assets - initial_assets) / initial_assets),
+        "total_buys": int((history["action"] == "buy").sum()),
+        "total_sells": int((history["action"] == "sell").sum()),
+        "total_do_nothing": int((history["action"] == "do_nothing").sum()),
+        "risk_metrics": risk_metrics(history),
+    }
+
+
+@hydra.main(config_path="../../configs/simulation", config_name="replay")
+def replay(cfg: DictConfig):
+
+    model_files = [cfg.data.candle_file, cfg.model.artifact, cfg.model.validation_metrics]
+    if cfg.model.features is not None:
+        model_files.append(cfg.model.features)
+    for filepath in model_files:
+        assert os.path.isfile(filepath), f"File does not exist: {filepath}"
+
+    candles = load_candles(cfg.data.candle_file)
+    logging.info(f"Replaying {len(candles)} candles from {cfg.data.candle_file}")
+
+    replay_start = time.perf_counter()
+    if cfg.trader == "daemon":
+        assert not cfg.model.online_learning, "Online learning is only run by the Lambda"
+        history = replay_trading_daemon(
+            candles,
+            model_artifact=cfg.model.artifact,
+            validation_metrics_file=cfg.model.validation_metrics,
+            model_name=cfg.model.name,
+            initial_balances={"USD": cfg.exchange.initial_usd},
+            fee_rate=cfg.exchange.fee_rate,
+            start=cfg.data.start,
+            end=cfg.data.end,
+            features_file=cfg.model.features,
+        )
+    else:
+        history = replay_lambda_handler(
+            candles,
+            model_artifact=cfg.model.artifact,
+            validation_metrics_file=cfg.model.validation_metrics,
+            model_name=cfg.model.name,
+            initial_balances={"USD": cfg.exchange.initial_usd},
+            fee_rate=cfg.exchange.fee_rate,
+            trigger_delay=cfg.exchange.trigger_delay,
+            start=cfg.data.start,
+            end=cfg.data.end,
+            online_learning=cfg.model.online_learning,
+            features_file=cfg.model.features,
+        )
+    summary = summarize_replay(history, time.perf_counter() - replay_start)
+
+    output_directory = os.path.join(
+        cfg.data.output_directory,
+        "{}-{}".format(cfg.model.name, time.strftime("%Y%m%dT%H%M%S")),
+    )
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    history.to_csv(os.path.join(output_directory, "trading_history.csv"), index=None)
+    with open(os.path.join(output_directory, "replay_summary.json"), "w") as jfile:
+        jfile.write(json.dumps(summary, indent=2))
+        jfile.close()
+
+    logging.info(
+        f"Replayed {summary['ticks']} ticks in {round(summary['wall_time_seconds'], 2)}s"
+        f" | p95 latency {round(summary['latency_ms_p95'], 3)}ms"
+        f" | Gain/Loss {round(summary['percentage_gain_lost'] * 100, 5)}%"
+    )
+    logging.info(f"Replay results written to {output_directory}")
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    replay()
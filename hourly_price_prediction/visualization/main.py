@@ -2,7 +2,6 @@ import json
 import os
 import sys
 sys.path.insert(0, "..")
-from glob import glob
 from pathlib import Path
 
 import dash
@@ -11,7 +10,10 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
 from plotly.io import to_html
+from hourly_price_prediction.data.results_cache import ResultsCache
 from hourly_price_prediction.models.performance_analyzer import PerformanceAnalyzer
+from hourly_price_prediction.visualization.results_loader import (
+    load_model_results, results_cache_directory)
 import pandas as pd
 
 
@@ -22,23 +24,37 @@ external_stylesheets = [
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 project_dir = Path(__file__).resolve().parents[2]
 
-available_model_paths = glob(f"{project_dir}/data/model_results/*")
-available_models = [os.path.split(apm)[1] for apm in available_model_paths]
-zipped_models = dict(zip(available_model_paths, available_models))
+# Every worker maps the tables `results_loader.py` fills instead of reading
+# the runs' CSV files itself; when no loader has run yet, this process
+# fills the cache once.
+results_cache = ResultsCache(results_cache_directory())
+if results_cache.version('runs') is None:
+    load_model_results(results_cache, f"{project_dir}/data/model_results")
 
-analyzer = PerformanceAnalyzer(
-    path_to_model_metrics=os.path.join(available_model_paths[0], "model_metrics.csv"),
-    path_to_trading_history=os.path.join(available_model_paths[0], "trading_history.csv"),
-)
+available_models = results_cache.read_table('runs')['model'].tolist()
+
+
+def run_analyzer(model_dropdown) -> PerformanceAnalyzer:
+    """PerformanceAnalyzer of a run, from the cached tables."""
+    _, model_name = os.path.split(model_dropdown)
+    runs = results_cache.read_table('runs')
+    run = runs['model'].tolist().index(model_name)
+
+    model_metrics = results_cache.read_table('model_metrics')
+    model_metrics = model_metrics.to_frame()[model_metrics['model'] == model_name]
+    trading_history = results_cache.read_table('trading_history').to_frame(
+        runs['start'][run], runs['stop'][run])
+    return PerformanceAnalyzer.from_dataframes(
+        model_metrics.reset_index(drop=True), trading_history)
+
+
+analyzer = run_analyzer(available_models[0])
 descriptive_statistics = pd.DataFrame(analyzer.trading_history_descriptive_statistics).T
 
-all_model_metrics = pd.DataFrame()
-for model_path in available_model_paths:
-    metrics = pd.read_csv(os.path.join(model_path, 'model_metrics.csv'))
-    _, model_name = os.path.split(model_path)
-    metrics['model'] = model_name
-    all_model_metrics = pd.concat((all_model_metrics, metrics), ignore_index=True)
-all_model_metrics.reset_index(inplace=True, drop=True)
+all_model_metrics = results_cache.read_table('model_metrics').to_frame()
+
+# Risk metrics of every run, computed together and ranked by Sharpe ratio.
+run_ranking = results_cache.read_table('run_ranking').to_frame()
 
 app.layout = html.Div(
     [
@@ -62,8 +78,8 @@ app.layout = html.Div(
                         dcc.Dropdown(
                             id="model-dropdown",
                             options=[
-                                {"label": model, "value": paths}
-                                for paths, model in zipped_models.items()
+                                {"label": model, "value": model}
+                                for model in available_models
                             ],
                             value=available_models[0],
                         ),
@@ -190,6 +206,28 @@ app.layout = html.Div(
                     },
                 ),
         ], className="row"),
+        html.Br(),
+        html.Hr(),
+        html.Br(),
+        html.Div([
+            html.H2("Run Ranking"),
+            dash_table.DataTable(
+                id='run-ranking-table',
+                columns=[{'name': i, 'id': i} for i in run_ranking.columns],
+                page_current=0,
+                page_size=20,
+                filter_action='native',
+                data=run_ranking.to_dict(orient='records'),
+                page_action='native',
+                sort_action='native',
+                sort_mode='multi',
+                style_table={
+                    'overflowX': 'scroll',
+                    'maxHeight':'600px',
+                    'height': 'auto'
+                    },
+                ),
+        ], className="row"),
     ],
     className="container",
 )
@@ -208,16 +246,7 @@ def total_assets(model_dropdown):
     Input("model-dropdown", "value"),
 )
 def total_assets(model_dropdown):
-    _, model_name = os.path.split(model_dropdown)
-    base_model_path = os.path.join(
-        project_dir, "data", "model_results", model_name)
-
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=os.path.join(
-            base_model_path, "model_metrics.csv"),
-        path_to_trading_history=os.path.join(
-            base_model_path, "trading_history.csv"),
-    )
+    analyzer = run_analyzer(model_dropdown)
 
     percentage_assets_fig = analyzer.generate_line_plot(
         y_array=analyzer.trading_history.total_assets.values
@@ -235,16 +264,7 @@ def total_assets(model_dropdown):
     Input("model-dropdown", "value"),
 )
 def total_assets(model_dropdown):
-    _, model_name = os.path.split(model_dropdown)
-    base_model_path = os.path.join(
-        project_dir, "data", "model_results", model_name)
-
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=os.path.join(
-            base_model_path, "model_metrics.csv"),
-        path_to_trading_history=os.path.join(
-            base_model_path, "trading_history.csv"),
-    )
+    analyzer = run_analyzer(model_dropdown)
 
     percentage_assets_fig = analyzer.generate_line_plot(
         y_array=analyzer.trading_history.asset_wallet_balance.values
@@ -262,16 +282,7 @@ def total_assets(model_dropdown):
     [dash.dependencies.Input('model-dropdown','value')]
 )
 def get_descriptive_statistics(model_dropdown):
-    _, model_name = os.path.split(model_dropdown)
-    base_model_path = os.path.join(
-        project_dir, "data", "model_results", model_name)
-
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=os.path.join(
-            base_model_path, "model_metrics.csv"),
-        path_to_trading_history=os.path.join(
-            base_model_path, "trading_history.csv"),
-    )
+    analyzer = run_analyzer(model_dropdown)
 
     descriptive_statistics = analyzer.trading_history_descriptive_statistics
 
@@ -289,16 +300,7 @@ def get_descriptive_statistics(model_dropdown):
 )
 def kpi_graph(model_dropdown):
 
-    _, model_name = os.path.split(model_dropdown)
-    base_model_path = os.path.join(
-        project_dir, "data", "model_results", model_name)
-
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=os.path.join(
-            base_model_path, "model_metrics.csv"),
-        path_to_trading_history=os.path.join(
-            base_model_path, "trading_history.csv"),
-    )
+    analyzer = run_analyzer(model_dropdown)
 
     current_total_assets = analyzer.trading_history.total_assets.values[-1]
     initial_total_assets = analyzer.trading_history.total_assets.values[0]
@@ -353,14 +355,7 @@ def kpi_graph(model_dropdown):
     [dash.dependencies.Input('model-dropdown','value')]
 )
 def get_model_errors(model_dropdown):
-    _, model_name = os.path.split(model_dropdown)
-    base_model_path = os.path.join(
-        project_dir, "data", "model_results", model_name)
-
-    analyzer = PerformanceAnalyzer(
-        path_to_model_metrics=os.path.join(base_model_path, "model_metrics.csv"),
-        path_to_trading_history=os.path.join(base_model_path, "trading_history.csv"),
-    )
+    analyzer = run_analyzer(model_dropdown)
 
     model_error_metrics = [
         {
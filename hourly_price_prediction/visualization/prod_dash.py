@@ -1,21 +1,24 @@
 import sys
 sys.path.insert(0, "..")
 
-import json
 import os
-import boto3
+import threading
+import numpy as np
 import pandas as pd
-from glob import glob
 from pathlib import Path
-from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
 import dash
 import dash_table
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
-from hourly_price_prediction.models.utils import download_from_s3
+from dash.dependencies import Input, Output, State
+from hourly_price_prediction.data.results_cache import ResultsCache
+from hourly_price_prediction.data.s3_cache import S3Cache
+from hourly_price_prediction.data.s3_helper import S3Helper
+from hourly_price_prediction.data.trading_history import TradingHistoryStore
+from hourly_price_prediction.visualization.results_loader import (
+    load_prod_history, results_cache_directory, run_loader)
 
 external_stylesheets = [
     "https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/css/bootstrap.min.css"
@@ -24,95 +27,60 @@ external_stylesheets = [
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 project_dir = Path(__file__).resolve().parents[2]
 bucket = 'hourly-price-prediction'
-s3_resource = boto3.resource('s3')
-bucket = s3_resource.Bucket(bucket)
-for obj in bucket.objects.filter(Prefix='trading_history/'):
-    object_key = obj.key
-    filepath, filename = os.path.split(object_key)
-
-    if not os.path.isdir(os.path.join(project_dir, 'data', 'trading_history', filename)):
-        bucket.download_file(
-            object_key,
-            os.path.join(project_dir, 'data', 'trading_history', filename)
-        )
+data_helper = S3Helper(
+    bucket,
+    region_name='us-east-2',
+    cache=S3Cache(os.path.join(project_dir, 'data', 's3_cache')),
+)
 
-data = []
-for json_filepath in glob(os.path.join(project_dir, 'data', 'trading_history', '*.json')):
-    with open(json_filepath, 'r') as jfile:
-        data.append(json.loads(jfile.read()))
-        jfile.close()
+# `results_loader.py` keeps the trading history in the shared cache; every
+# worker maps that table instead of fetching and holding its own copy.
+results_cache = ResultsCache(results_cache_directory())
 
-df = pd.DataFrame(data)
-df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-df['total_assets'] = df['close'] * df['asset_wallet'] + df['usd_wallet']
-df.sort_values(by='timestamp', ascending=True, inplace=True)
+refresh_seconds = os.getenv('REFRESH_SECONDS')
+if refresh_seconds == '' or refresh_seconds == None:
+    refresh_seconds = '60'
 
-app.layout = html.Div(
-    [
-        html.Div([html.H1("Algorithmic Trading Performance")]),
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.H2("Model Name")
-                    ],
-                    className="col-md-12 col-sm-12",
-                ),
-                html.Div(
-                    [dcc.Graph(id="prod-orders")], className="col-sm-12"
-                ),
-                html.Div(
-                    [dcc.Graph(id='eth-price')], className="col-sm-12"
-                ),
-                html.Div(["Input: ", dcc.Input(id='my-input', value='initial value', type='text')]),
-            ],
-            className="row",
-        ),
-        html.Div([
-            html.Div([
-                dash_table.DataTable(
-                    id='datatable-interactivity',
-                    columns = [
-                        {"name": i, "id": i, "deletable": True, "selectable": True} for i in df.columns
-                    ],
-                    data=df.to_dict(orient='records'),
-                    editable=True,
-                    filter_action="native",
-                    sort_action="native",
-                    sort_mode="multi",
-                    column_selectable="single",
-                    row_selectable="multi",
-                    row_deletable=False,
-                    selected_columns=[],
-                    selected_rows=[],
-                    page_action="native",
-                    page_current=0,
-                    page_size=10,
-                    style_cell={
-                        'whiteSpace': 'normal',
-                        'height': 'auto',
-                    }
-                )
-            ], className="col-sm-12")
-        ], className="row")
-    ],
-    className="container",
-)
+RECORD_COLUMNS = [
+    'timestamp', 'action', 'open', 'high', 'low', 'close', 'volume', 'total_assets'
+]
 
-@app.callback(
-    Output("prod-orders", "figure"),
-    Input(component_id='my-input', component_property='value')
-)
-def total_assets(value):
 
-    layout = go.Layout(
-        title=go.layout.Title(text='Ethereum Trading'),
-        xaxis=go.layout.XAxis(title='DateTime'),
-        yaxis=go.layout.YAxis(title='Asset Values [In USD]'),
-    )
+def records_since(table, timestamp=None) -> pd.DataFrame:
+    """The records of `table` newer than `timestamp` (all of them when None)."""
+
+    if table is None or len(table) == 0:
+        return pd.DataFrame()
+    position = 0
+    if timestamp is not None:
+        position = int(np.searchsorted(table['timestamp'], timestamp, side='right'))
+    return table.to_frame(position)
+
+
+def watermark(table):
+    """Timestamp of the newest record of `table`, None when there is none."""
+
+    if table is None or len(table) == 0:
+        return None
+    return table['timestamp'][-1].item()
+
+
+def with_record_columns(records: pd.DataFrame) -> pd.DataFrame:
+    """`records`, with the columns the figures read even when it is empty."""
+    if records.empty:
+        return pd.DataFrame(columns=RECORD_COLUMNS)
+    return records
+
+
+def datetimes(records: pd.DataFrame) -> list:
+    return pd.to_datetime(records['timestamp'], unit='s').tolist()
+
+
+def action_markers(actions) -> tuple:
+    """(marker colors, hover texts) of the orders plot."""
     marker_color = []
     texts = []
-    for idx, action in enumerate(df['action'].values):
+    for action in actions:
         if action == 'buy':
             color = 'azure'
         elif action == 'sell':
@@ -120,15 +88,25 @@ def total_assets(value):
         else:
             color = 'black'
 
-        text = f'Action: {action}'
-        texts.append(text)
+        texts.append(f'Action: {action}')
         marker_color.append(color)
+    return (marker_color, texts)
+
+
+def total_assets_figure(records: pd.DataFrame) -> go.Figure:
+
+    layout = go.Layout(
+        title=go.layout.Title(text='Ethereum Trading'),
+        xaxis=go.layout.XAxis(title='DateTime'),
+        yaxis=go.layout.YAxis(title='Asset Values [In USD]'),
+    )
+    marker_color, texts = action_markers(records['action'].values)
     fig = go.Figure(layout=layout)
     fig.add_trace(
         go.Scatter(
-            x=df['timestamp'], 
-            y=df['total_assets'], 
-            mode="lines+markers", 
+            x=datetimes(records),
+            y=records['total_assets'].tolist(),
+            mode="lines+markers",
             name='total_assets',
             marker_color=marker_color, text=texts
         ),
@@ -137,44 +115,227 @@ def total_assets(value):
 
     return fig
 
-@app.callback(
-    Output("eth-price", "figure"),
-    Input(component_id='my-input', component_property='value')
-)
-def eth_pricing(value):
+
+def eth_price_figure(records: pd.DataFrame) -> go.Figure:
 
     layout = go.Layout(
         title=go.layout.Title(text='Price of ETH [In USD]'),
-        xaxis=go.layout.XAxis(title='DateTime'),
+        xaxis=go.layout.XAxis(title='DateTime', rangeslider={'visible': False}),
         yaxis=go.layout.YAxis(title='Price of ETH'),
     )
-    fig = make_subplots(
-        specs=[[{"secondary_y": True}]],
-        subplot_titles=['Price of ETH [In USD]', 'ETH Volume']
-    )
-
-    # include candlestick with rangeselector
+    fig = go.Figure(layout=layout)
     fig.add_trace(
         go.Candlestick(
-            x=df['timestamp'],
-            open=df['open'], 
-            high=df['high'],
-            low=df['low'], 
-            close=df['close']
-            ), secondary_y=True)
-
-    # include a go.Bar trace for volumes
-    fig.add_trace(
-        go.Bar(
-            x=df['timestamp'], 
-            y=df['volume']
-        ), secondary_y=False)
+            x=datetimes(records),
+            open=records['open'].tolist(),
+            high=records['high'].tolist(),
+            low=records['low'].tolist(),
+            close=records['close'].tolist(),
+        )
+    )
+
+    return fig
 
-    fig.layout.yaxis2.showgrid=False
-    
+
+def eth_volume_figure(records: pd.DataFrame) -> go.Figure:
+
+    layout = go.Layout(
+        title=go.layout.Title(text='ETH Volume'),
+        xaxis=go.layout.XAxis(title='DateTime'),
+        yaxis=go.layout.YAxis(title='Volume'),
+    )
+    fig = go.Figure(layout=layout)
+    fig.add_trace(go.Bar(x=datetimes(records), y=records['volume'].tolist()))
 
     return fig
 
+
+def risk_metrics_rows() -> list:
+    # The trader keeps the metrics up to date with every record, so they
+    # are read as they are instead of being recomputed from the history.
+    risk_metrics = results_cache.read_json('prod_risk_metrics', default={})
+    return [
+        {'metric': metric, 'value': metric_value}
+        for metric, metric_value in risk_metrics.items()
+    ]
+
+
+def serve_layout():
+    """
+    Built on every page load, from the records stored so far; the page then
+    receives only the newer records, see `refresh`.
+    """
+
+    table = results_cache.read_table('prod_trading_history')
+    records = with_record_columns(records_since(table))
+
+    return html.Div(
+        [
+            dcc.Interval(id='refresh-interval', interval=int(refresh_seconds) * 1000),
+            # Timestamp of the newest record this page has been sent.
+            dcc.Store(id='last-timestamp', data=watermark(table)),
+            # The rows of the latest refresh, appended to the table in the browser.
+            dcc.Store(id='new-records'),
+            html.Div([html.H1("Algorithmic Trading Performance")]),
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.H2("Model Name")
+                        ],
+                        className="col-md-12 col-sm-12",
+                    ),
+                    html.Div(
+                        [dcc.Graph(id="prod-orders", figure=total_assets_figure(records))],
+                        className="col-sm-12",
+                    ),
+                    html.Div(
+                        [dcc.Graph(id='eth-price', figure=eth_price_figure(records))],
+                        className="col-sm-12",
+                    ),
+                    html.Div(
+                        [dcc.Graph(id='eth-volume', figure=eth_volume_figure(records))],
+                        className="col-sm-12",
+                    ),
+                    html.Div(
+                        [
+                            html.H3("Risk Metrics"),
+                            dash_table.DataTable(
+                                id='risk-metrics',
+                                columns=[{"name": i, "id": i} for i in ['metric', 'value']],
+                                data=risk_metrics_rows(),
+                            ),
+                        ],
+                        className="col-sm-12",
+                    ),
+                ],
+                className="row",
+            ),
+            html.Div([
+                html.Div([
+                    dash_table.DataTable(
+                        id='datatable-interactivity',
+                        columns = [
+                            {"name": i, "id": i, "deletable": True, "selectable": True} for i in records.columns
+                        ],
+                        data=records.to_dict(orient='records'),
+                        editable=True,
+                        filter_action="native",
+                        sort_action="native",
+                        sort_mode="multi",
+                        column_selectable="single",
+                        row_selectable="multi",
+                        row_deletable=False,
+                        selected_columns=[],
+                        selected_rows=[],
+                        page_action="native",
+                        page_current=0,
+                        page_size=10,
+                        style_cell={
+                            'whiteSpace': 'normal',
+                            'height': 'auto',
+                        }
+                    )
+                ], className="col-sm-12")
+            ], className="row")
+        ],
+        className="container",
+    )
+
+
+app.layout = serve_layout
+
+
+@app.callback(
+    [
+        Output('prod-orders', 'extendData'),
+        Output('eth-price', 'extendData'),
+        Output('eth-volume', 'extendData'),
+        Output('new-records', 'data'),
+        Output('risk-metrics', 'data'),
+        Output('last-timestamp', 'data'),
+    ],
+    [Input('refresh-interval', 'n_intervals')],
+    [State('last-timestamp', 'data')],
+)
+def refresh(n_intervals, last_timestamp):
+    """
+    Appends the records newer than the page's `last-timestamp` to its
+    figures with `extendData`, and sends them to `new-records` for the
+    table, instead of sending the figures and the table again.
+    """
+
+    # Read once, so every output comes from the same version of the table.
+    table = results_cache.read_table('prod_trading_history')
+    new_records = records_since(table, last_timestamp)
+    if new_records.empty:
+        return [dash.no_update] * 6
+
+    x = datetimes(new_records)
+    marker_color, texts = action_markers(new_records['action'].values)
+    return [
+        [
+            {
+                'x': [x],
+                'y': [new_records['total_assets'].tolist()],
+                'marker.color': [marker_color],
+                'text': [texts],
+            },
+            [0],
+        ],
+        [
+            {
+                'x': [x],
+                'open': [new_records['open'].tolist()],
+                'high': [new_records['high'].tolist()],
+                'low': [new_records['low'].tolist()],
+                'close': [new_records['close'].tolist()],
+            },
+            [0],
+        ],
+        [{'x': [x], 'y': [new_records['volume'].tolist()]}, [0]],
+        {
+            'records': new_records.to_dict(orient='records'),
+            'columns': new_records.columns.tolist(),
+        },
+        risk_metrics_rows(),
+        watermark(table),
+    ]
+
+
+# Runs in the browser: appends the new rows to the rows the table already
+# holds, and adds their columns when the table started out empty.
+app.clientside_callback(
+    """
+    function(new_records, data, columns) {
+        var no_update = window.dash_clientside.no_update;
+        if (!new_records) {
+            return [no_update, no_update];
+        }
+        var known = columns.map(function(column) { return column.id; });
+        var added = new_records.columns.filter(function(id) {
+            return known.indexOf(id) < 0;
+        }).map(function(id) {
+            return {name: id, id: id, deletable: true, selectable: true};
+        });
+        return [
+            (data || []).concat(new_records.records),
+            added.length ? columns.concat(added) : no_update,
+        ];
+    }
+    """,
+    [
+        Output('datatable-interactivity', 'data'),
+        Output('datatable-interactivity', 'columns'),
+    ],
+    [Input('new-records', 'data')],
+    [
+        State('datatable-interactivity', 'data'),
+        State('datatable-interactivity', 'columns'),
+    ],
+)
+
+
 @app.callback(
     Output('datatable-interactivity', 'style_data_conditional'),
     Input('datatable-interactivity', 'selected_columns')
@@ -189,13 +350,24 @@ def update_styles(selected_columns):
 
 
 if __name__ == '__main__':
+    # The development server fills the cache itself; deployed workers rely
+    # on a separate `results_loader.py` process.
+    store = TradingHistoryStore(data_helper)
+    load_prod_history(results_cache, store, data_helper)
+    threading.Thread(
+        target=run_loader,
+        args=(results_cache, os.path.join(project_dir, 'data', 'model_results')),
+        kwargs={'store': store, 'data_helper': data_helper, 'refresh_seconds': int(refresh_seconds)},
+        daemon=True,
+    ).start()
+
     port = os.getenv('PORT')
     host = os.getenv('HOST')
 
     if port == '' or port == None:
         port = '5000'
-    
+
     if host == '' or host == None:
         host = '0.0.0.0'
 
-    app.run_server(host=host, port=port, debug=True)
\ No newline at end of file
+    app.run_server(host=host, port=port, debug=True)
@@ -0,0 +1,146 @@
+import sys
+sys.path.insert(0, "..")
+
+import logging
+import os
+import time
+from glob import glob
+from pathlib import Path
+
+import pandas as pd
+
+from hourly_price_prediction.data.results_cache import ResultsCache
+from hourly_price_prediction.models.run_ranking import rank_runs
+from hourly_price_prediction.monitoring.risk_metrics import StreamingRiskMetrics
+
+project_dir = Path(__file__).resolve().parents[2]
+
+
+def results_cache_directory() -> str:
+    cache_directory = os.getenv('RESULTS_CACHE_DIRECTORY')
+    if cache_directory == '' or cache_directory == None:
+        cache_directory = os.path.join(project_dir, 'data', 'results_cache')
+    return cache_directory
+
+
+def model_results_signature(base_directory: str) -> list:
+    """Changes whenever a training run is added, removed or rewritten."""
+    return [
+        (path, os.path.getmtime(path))
+        for path in sorted(glob(os.path.join(base_directory, '*', 'trading_history.csv')))
+    ]
+
+
+def load_model_results(results_cache: ResultsCache, base_directory: str) -> None:
+    """
+    Fills the tables of the model results dashboard from the training runs
+    under `base_directory`:
+
+        model_metrics    every run's model_metrics.csv, with a `model` column
+        trading_history  every run's trading_history.csv, one after the other
+        runs             `model`, and the `start` / `stop` rows of its
+                         trading history
+        run_ranking      `rank_runs`
+    """
+
+    logger = logging.getLogger(__name__)
+    run_directories = sorted(
+        os.path.dirname(path)
+        for path in glob(os.path.join(base_directory, '*', 'trading_history.csv'))
+    )
+
+    model_metrics = []
+    trading_histories = []
+    runs = {'model': [], 'start': [], 'stop': []}
+    n_rows = 0
+    for run_directory in run_directories:
+        model_name = os.path.basename(run_directory)
+        metrics = pd.read_csv(os.path.join(run_directory, 'model_metrics.csv'))
+        metrics['model'] = model_name
+        model_metrics.append(metrics)
+        trading_history = pd.read_csv(os.path.join(run_directory, 'trading_history.csv'))
+        trading_histories.append(trading_history)
+        runs['model'].append(model_name)
+        runs['start'].append(n_rows)
+        n_rows += len(trading_history)
+        runs['stop'].append(n_rows)
+
+    # Written before `runs`, which readers open first: every run it lists
+    # is then in the other tables.
+    results_cache.write_table(
+        'model_metrics', pd.concat(model_metrics, ignore_index=True) if model_metrics else pd.DataFrame())
+    results_cache.write_table(
+        'trading_history',
+        pd.concat(trading_histories, ignore_index=True) if trading_histories else pd.DataFrame(),
+    )
+    results_cache.write_table('run_ranking', rank_runs(base_directory).round(5))
+    results_cache.write_table('runs', pd.DataFrame(runs))
+    logger.info(f"Cached the results of {len(run_directories)} runs")
+
+
+def load_prod_history(results_cache: ResultsCache, store, data_helper) -> int:
+    """
+    Refreshes the trader's `TradingHistoryStore` and, when it has new
+    records, publishes the whole history as the `prod_trading_history`
+    table and the Lambda trader's risk metrics as `prod_risk_metrics`.
+
+    :returns: (int) Number of records added.
+    """
+
+    added = store.refresh()
+    if added or results_cache.version('prod_trading_history') is None:
+        results_cache.write_table('prod_trading_history', store.history)
+        risk_metrics = StreamingRiskMetrics()
+        risk_metrics.load(data_helper)
+        results_cache.write_json('prod_risk_metrics', risk_metrics.metrics)
+    return added
+
+
+def run_loader(results_cache: ResultsCache, base_directory: str, store=None, data_helper=None, refresh_seconds: int = 60) -> None:
+    """
+    Keeps the cache current: reloads the model results whenever a run
+    changes and, given a `store`, the prod trading history every
+    `refresh_seconds`. A failed refresh is logged and retried on the next
+    one; the dashboards keep serving the last version meanwhile.
+    """
+
+    logger = logging.getLogger(__name__)
+    signature = None
+    while True:
+        try:
+            current_signature = model_results_signature(base_directory)
+            if current_signature != signature:
+                load_model_results(results_cache, base_directory)
+                signature = current_signature
+        except Exception:
+            logger.exception("Unable to refresh the model results")
+        if store is not None:
+            try:
+                load_prod_history(results_cache, store, data_helper)
+            except Exception:
+                logger.exception("Unable to refresh the prod trading history")
+        time.sleep(refresh_seconds)
+
+
+if __name__ == '__main__':
+    from hourly_price_prediction.data.s3_cache import S3Cache
+    from hourly_price_prediction.data.s3_helper import S3Helper
+    from hourly_price_prediction.data.trading_history import TradingHistoryStore
+
+    logging.basicConfig(level=logging.INFO)
+    refresh_seconds = os.getenv('REFRESH_SECONDS')
+    if refresh_seconds == '' or refresh_seconds == None:
+        refresh_seconds = '60'
+
+    data_helper = S3Helper(
+        'hourly-price-prediction',
+        region_name='us-east-2',
+        cache=S3Cache(os.path.join(project_dir, 'data', 's3_cache')),
+    )
+    run_loader(
+        ResultsCache(results_cache_directory()),
+        os.path.join(project_dir, 'data', 'model_results'),
+        store=TradingHistoryStore(data_helper),
+        data_helper=data_helper,
+        refresh_seconds=int(refresh_seconds),
+    )
@@ -1,11 +1,21 @@
-import json
+import hashlib
 import os
+import pickle
 import time
 import logging
 import boto3
+import numpy as np
+from botocore.exceptions import ClientError
 
+from hourly_price_prediction.data.s3_cache import S3Cache
 from hourly_price_prediction.data.s3_helper import S3Helper
+from hourly_price_prediction.features.indicators import (FeatureSet,
+                                                          LiveFeatureState)
 from hourly_price_prediction.models.asset_trader import AssetTrader
+from hourly_price_prediction.models.online import OnlineModelUpdater
+from hourly_price_prediction.models.registry import ModelRegistry
+from hourly_price_prediction.monitoring.latency import StageTimer
+from hourly_price_prediction.monitoring.risk_metrics import StreamingRiskMetrics
 
 asset = str(os.getenv("ASSET"))
 api_secret = str(os.getenv("API_SECRET"))
@@ -13,60 +23,168 @@ api_key = str(os.getenv("API_KEY"))
 passphrase = str(os.getenv("PASSPHRASE"))
 use_sandbox = str(os.getenv("USE_SANDBOX"))
 use_sandbox = True if use_sandbox.lower() == 'true' else False
+online_learning = str(os.getenv("ONLINE_LEARNING"))
+online_learning = True if online_learning.lower() == 'true' else False
 
 bucket = str(os.getenv("S3_BUCKET"))
 model_name = str(os.getenv("MODEL_NAME"))
 region_name = str(os.getenv("REGION_NAME"))
 print(f'use_sandbox: {use_sandbox}')
+print(f'online_learning: {online_learning}')
+
+# Read-through cache of S3 objects on the container's /tmp.
+s3_cache = S3Cache("/tmp/s3-cache", max_bytes=256 * 1024 ** 2)
+
+# (pickle bytes, unpickled model) of the production model by registry
+# version, or of the pinned MODEL_NAME, kept across warm invocations.
+_models = {}
 
 
 def lambda_handler(event, context):
-    pickle_file = "/tmp/model.pickle"
-    validation_metrics = "/tmp/validation_metrics.json"
+    timer = StageTimer(dimensions={"Service": "asset-trader", "Asset": asset})
+    properties = {"model": None, "action": None, "error": None}
+    # Emitted whether or not the tick succeeds: failed ticks are usually
+    # the slow ones.
+    try:
+        return _trade(timer, properties)
+    except Exception as e:
+        properties["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        timer.emit(properties=properties)
 
-    data_helper = S3Helper(bucket, region_name)
 
-    data_helper.download_from_s3(
-        s3_key=os.path.join(model_name, "model.pickle"), local_filepath=pickle_file
-    )
-    print("Model Artifact downloaded")
+def _trade(timer: StageTimer, properties: dict):
+    """
+    One hourly tick of `lambda_handler`, timed by `timer`. The deployed
+    model and the action are written to `properties` as they are known.
+    """
 
-    data_helper.download_from_s3(
-        s3_key=os.path.join(model_name, "validation_metrics.json"),
-        local_filepath=validation_metrics,
-    )
-    print("Validation Metrics downloaded")
-
-    with open(validation_metrics, "r") as val_json_file:
-        raw_json_data = val_json_file.read()
-        print(f"raw_json_data: {raw_json_data}")
-        val_metrics = json.loads(raw_json_data)
-        val_json_file.close()
-
-    asset_trader = AssetTrader(
-        asset=asset,
-        api_secret=api_secret,
-        api_key=api_key,
-        passphrase=passphrase,
-        pickle_file=pickle_file,
-        use_sandbox=use_sandbox
-    )
-    usd_wallet = asset_trader.get_account_balance(asset_trader.usd_wallet)
-    asset_wallet = asset_trader.get_account_balance(asset_trader.asset_wallet)
+    data_helper = S3Helper(bucket, region_name, cache=s3_cache)
 
-    start_datetime, end_datetime = asset_trader._get_start_end_iso_times()
-    last_hour_asset = asset_trader.get_asset_details_last_hour(
-        start=start_datetime, end=end_datetime
-    )
+    if model_name in ("None", ""):
+        # No pinned MODEL_NAME: run whatever the registry marks as production.
+        with timer.stage("manifest_download"):
+            manifest = ModelRegistry(data_helper).production()
+        if manifest is None:
+            raise RuntimeError("No production model has been promoted in the registry")
+        deployed_model_name = manifest["model_name"]
+        val_metrics = manifest["validation_metrics"]
+        feature_specs = manifest.get("features", [])
+        print(f"Production Model: {deployed_model_name} (version {manifest['version']})")
+
+        if manifest["version"] not in _models:
+            with timer.stage("model_download"):
+                model_bytes = data_helper.get_object_bytes(
+                    manifest["artifact_key"], immutable=True)
+            if hashlib.sha256(model_bytes).hexdigest() != manifest["artifact_sha256"]:
+                raise RuntimeError(f"Checksum mismatch for {manifest['artifact_key']}")
+            _models.clear()
+            _models[manifest["version"]] = (model_bytes, pickle.loads(model_bytes))
+            print("Model Artifact downloaded")
+        model_bytes, model = _models[manifest["version"]]
+
+    else:
+        deployed_model_name = model_name
+        with timer.stage("model_download"):
+            model_bytes = data_helper.get_object_bytes(
+                os.path.join(model_name, "model.pickle"))
+        # Unpickling (and compiling a tree model) is only redone when the
+        # artifact changes.
+        if _models.get(model_name, (None,))[0] != model_bytes:
+            _models.clear()
+            _models[model_name] = (model_bytes, pickle.loads(model_bytes))
+        model = _models[model_name][1]
+        print("Model Artifact downloaded")
+
+        with timer.stage("metrics_download"):
+            val_metrics = data_helper.get_json(
+                os.path.join(model_name, "validation_metrics.json"))
+        print(f"Validation Metrics downloaded: {val_metrics}")
+
+        with timer.stage("features_download"):
+            try:
+                feature_specs = data_helper.get_json(
+                    os.path.join(model_name, "features.json"))
+            except (ClientError, FileNotFoundError):
+                feature_specs = []
+
+    properties["model"] = deployed_model_name
+
+    with timer.stage("trader_init"):
+        asset_trader = AssetTrader(
+            asset=asset,
+            api_secret=api_secret,
+            api_key=api_key,
+            passphrase=passphrase,
+            pickle_file=None,
+            use_sandbox=use_sandbox,
+            model=model,
+        )
+    with timer.stage("exchange_balances"):
+        usd_wallet = asset_trader.get_account_balance(asset_trader.usd_wallet)
+        asset_wallet = asset_trader.get_account_balance(asset_trader.asset_wallet)
+
+    with timer.stage("exchange_candles"):
+        start_datetime, end_datetime = asset_trader._get_start_end_iso_times()
+        last_hour_asset = asset_trader.get_asset_details_last_hour(
+            start=start_datetime, end=end_datetime
+        )
     timestamp = last_hour_asset["timestamp"]
     open_ = last_hour_asset["open"]
     high_ = last_hour_asset["high"]
     low_ = last_hour_asset["low"]
     current_close_ = last_hour_asset["close"]
     volume_ = last_hour_asset["volume"]
-    model_prediction = asset_trader.predict(
-        open_, high_, low_, current_close_, volume_
-    )[0]
+
+    live_features = None
+    feature_values = []
+    if feature_specs:
+        with timer.stage("features"):
+            live_features = LiveFeatureState(FeatureSet.from_specs(feature_specs))
+            live_features.load(data_helper, deployed_model_name)
+            if live_features.needs_history(timestamp):
+                history_start, history_end = asset_trader._get_start_end_iso_times(
+                    hours=live_features.feature_set.history + 1)
+                history = asset_trader.get_asset_history(
+                    start=history_start, end=history_end)
+                live_features.warm_up(
+                    [candle for candle in history if candle["timestamp"] < timestamp])
+                print(f"Feature state warmed up on {len(history)} candles")
+            feature_values = live_features.observe(last_hour_asset)
+        print(f"Features: {dict(zip(live_features.feature_set.names, feature_values))}")
+
+    online_updater = None
+    if (
+        online_learning
+        and int(val_metrics.get("horizon", 1)) == 1
+        and hasattr(asset_trader.model, "partial_fit")
+        and None not in feature_values
+    ):
+        with timer.stage("online_update"):
+            online_updater = OnlineModelUpdater(
+                base_model_bytes=model_bytes, validation_mae=float(val_metrics["mae"])
+            )
+            online_updater.load(data_helper, deployed_model_name)
+            online_outcome = online_updater.observe(
+                features=[open_, high_, low_, current_close_, volume_] + feature_values,
+                close=current_close_,
+                timestamp=timestamp,
+            )
+            asset_trader.model = online_updater.model
+        print(f"Online Update: {online_outcome}")
+
+    with timer.stage("prediction"):
+        if None in feature_values:
+            # Not enough history for every feature yet: predicting the
+            # current close makes the strategy sit this tick out.
+            model_prediction = current_close_
+        else:
+            model_prediction = asset_trader.predict(
+                open_, high_, low_, current_close_, volume_, feature_values
+            )[0]
+    # A multi-horizon model predicts the close of each of the next hours.
+    horizon_predictions = [float(value) for value in np.ravel(model_prediction)]
 
 
     action, amount = asset_trader.trading_strategy(
@@ -76,51 +194,88 @@ def lambda_handler(event, context):
         percent_of_total_money_to_move=0.10,
         total_money_in_usd=usd_wallet,
     )
+    properties["action"] = action
 
-    if action == "buy":
-        order_response = asset_trader.place_buy_order(amount)
-        print("Made Buy Order")
+    with timer.stage("order_placement"):
+        if action == "buy":
+            order_response = asset_trader.place_buy_order(amount)
+            print("Made Buy Order")
 
-    elif action == "sell":
-        order_response = asset_trader.place_sell_order(amount)
-        print("Made Sell Order")
+        elif action == "sell":
+            order_response = asset_trader.place_sell_order(amount)
+            print("Made Sell Order")
 
-    elif action == "do_nothing":
-        order_response = None
-        print("Not Making an Order")
+        elif action == "do_nothing":
+            order_response = None
+            print("Not Making an Order")
 
-    time.sleep(10)
-    usd_wallet = asset_trader.get_account_balance(asset_trader.usd_wallet)
-    asset_wallet = asset_trader.get_account_balance(asset_trader.asset_wallet)
+    with timer.stage("fill_wait"):
+        time.sleep(10)
+    with timer.stage("exchange_balances_post_fill"):
+        usd_wallet = asset_trader.get_account_balance(asset_trader.usd_wallet)
+        asset_wallet = asset_trader.get_account_balance(asset_trader.asset_wallet)
 
     trading_history = {
-        "model": model_name,
+        "model": deployed_model_name,
         "open": open_,
         "high": high_,
         "low": low_,
         "close": current_close_,
         "volume": volume_,
-        "model_prediction": model_prediction,
+        "model_prediction": float(np.mean(horizon_predictions)),
+        "sat_out": None in feature_values,
         "action": action,
         "usd_wallet": usd_wallet,
         "asset_wallet": asset_wallet,
         "timestamp": timestamp
     }
-    for key in order_response.keys():
-        trading_history[key] = order_response[key]
+    if hasattr(asset_trader.model, "member_predictions") and None not in feature_values:
+        # Stacked ensemble: every member's view, from one batched call.
+        member_predictions = asset_trader.model.member_predictions(
+            [[open_, high_, low_, current_close_, volume_] + feature_values])[0]
+        for name, value in zip(asset_trader.model.member_names_, member_predictions):
+            trading_history[f"member_{name}"] = float(value)
+    if len(horizon_predictions) > 1:
+        for step, value in enumerate(horizon_predictions, start=1):
+            trading_history[f"model_prediction_{step}"] = value
+    if order_response is not None:
+        for key in order_response.keys():
+            trading_history[key] = order_response[key]
+
+    if live_features is not None:
+        with timer.stage("features_save"):
+            live_features.save(data_helper, deployed_model_name)
+        for name, value in zip(live_features.feature_set.names, feature_values):
+            trading_history[name] = value
+
+    if online_updater is not None:
+        with timer.stage("online_save"):
+            online_updater.save(data_helper, deployed_model_name)
+        trading_history["online_updates"] = online_updater.state["updates"]
+        trading_history["online_rollbacks"] = online_updater.state["rollbacks"]
+        trading_history["online_mae"] = online_updater.online_mae
 
     s3_partition = data_helper.generate_partition()
     trading_history_filename = "{}.json".format(
         time.strftime("%Y%m%dT%H%M%S%MS"))
         
-    with open(f"/tmp/{trading_history_filename}", "w") as history_jfile:
-        history_jfile.write(json.dumps(trading_history))
-        history_jfile.close()
+    with timer.stage("s3_upload"):
+        data_helper.put_json(
+            f"trading_history/{s3_partition}/{trading_history_filename}",
+            trading_history,
+        )
 
-    data_helper.upload_to_s3(
-        s3_key=f"trading_history/{s3_partition}/{trading_history_filename}",
-        local_filepath=f"/tmp/{trading_history_filename}",
-    )
+    # After the upload: the order is placed, so its record must not be
+    # lost to a failure in the metrics.
+    with timer.stage("risk_metrics"):
+        try:
+            risk_metrics = StreamingRiskMetrics(asset=asset, trader="asset-trader")
+            risk_metrics.load(data_helper)
+            current_risk_metrics = risk_metrics.update(trading_history)
+            risk_metrics.save(data_helper)
+            print(f"Risk Metrics: {current_risk_metrics}")
+        except Exception:
+            logging.getLogger(__name__).exception("Unable to update the risk metrics")
 
     print("Done")
 
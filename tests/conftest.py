@@ -0,0 +1,54 @@
+import json
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+START_EPOCH = 1609459200
+
+
+def make_candles(number_of_hours: int, seed: int = 7) -> pd.DataFrame:
+    """Hourly candles from a geometric random walk, oldest first."""
+
+    rng = np.random.default_rng(seed)
+    close = 2000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, number_of_hours)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0.0, 0.004, number_of_hours))
+    return pd.DataFrame(
+        {
+            "timestamp": START_EPOCH + 3600 * np.arange(number_of_hours),
+            "open": open_,
+            "high": np.maximum(open_, close) * (1.0 + spread),
+            "low": np.minimum(open_, close) * (1.0 - spread),
+            "close": close,
+            "volume": rng.uniform(100.0, 5000.0, number_of_hours),
+        }
+    )
+
+
+@pytest.fixture
+def candles() -> pd.DataFrame:
+    return make_candles(1000)
+
+
+@pytest.fixture
+def model_files(candles, tmp_path) -> tuple:
+    """
+    A linear model predicting the next close from the current close and
+    volume, pickled with its validation metrics the way training saves
+    them. It trades both ways most hours.
+
+    :returns: tuple(model_artifact, validation_metrics_json_file)
+    """
+
+    features = candles[["open", "high", "low", "close", "volume"]].values
+    targets = candles["close"].values + 0.002 * (candles["volume"].values - 2500.0)
+    model = LinearRegression().fit(features, targets)
+
+    model_artifact = tmp_path / "model.pickle"
+    model_artifact.write_bytes(pickle.dumps(model))
+    val_metrics_json_file = tmp_path / "validation_metrics.json"
+    val_metrics_json_file.write_text(json.dumps({"mae": 3.0}))
+    return (str(model_artifact), str(val_metrics_json_file))
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from sklearn.linear_model import LinearRegression
+
+from hourly_price_prediction.models.asset_trader import AssetTrader
+from hourly_price_prediction.simulation.clock import SimulatedClock
+from hourly_price_prediction.simulation.exchange import SimulatedExchange
+
+
+def test_asset_history_longer_than_one_request_is_read_page_by_page(candles):
+    last_close = int(candles["timestamp"].iloc[-1]) + 3600
+    exchange = SimulatedExchange(
+        candles.rename(columns={"timestamp": "time"}), clock=SimulatedClock(start=last_close))
+    asset_trader = AssetTrader(
+        asset=exchange.product_id,
+        api_secret="",
+        api_key="",
+        passphrase="",
+        pickle_file=None,
+        public_client=exchange,
+        private_client=exchange,
+        model=LinearRegression(),
+    )
+
+    hours = 2 * AssetTrader.MAX_CANDLES_PER_REQUEST + 100
+    history = asset_trader.get_asset_history(
+        start=datetime.fromtimestamp(last_close - hours * 3600).isoformat(),
+        end=datetime.fromtimestamp(last_close).isoformat(),
+    )
+
+    timestamps = [candle["timestamp"] for candle in history]
+    assert timestamps == list(range(last_close - hours * 3600, last_close, 3600))
+    assert [candle["close"] for candle in history] == candles["close"].tolist()[-hours:]
@@ -0,0 +1,154 @@
+import json
+
+import numpy as np
+import pytest
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.monitoring.drift import ResidualDriftMonitor
+from hourly_price_prediction.monitoring.retrain_scheduler import (
+    cooling_down, observe_new_records)
+
+START_EPOCH = 1609459200
+
+
+def make_records(residuals, model: str = "model", start: int = START_EPOCH) -> list:
+    """
+    Hourly trading history records whose predictions miss the next close
+    by `residuals` (close minus prediction).
+    """
+
+    closes = 2000.0 + np.cumsum(np.ones(len(residuals) + 2))
+    return [
+        {
+            "model": model,
+            "timestamp": start + 3600 * hour,
+            "close": float(closes[hour]),
+            "model_prediction": float(closes[hour + 1] - residual),
+            "sat_out": False,
+        }
+        for hour, residual in enumerate(list(residuals) + [0.0])
+    ]
+
+
+def make_monitor(**kwargs) -> ResidualDriftMonitor:
+    monitor = ResidualDriftMonitor(**kwargs)
+    monitor.set_model("model", {"mae": 1.0, "rmse": 1.0})
+    return monitor
+
+
+def alternating(magnitudes) -> np.ndarray:
+    """`magnitudes` with alternating signs, so the residuals are unbiased."""
+    magnitudes = np.asarray(magnitudes, dtype=float)
+    return magnitudes * np.where(np.arange(len(magnitudes)) % 2, -1.0, 1.0)
+
+
+def test_no_drift_is_reported_below_min_residuals():
+    monitor = make_monitor(min_residuals=24)
+    records = make_records(alternating(np.full(24, 10.0)))
+
+    for record in records[:24]:
+        monitor.update(record)
+    assert monitor.statistics["window_residuals"] == 23
+    assert monitor.drift_reasons() == []
+
+    monitor.update(records[24])
+    assert monitor.statistics["mae_ratio"] == pytest.approx(10.0)
+    assert monitor.drift_reasons()
+
+
+def test_a_larger_error_is_drift():
+    monitor = make_monitor(cusum_threshold=1e9)
+    for record in make_records(alternating(np.full(48, 2.0))):
+        monitor.update(record)
+
+    reasons = monitor.drift_reasons()
+    assert reasons == [
+        "rolling MAE is 2.00x the validation MAE", "rolling RMSE is 2.00x the validation RMSE"]
+
+
+def test_a_biased_error_is_drift():
+    monitor = make_monitor()
+    residuals = 0.5 + alternating(np.full(48, 0.2))
+    for record in make_records(residuals):
+        monitor.update(record)
+
+    reasons = monitor.drift_reasons()
+    assert len(reasons) == 1 and reasons[0].startswith("residuals are biased")
+    assert monitor.statistics["mae_ratio"] < 1.0
+
+
+def test_a_sustained_moderate_rise_is_caught_by_the_cusum():
+    monitor = make_monitor()
+    residuals = alternating(np.concatenate([np.full(100, 0.5), np.full(60, 2.0)]))
+    for record in make_records(residuals):
+        monitor.update(record)
+
+    assert monitor.statistics["mae_ratio"] < monitor.max_error_ratio
+    assert monitor.drift_reasons() == ["error CUSUM is 30.0"]
+
+
+def test_sat_out_and_non_consecutive_records_are_not_scored():
+    monitor = make_monitor()
+    records = make_records(np.full(8, 1.0))
+    records[1]["sat_out"] = True
+    del records[4]
+    legacy = dict(records[4], model_prediction=records[4]["close"])
+    del legacy["sat_out"]
+    records[4] = legacy
+
+    added = [monitor.update(record) for record in records]
+    # Hours 0, 2, 6 and 7 are scored. Not 1 (sat out), 3 (hour 4 is
+    # missing), nor 5 (a legacy record that sat out).
+    assert added == [False, True, False, True, False, False, True, True]
+    assert not monitor.update(records[-1])
+    assert monitor.state["residuals"] == [1.0, 1.0, 1.0, 1.0]
+
+
+def test_the_window_keeps_running_sums_of_its_last_residuals():
+    monitor = make_monitor(window=168)
+    residuals = np.random.default_rng(3).normal(0.3, 1.0, 500)
+    for record in make_records(residuals):
+        monitor.update(record)
+        # The scheduler keeps the state as JSON between runs.
+        monitor.state = json.loads(json.dumps(monitor.state))
+
+    window = residuals[-168:]
+    statistics = monitor.statistics
+    assert statistics["window_residuals"] == 168
+    assert monitor.state["n_residuals"] == 500
+    assert statistics["rolling_mae"] == pytest.approx(np.mean(np.abs(window)))
+    assert statistics["rolling_rmse"] == pytest.approx(np.sqrt(np.mean(window ** 2)))
+    assert statistics["bias"] == pytest.approx(np.mean(window))
+
+
+def test_a_new_model_starts_from_an_empty_window(tmp_path):
+    data_helper = LocalS3Helper(str(tmp_path))
+    for model in ["first", "second"]:
+        data_helper.put_json(f"{model}/validation_metrics.json", {"mae": 1.0})
+    records = make_records(np.full(30, 3.0), model="first")
+    records += make_records(np.full(5, 0.5), model="second", start=records[-1]["timestamp"] + 3600)
+    for hour, record in enumerate(records):
+        data_helper.put_json(f"trading_history/{hour:04d}.json", record)
+
+    monitor = ResidualDriftMonitor()
+    assert observe_new_records(data_helper, monitor) == len(records)
+    assert monitor.state["model"] == "second"
+    assert monitor.state["residuals"] == [0.5] * 5
+    assert monitor.state["last_key"] == "trading_history/0036.json"
+    assert observe_new_records(data_helper, monitor) == 0
+
+
+def test_no_retrain_within_the_cooldown_after_the_last():
+    monitor = make_monitor()
+    records = make_records(np.zeros(100))
+    for record in records[:10]:
+        monitor.update(record)
+    assert not cooling_down(monitor, cooldown_hours=72)
+
+    monitor.mark_retrained()
+    assert monitor.state["retrains"] == 1 and monitor.statistics["window_residuals"] == 0
+    for record in records[10:81]:
+        monitor.update(record)
+    assert cooling_down(monitor, cooldown_hours=72)
+    monitor.update(records[81])
+    assert not cooling_down(monitor, cooldown_hours=72)
@@ -0,0 +1,100 @@
+import pytest
+
+from hourly_price_prediction.simulation.clock import SimulatedClock
+from hourly_price_prediction.simulation.exchange import SimulatedExchange
+
+GRANULARITY = 3600
+
+
+@pytest.fixture
+def candles(candles):
+    return candles.rename(columns={"timestamp": "time"})
+
+
+def make_exchange(candles, hour: int = 10, **kwargs) -> SimulatedExchange:
+    """An exchange whose clock reads the close of candle `hour`."""
+    clock = SimulatedClock(start=int(candles["time"].iloc[hour]) + GRANULARITY)
+    return SimulatedExchange(candles, clock=clock, **kwargs)
+
+
+def test_a_market_buy_fills_at_the_next_open_less_the_fee(candles):
+    exchange = make_exchange(candles, fee_rate=0.005)
+    price = candles["open"].iloc[11]
+
+    order = exchange.place_market_order("ETH-USD", "buy", funds="100")
+    filled = exchange.get_order(order["id"])
+
+    size = 100.0 / 1.005 / price
+    assert filled["status"] == "done" and filled["settled"]
+    assert float(filled["filled_size"]) == pytest.approx(size, abs=1e-8)
+    assert float(filled["fill_fees"]) == pytest.approx(size * price * 0.005)
+    assert exchange.balance("USD") == pytest.approx(900.0)
+    assert exchange.balance("ETH") == pytest.approx(size)
+
+
+def test_a_market_sell_fills_at_the_next_open_less_the_fee(candles):
+    exchange = make_exchange(
+        candles, fee_rate=0.005, initial_balances={"USD": 0.0, "ETH": 1.0})
+    price = candles["open"].iloc[11]
+
+    exchange.place_market_order("ETH-USD", "sell", size="0.25")
+
+    assert exchange.balance("ETH") == pytest.approx(0.75)
+    assert exchange.balance("USD") == pytest.approx(0.25 * price * 0.995)
+
+
+def test_holds_are_released_when_the_order_settles(candles):
+    exchange = make_exchange(candles, fill_delay=10.0)
+    usd_account = next(
+        account for account in exchange.get_accounts() if account["currency"] == "USD")
+
+    order = exchange.place_market_order("ETH-USD", "buy", funds="100")
+    account = exchange.get_account(usd_account["id"])
+    assert exchange.get_order(order["id"])["status"] == "pending"
+    assert float(account["hold"]) == pytest.approx(100.0)
+    assert float(account["available"]) == pytest.approx(900.0)
+    assert float(account["balance"]) == 1000.0
+
+    exchange.clock.advance(10.0)
+    account = exchange.get_account(usd_account["id"])
+    assert exchange.get_order(order["id"])["status"] == "done"
+    assert float(account["hold"]) == pytest.approx(0.0)
+    assert float(account["balance"]) == pytest.approx(900.0)
+
+
+def test_orders_beyond_the_available_funds_are_rejected(candles):
+    exchange = make_exchange(candles, fill_delay=10.0)
+
+    assert exchange.place_market_order("ETH-USD", "buy", funds="1000.01") == {
+        "message": "Insufficient funds"}
+    assert "id" in exchange.place_market_order("ETH-USD", "buy", funds="600")
+    # The first order's hold is not available until it settles.
+    assert exchange.place_market_order("ETH-USD", "buy", funds="600") == {
+        "message": "Insufficient funds"}
+    assert exchange.place_market_order("ETH-USD", "sell", size="0.1") == {
+        "message": "Insufficient funds"}
+
+
+def test_historic_rates_are_the_closed_candles_of_the_window_newest_first(candles):
+    exchange = make_exchange(candles, hour=500)
+    times = candles["time"].values
+    now = exchange.clock.time()
+
+    rates = exchange.get_product_historic_rates(
+        "ETH-USD", start=float(times[490]), end=float(times[495]))
+    assert [rate[0] for rate in rates] == list(times[490:496][::-1])
+    assert rates[0][1:] == candles[["low", "high", "open", "close", "volume"]].iloc[495].tolist()
+
+    # Nothing that has not closed yet, and at most 300 candles.
+    rates = exchange.get_product_historic_rates("ETH-USD", end=now + 10 * GRANULARITY)
+    assert rates[0][0] == times[500]
+    assert len(rates) == 300
+
+    rates = exchange.get_product_historic_rates(
+        "ETH-USD", start=float(times[490]), end=float(times[495]), granularity=2 * GRANULARITY)
+    assert [rate[0] for rate in rates] == [times[494], times[492], times[490]]
+    assert rates[0][4] == candles["close"].iloc[495]
+
+    assert exchange.get_product_historic_rates("ETH-USD", granularity=1800) == {
+        "message": "Unsupported granularity"}
+    assert exchange.get_product_historic_rates("BTC-USD") == {"message": "NotFound"}
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.features.indicators import (INDICATORS,
+                                                          FeatureSet,
+                                                          LiveFeatureState)
+
+FEATURE_SPECS = [
+    {"kind": "ema", "span": 12},
+    {"kind": "ema", "span": 5, "column": "volume"},
+    {"kind": "rsi", "period": 14},
+    {"kind": "volatility", "window": 24},
+    {"kind": "return", "lag": 1},
+    {"kind": "return", "lag": 24},
+]
+
+
+def test_every_indicator_kind_is_tested():
+    assert {spec["kind"] for spec in FEATURE_SPECS} == set(INDICATORS)
+
+
+@pytest.mark.parametrize("spec", FEATURE_SPECS, ids=lambda spec: FeatureSet.from_specs([spec]).names[0])
+def test_batch_and_incremental_values_are_identical(candles, spec):
+    feature_set = FeatureSet.from_specs([spec])
+    assert feature_set.check_consistency(candles) == {feature_set.names[0]: 0}
+
+
+def test_identical_on_flat_prices(candles):
+    # No price change at all: RSI falls back to 50, volatility to 0.
+    candles = candles.copy()
+    candles.loc[100:300, ["open", "high", "low", "close"]] = 2000.0
+    feature_set = FeatureSet.from_specs(FEATURE_SPECS)
+    assert sum(feature_set.check_consistency(candles).values()) == 0
+
+
+def test_transform_of_newest_first_dataset_matches_batch(candles):
+    feature_set = FeatureSet.from_specs(FEATURE_SPECS)
+    dataset = candles.rename(columns={"close": "currentclose", "volume": "volume_eth"})
+    transformed = feature_set.transform(dataset.iloc[::-1], newest_first=True)
+    expected = feature_set.batch(candles)
+    for name in feature_set.names:
+        np.testing.assert_array_equal(transformed[name].values[::-1], expected[name].values)
+
+
+def test_live_feature_state_survives_a_json_round_trip(candles, tmp_path):
+    feature_set = FeatureSet.from_specs(FEATURE_SPECS)
+    expected = feature_set.batch(candles).values
+    data_helper = LocalS3Helper(str(tmp_path))
+    records = candles.to_dict("records")
+
+    live_features = LiveFeatureState(feature_set)
+    observed = [live_features.observe(candle) for candle in records[:500]]
+    live_features.save(data_helper, "model")
+
+    # Every later tick restores the state from its JSON document.
+    for candle in records[500:]:
+        live_features = LiveFeatureState(FeatureSet.from_specs(FEATURE_SPECS))
+        live_features.load(data_helper, "model")
+        assert not live_features.needs_history(candle["timestamp"])
+        observed.append(live_features.observe(candle))
+        live_features.save(data_helper, "model")
+
+    observed = np.array(
+        [[np.nan if value is None else value for value in values] for values in observed])
+    np.testing.assert_array_equal(observed, expected)
+
+
+def test_live_feature_state_repeats_a_candle_without_advancing(candles):
+    live_features = LiveFeatureState(FeatureSet.from_specs(FEATURE_SPECS))
+    records = candles.to_dict("records")
+    for candle in records[:100]:
+        values = live_features.observe(candle)
+    assert live_features.observe(records[99]) == values
+    assert live_features.needs_history(records[101]["timestamp"])
+
+
+def test_transform_reads_the_volume_of_any_base_currency(candles):
+    feature_set = FeatureSet.from_specs([{"kind": "ema", "span": 5, "column": "volume"}])
+    dataset = candles.rename(columns={"close": "currentclose", "volume": "volume_btc"})
+    transformed = feature_set.transform(dataset)
+    np.testing.assert_array_equal(
+        transformed["ema_volume_5"].values, feature_set.batch(candles)["ema_volume_5"].values)
@@ -0,0 +1,35 @@
+import contextlib
+import importlib
+import io
+
+import pytest
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.monitoring.latency import parse_emf_line
+from hourly_price_prediction.simulation.exchange import SimulatedExchange
+from hourly_price_prediction.simulation.replay import (patched_lambda_module,
+                                                       replay_lambda_handler)
+
+
+def test_balances_before_the_order_and_after_the_fill_are_timed_apart(candles, model_files):
+    history = replay_lambda_handler(
+        candles.rename(columns={"timestamp": "time"}).iloc[:5], *model_files)
+    assert history["stage_exchange_balances_ms"].notna().all()
+    assert history["stage_exchange_balances_post_fill_ms"].notna().all()
+
+
+def test_a_failed_invocation_still_emits_its_latencies(candles, tmp_path):
+    lambda_module = importlib.import_module("lambda_function")
+    exchange = SimulatedExchange(candles.rename(columns={"timestamp": "time"}))
+    s3_helper = LocalS3Helper(str(tmp_path), clock=exchange.clock)
+
+    output = io.StringIO()
+    with patched_lambda_module(lambda_module, exchange, s3_helper, "missing-model"):
+        with contextlib.redirect_stdout(output), pytest.raises(FileNotFoundError):
+            lambda_module.lambda_handler({}, None)
+
+    documents = [parse_emf_line(line) for line in output.getvalue().splitlines()]
+    documents = [document for document in documents if document is not None]
+    assert len(documents) == 1
+    assert documents[0]["error"].startswith("FileNotFoundError")
+    assert "model_download" in documents[0] and "total" in documents[0]
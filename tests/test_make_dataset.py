@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hourly_price_prediction.data.candles import write_cdd_csv
+from hourly_price_prediction.data.make_dataset import (
+    add_targets, process_raw_data, process_raw_data_chunked)
+
+
+@pytest.fixture
+def raw_data_filepath(candles, tmp_path) -> str:
+    return write_cdd_csv(
+        candles.rename(columns={"timestamp": "time"}).iloc[:100],
+        str(tmp_path / "ETHUSD_1h.csv"))
+
+
+@pytest.mark.parametrize("horizon", [1, 3])
+@pytest.mark.parametrize("chunksize", [1, 2, 7, 1000, 100000])
+def test_chunked_processing_writes_the_same_file(
+        candles, raw_data_filepath, tmp_path, horizon, chunksize):
+    expected_filepath = str(tmp_path / "processed.csv")
+    chunked_filepath = str(tmp_path / "processed_chunked.csv")
+    process_raw_data(raw_data_filepath, expected_filepath, horizon=horizon)
+
+    summary = process_raw_data_chunked(
+        raw_data_filepath, chunked_filepath, chunksize=chunksize, horizon=horizon)
+
+    with open(expected_filepath, "rb") as expected_file, open(chunked_filepath, "rb") as chunked_file:
+        assert chunked_file.read() == expected_file.read()
+    assert summary["rows"] == 100 - horizon
+    timestamps = pd.to_datetime(candles["timestamp"], unit="s")
+    assert summary["first_timestamp"] == timestamps.iloc[0]
+    assert summary["last_timestamp"] == timestamps.iloc[99 - horizon]
+
+
+@pytest.mark.parametrize("newest_first", [True, False])
+def test_targets_are_the_later_closes(newest_first):
+    # 10:00 closed at 100, 11:00 at 101, 12:00 at 102, 13:00 at 103.
+    dataset = pd.DataFrame({"CurrentClose": [100.0, 101.0, 102.0, 103.0]})
+    if newest_first:
+        dataset = dataset.iloc[::-1].reset_index(drop=True)
+
+    dataset = add_targets(dataset, horizon=2, newest_first=newest_first)
+    if newest_first:
+        dataset = dataset.iloc[::-1]
+    # Rows without a close for every hour of the horizon have no targets.
+    np.testing.assert_array_equal(dataset["NextClose"], [101.0, 102.0, np.nan, np.nan])
+    np.testing.assert_array_equal(dataset["NextClose_2"], [102.0, 103.0, np.nan, np.nan])
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from hourly_price_prediction.models.monte_carlo import (
+    block_bootstrap_indices, monte_carlo_simulation, simulate_paths,
+    trading_signals)
+from hourly_price_prediction.models.utils import strategy_simulation
+
+
+@pytest.fixture
+def model_and_test_dataset(candles) -> tuple:
+    dataset = candles.rename(columns={"close": "currentclose", "volume": "volume_eth"})
+    dataset = dataset[["open", "high", "low", "currentclose", "volume_eth"]]
+    model = LinearRegression().fit(dataset.values[:-1], dataset["currentclose"].values[1:])
+    return (model, dataset.iloc[700:])
+
+
+def test_unresampled_paths_equal_strategy_simulation(model_and_test_dataset):
+    model, test_dataset = model_and_test_dataset
+    trading_history, _ = strategy_simulation(model, test_dataset, {"mae": 1.0})
+
+    closes = test_dataset["currentclose"].values[None, :]
+    signals = trading_signals(model, test_dataset)[None, :]
+    paths = simulate_paths(closes, signals)
+
+    traded = (trading_history["action"] == "buy") | (
+        (trading_history["action"] == "sell")
+        & (trading_history["amount_of_asset_to_exchange"] > 0))
+    assert paths["final_assets"][0] == trading_history["total_assets"].iloc[-1]
+    assert paths["n_trades"][0] == traded.sum()
+
+
+def test_paths_do_not_depend_on_the_number_of_workers(model_and_test_dataset):
+    model, test_dataset = model_and_test_dataset
+    paths, summary = monte_carlo_simulation(model, test_dataset, n_paths=2500, max_workers=1)
+    parallel_paths, parallel_summary = monte_carlo_simulation(
+        model, test_dataset, n_paths=2500, max_workers=3)
+
+    pd.testing.assert_frame_equal(paths, parallel_paths)
+    assert summary == parallel_summary
+
+
+@pytest.mark.parametrize("n_steps", [0, 1])
+def test_fewer_than_two_hours_are_not_resampled(n_steps):
+    np.testing.assert_array_equal(
+        block_bootstrap_indices(n_steps, 4), np.zeros((4, n_steps), dtype=int))
+
+
+def test_a_one_hour_test_period_is_its_only_path(model_and_test_dataset):
+    model, test_dataset = model_and_test_dataset
+    trading_history, _ = strategy_simulation(model, test_dataset.iloc[:1], {"mae": 1.0})
+
+    paths, _ = monte_carlo_simulation(model, test_dataset.iloc[:1], n_paths=4, max_workers=1)
+    assert (paths["final_assets"] == trading_history["total_assets"].iloc[-1]).all()
@@ -0,0 +1,23 @@
+import hashlib
+import pickle
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.models.registry import ModelRegistry
+
+
+def test_an_uploaded_artifact_can_be_registered_and_promoted(tmp_path):
+    data_helper = LocalS3Helper(str(tmp_path))
+    model_bytes = pickle.dumps({"coef": [1.0, 2.0]})
+    data_helper.put_object_bytes("elasticnet-20210819T200545/model.pickle", model_bytes)
+    data_helper.put_json("elasticnet-20210819T200545/validation_metrics.json", {"mae": 12.5})
+
+    registry = ModelRegistry(data_helper)
+    assert registry.production() is None
+    record = registry.register_uploaded("elasticnet-20210819T200545", model_class="elasticnet")
+    manifest = registry.promote(record["version"])
+
+    assert registry.production() == manifest
+    assert manifest["artifact_key"] == "elasticnet-20210819T200545/model.pickle"
+    assert manifest["artifact_sha256"] == hashlib.sha256(model_bytes).hexdigest()
+    assert manifest["validation_metrics"] == {"mae": 12.5}
+    assert manifest["features"] == []
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from hourly_price_prediction.simulation.replay import (replay_lambda_handler,
+                                                       summarize_replay)
+
+
+def test_the_lambda_replay_trades_every_candle_in_the_window(candles, model_files):
+    candles = candles.rename(columns={"timestamp": "time"}).iloc[:24]
+    times = candles["time"].values
+
+    history = replay_lambda_handler(
+        candles,
+        *model_files,
+        start=pd.Timestamp(times[5], unit="s").isoformat(),
+        end=pd.Timestamp(times[16], unit="s").isoformat(),
+    )
+
+    assert history["timestamp"].tolist() == times[5:17].tolist()
+    assert history["close"].tolist() == candles["close"].iloc[5:17].tolist()
+    assert (history["handler_latency_ms"] > 0).all()
+    assert history["stage_total_ms"].notna().all()
+
+    summary = summarize_replay(history, wall_time=1.0)
+    assert summary["ticks"] == 12
+    assert summary["total_buys"] + summary["total_sells"] + summary["total_do_nothing"] == 12
+    assert summary["initial_total_assets"] == history["total_assets"].iloc[0]
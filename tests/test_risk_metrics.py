@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.monitoring.risk_metrics import (
+    StreamingRiskMetrics, risk_metrics, risk_metrics_matrix)
+
+
+def make_trading_history(number_of_hours: int, seed: int = 5, zero_share: float = 0.0) -> pd.DataFrame:
+    """Live trader records, with `zero_share` of them on an empty account."""
+
+    rng = np.random.default_rng(seed)
+    close = 2000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, number_of_hours)))
+    usd_wallet = rng.uniform(0.0, 1000.0, number_of_hours)
+    asset_wallet = rng.uniform(0.0, 0.5, number_of_hours)
+    empty = rng.random(number_of_hours) < zero_share
+    usd_wallet[empty] = 0.0
+    asset_wallet[empty] = 0.0
+    return pd.DataFrame(
+        {
+            "timestamp": 1609459200 + 3600 * np.arange(number_of_hours),
+            "close": close,
+            "usd_wallet": usd_wallet,
+            "asset_wallet": asset_wallet,
+            "action": rng.choice(["buy", "sell", "do_nothing"], number_of_hours),
+        }
+    )
+
+
+@pytest.mark.parametrize("zero_share", [0.0, 0.1])
+@pytest.mark.parametrize("number_of_hours", [1, 2, 500])
+def test_streaming_metrics_equal_the_batch_recomputation(number_of_hours, zero_share):
+    history = make_trading_history(number_of_hours, zero_share=zero_share)
+    streaming = StreamingRiskMetrics()
+    for record in history.to_dict("records"):
+        streaming.update(record)
+        # The trader keeps the state as JSON between invocations.
+        state = json.loads(json.dumps(streaming.state))
+        streaming = StreamingRiskMetrics()
+        streaming.state = state
+
+    assert streaming.metrics == risk_metrics(history)
+
+
+def test_empty_history():
+    metrics = risk_metrics(make_trading_history(0))
+    assert metrics == StreamingRiskMetrics().metrics
+    assert metrics["n_records"] == 0
+
+
+def test_a_repeated_timestamp_is_ignored():
+    records = make_trading_history(10).to_dict("records")
+    streaming = StreamingRiskMetrics()
+    streaming.update_many(records + records[-1:])
+    assert streaming.metrics == risk_metrics(pd.DataFrame(records))
+
+
+def test_an_empty_account_does_not_fail():
+    records = make_trading_history(3).to_dict("records")
+    for record in records[:2]:
+        record["usd_wallet"] = record["asset_wallet"] = 0.0
+    metrics = StreamingRiskMetrics().update_many(records)
+    assert metrics["total_return"] is None
+    assert metrics["max_drawdown"] == 0.0
+
+
+def test_each_trader_keeps_its_own_state(tmp_path):
+    data_helper = LocalS3Helper(str(tmp_path))
+    records = make_trading_history(20).to_dict("records")
+    lambda_metrics = StreamingRiskMetrics(asset="ETH-USD", trader="asset-trader")
+    daemon_metrics = StreamingRiskMetrics(asset="ETH-USD", trader="trading-daemon")
+
+    # Interleaved saves, as the Lambda and the daemon run side by side.
+    for record in records[:10]:
+        lambda_metrics.update(record)
+        lambda_metrics.save(data_helper)
+        daemon_metrics.update(record)
+        daemon_metrics.save(data_helper)
+    for record in records[10:]:
+        daemon_metrics.update(record)
+        daemon_metrics.save(data_helper)
+
+    for trader, history in [("asset-trader", records[:10]), ("trading-daemon", records)]:
+        stored = StreamingRiskMetrics(asset="ETH-USD", trader=trader)
+        stored.load(data_helper)
+        assert stored.metrics == risk_metrics(pd.DataFrame(history))
+
+
+def test_matrix_of_no_histories_has_the_metric_columns():
+    metrics = risk_metrics_matrix(np.zeros((0, 0)), np.zeros((0, 0), dtype=bool))
+    assert len(metrics) == 0
+    assert {"sharpe_ratio", "max_drawdown", "win_rate"} <= set(metrics.columns)
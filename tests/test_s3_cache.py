@@ -0,0 +1,112 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from hourly_price_prediction.data import s3_helper
+from hourly_price_prediction.data.s3_cache import S3Cache
+from hourly_price_prediction.data.s3_helper import S3Helper
+
+
+class FakeS3Client(object):
+    """The slice of the boto3 S3 client that `S3Helper` reads through."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    def put(self, key: str, body: bytes) -> None:
+        self.objects[key] = (f'"{hashlib.md5(body).hexdigest()}"', body)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.requests.append((Key, IfNoneMatch))
+        etag, body = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError(
+                {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def upload_file(self, local_filepath, bucket, key, Config=None):
+        with open(local_filepath, "rb") as local_file:
+            self.put(key, local_file.read())
+            local_file.close()
+
+
+@pytest.fixture
+def s3_client(monkeypatch) -> FakeS3Client:
+    client = FakeS3Client()
+    monkeypatch.setitem(s3_helper._clients, "test-region", client)
+    return client
+
+
+def test_an_unchanged_object_is_served_from_the_cache_on_304(s3_client, tmp_path):
+    cache = S3Cache(str(tmp_path))
+    data_helper = S3Helper("bucket", "test-region", cache=cache)
+    s3_client.put("state.json", b'{"hour": 1}')
+
+    assert data_helper.get_object_bytes("state.json") == b'{"hour": 1}'
+    assert data_helper.get_object_bytes("state.json") == b'{"hour": 1}'
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert s3_client.requests[1] == ("state.json", s3_client.objects["state.json"][0])
+
+    s3_client.put("state.json", b'{"hour": 2}')
+    assert data_helper.get_object_bytes("state.json") == b'{"hour": 2}'
+    assert (cache.misses, cache.hits) == (2, 1)
+
+
+def test_an_immutable_read_does_not_contact_s3_once_cached(s3_client, tmp_path):
+    cache = S3Cache(str(tmp_path))
+    data_helper = S3Helper("bucket", "test-region", cache=cache)
+    s3_client.put("history/1.json", b"{}")
+
+    for _ in range(3):
+        assert data_helper.get_object_bytes("history/1.json", immutable=True) == b"{}"
+    assert len(s3_client.requests) == 1
+
+
+def test_an_upload_invalidates_the_cached_copy(s3_client, tmp_path):
+    cache = S3Cache(str(tmp_path))
+    data_helper = S3Helper("bucket", "test-region", cache=cache)
+    s3_client.put("model/model.pickle", b"old")
+    data_helper.get_object_bytes("model/model.pickle", immutable=True)
+
+    local_filepath = tmp_path / "model.pickle"
+    local_filepath.write_bytes(b"new")
+    data_helper.upload_to_s3("model/model.pickle", str(local_filepath))
+
+    assert cache.get("bucket", "model/model.pickle") == (None, None)
+    assert cache.size() == 0
+    assert data_helper.get_object_bytes("model/model.pickle", immutable=True) == b"new"
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path):
+    cache = S3Cache(str(tmp_path), max_bytes=4000)
+    now = time.time()
+    for age, key in zip([30, 20, 10], "abc"):
+        cache.put("bucket", key, "etag", b"x" * 1000)
+        os.utime(cache._entry_path("bucket", key), (now - age, now - age))
+    cache.touch("bucket", "a")
+
+    # Four entries overflow the budget; evicting "b" alone gets back under
+    # the low-water mark.
+    cache.put("bucket", "d", "etag", b"x" * 1000)
+    cached = [key for key in "abcd" if cache.get("bucket", key)[1] is not None]
+    assert cached == ["a", "c", "d"]
+    assert cache._read_total() == cache.size() <= cache.max_bytes
+
+
+def test_the_tracked_size_is_rebuilt_and_kept_current(tmp_path):
+    cache = S3Cache(str(tmp_path))
+    for key in "abc":
+        cache.put("bucket", key, "etag", b"x" * 100)
+    os.remove(os.path.join(str(tmp_path), ".size"))
+
+    cache.put("bucket", "a", "etag", b"x" * 10)
+    cache.invalidate("bucket", "b")
+    cache.invalidate("bucket", "missing")
+    assert cache._read_total() == cache.size()
+    assert cache.get("bucket", "a") == ("etag", b"x" * 10)
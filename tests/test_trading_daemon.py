@@ -0,0 +1,165 @@
+import logging
+
+import numpy as np
+import pytest
+
+from hourly_price_prediction.data.s3_helper import LocalS3Helper
+from hourly_price_prediction.models.asset_trader import AssetTrader
+from hourly_price_prediction.models.trading_daemon import (TradingDaemon,
+                                                           load_deployed_model)
+from hourly_price_prediction.simulation.clock import SimulatedClock
+from hourly_price_prediction.simulation.exchange import SimulatedExchange
+from hourly_price_prediction.simulation.replay import (replay_lambda_handler,
+                                                       replay_trading_daemon,
+                                                       upload_model_files)
+
+GRANULARITY = 3600
+
+
+class Crash(BaseException):
+    """Ends `run` the way a killed process would, past its error handling."""
+
+
+@pytest.fixture
+def exchange(candles) -> SimulatedExchange:
+    # Start a few minutes into the candle after the 100th close.
+    clock = SimulatedClock(start=int(candles["timestamp"].iloc[100]) + 200)
+    return SimulatedExchange(candles.rename(columns={"timestamp": "time"}), clock=clock)
+
+
+@pytest.fixture
+def data_helper(exchange, model_files, tmp_path) -> LocalS3Helper:
+    data_helper = LocalS3Helper(str(tmp_path / "s3"), clock=exchange.clock)
+    upload_model_files(data_helper, "model", *model_files)
+    return data_helper
+
+
+def make_daemon(exchange, data_helper, **kwargs) -> TradingDaemon:
+    """A daemon as a freshly started process would build it."""
+
+    deployed = load_deployed_model(data_helper, "model")
+    asset_trader = AssetTrader(
+        asset=exchange.product_id,
+        api_secret="",
+        api_key="",
+        passphrase="",
+        pickle_file=None,
+        public_client=exchange,
+        private_client=exchange,
+        model=deployed["model"],
+    )
+    daemon = TradingDaemon(
+        asset_trader, data_helper, deployed, clock=exchange.clock,
+        granularity=GRANULARITY, **kwargs)
+
+    # Closes the daemon traded, i.e. ticked through to a record.
+    daemon.traded_closes = []
+    tick = daemon.tick
+
+    def recorded_tick(close: int) -> dict:
+        record = tick(close)
+        if record is not None:
+            daemon.traded_closes.append(close)
+        return record
+
+    daemon.tick = recorded_tick
+    return daemon
+
+
+def test_every_close_is_traded_once_at_its_close(exchange, data_helper):
+    first_close = exchange.clock.time() // GRANULARITY * GRANULARITY + GRANULARITY
+    daemon = make_daemon(exchange, data_helper)
+
+    assert daemon.run(max_ticks=5) == 5
+    assert daemon.traded_closes == [first_close + GRANULARITY * n for n in range(5)]
+    history = [data_helper.get_json(key) for key in data_helper.list_keys("trading_history/")]
+    assert [record["timestamp"] for record in history] == [
+        close - GRANULARITY for close in daemon.traded_closes]
+
+
+def test_a_restart_after_the_checkpoint_does_not_trade_the_close_again(
+        exchange, data_helper):
+    daemon = make_daemon(exchange, data_helper)
+    daemon.run(max_ticks=2)
+
+    # Killed after the checkpoint, while its order is in flight.
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    exchange_place_market_order = exchange.place_market_order
+    exchange.place_market_order = crash
+    daemon.asset_trader.trading_strategy = lambda **kwargs: ("buy", 10.0)
+    with pytest.raises(Crash):
+        daemon.run(max_ticks=1)
+    crashed_close = daemon.checkpoint["last_close"]
+    assert crashed_close == daemon.traded_closes[-1] + GRANULARITY
+
+    exchange.place_market_order = exchange_place_market_order
+    restarted = make_daemon(exchange, data_helper)
+    assert restarted.run(max_ticks=3) == 3
+    assert restarted.traded_closes == [
+        crashed_close + GRANULARITY * n for n in range(1, 4)]
+
+
+@pytest.mark.parametrize("seconds_late, catches_up", [(120, True), (600, False)])
+def test_a_missed_close_is_caught_up_only_within_catch_up_seconds(
+        exchange, data_helper, seconds_late, catches_up):
+    daemon = make_daemon(exchange, data_helper, catch_up_seconds=300)
+    daemon.run(max_ticks=1)
+    missed_close = daemon.traded_closes[-1] + GRANULARITY
+
+    exchange.clock.set(missed_close + seconds_late)
+    restarted = make_daemon(exchange, data_helper, catch_up_seconds=300)
+    restarted.run(max_ticks=1)
+    expected_close = missed_close if catches_up else missed_close + GRANULARITY
+    assert restarted.traded_closes == [expected_close]
+
+
+def test_stop_ends_run_after_the_current_tick(exchange, data_helper):
+    daemon = make_daemon(exchange, data_helper)
+    tick = daemon.tick
+
+    def stopping_tick(close: int) -> dict:
+        record = tick(close)
+        if len(daemon.traded_closes) == 2:
+            daemon.stop()
+        return record
+
+    daemon.tick = stopping_tick
+    assert daemon.run() == 2
+    assert len(daemon.traded_closes) == 2
+
+
+def test_errors_are_retried_with_a_growing_backoff(exchange, data_helper, caplog):
+    daemon = make_daemon(exchange, data_helper, error_backoff=5.0, max_error_backoff=15.0)
+    daemon.run(max_ticks=1)
+    get_asset_history = daemon.asset_trader.get_asset_history
+    failures = []
+
+    def flaky_get_asset_history(*args, **kwargs):
+        if len(failures) < 4:
+            failures.append(exchange.clock.time())
+            raise ConnectionError("Connection reset by peer")
+        return get_asset_history(*args, **kwargs)
+
+    daemon.asset_trader.get_asset_history = flaky_get_asset_history
+    failed_close = daemon.traded_closes[-1] + GRANULARITY
+
+    with caplog.at_level(logging.ERROR):
+        assert daemon.run(max_ticks=2) == 2
+    backoffs = [record.getMessage() for record in caplog.records]
+    assert backoffs == [f"Trading daemon error, retrying in {seconds}s"
+                        for seconds in [5.0, 10.0, 15.0, 15.0]]
+    np.testing.assert_array_equal(np.diff(failures), [5.0, 10.0, 15.0])
+    # The failed close is still traded, late, and only once.
+    assert daemon.traded_closes[1:] == [failed_close, failed_close + GRANULARITY]
+
+
+def test_daemon_replay_matches_the_lambda_replay(candles, model_files):
+    replay_candles = candles.rename(columns={"timestamp": "time"}).iloc[:200]
+    lambda_history = replay_lambda_handler(replay_candles, *model_files)
+    daemon_history = replay_trading_daemon(replay_candles, *model_files)
+
+    columns = ["timestamp", "close", "model_prediction", "action", "usd_wallet", "asset_wallet"]
+    assert len(daemon_history) == len(lambda_history) == len(replay_candles)
+    assert daemon_history[columns].equals(lambda_history[columns])
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from hourly_price_prediction.models.tree_compiler import (compile_model,
+                                                          count_mismatches)
+from hourly_price_prediction.models.utils import build_model
+
+
+def make_regression(number_of_rows: int = 1500, horizon: int = 1, seed: int = 3) -> tuple:
+    """Candle-like features and the next `horizon` closes as targets."""
+
+    rng = np.random.default_rng(seed)
+    features = 2000.0 + rng.normal(0.0, 20.0, size=(number_of_rows, 5))
+    targets = features[:, [3]] + rng.normal(0.0, 5.0, size=(number_of_rows, horizon))
+    return features, targets[:, 0] if horizon == 1 else targets
+
+
+@pytest.mark.parametrize("horizon", [1, 3])
+@pytest.mark.parametrize(
+    "model_class, model_params",
+    [
+        ("decisiontreeregressor", {"random_state": 0}),
+        ("randomforestregressor", {"n_estimators": 20, "random_state": 0}),
+        ("gradientboostingregressor", {"n_estimators": 50, "random_state": 0}),
+    ],
+)
+def test_compiled_predictions_are_identical_to_sklearn(model_class, model_params, horizon):
+    features, targets = make_regression(horizon=horizon)
+    model = build_model(model_class, model_params, horizon).fit(features[:1000], targets[:1000])
+    compiled = compile_model(model)
+
+    assert compiled is not None
+    assert count_mismatches(model, compiled, features[1000:]) == 0
+
+
+def test_threaded_forest_agrees_within_a_few_ulps():
+    # sklearn sums the trees of an n_jobs > 1 forest in the order its
+    # threads finish, so only the last bits can differ.
+    features, targets = make_regression()
+    model = RandomForestRegressor(n_estimators=50, n_jobs=2, random_state=0)
+    model.fit(features[:1000], targets[:1000])
+    compiled = compile_model(model)
+
+    assert count_mismatches(model, compiled, features[1000:], max_ulps=16) == 0
+    model.n_jobs = 1
+    assert count_mismatches(model, compiled, features[1000:]) == 0
+
+
+def test_unsupported_models_are_not_compiled():
+    assert compile_model(build_model("linearregressor")) is None